@@ -25,9 +25,19 @@ import miner
 import os
 
 import miner.dodo
+import miner.fleet
+import miner.matrix
+import miner.report
 
-from doit.cmd_base import ModuleTaskLoader
-from doit.doit_cmd import DoitMain
+from miner.lazy import lazy_import
+
+# doit and paramiko are imported only by commands which need them to keep start-up fast
+doit_cmd_base = lazy_import('doit.cmd_base')
+doit_cmd = lazy_import('doit.doit_cmd')
+remote_ssh = lazy_import('miner.ssh')
+
+# supported platforms in format <target>-<subtarget>
+PLATFORMS = ['zynq-dm1-g9', 'zynq-dm1-g19', 'zynq-am1-s9']
 
 
 class CommandManager:
@@ -37,10 +47,27 @@ class CommandManager:
         self._config = None
         self._build_dir = None
 
+    def _get_platforms(self):
+        """
+        Return list of platforms from comma separated command line argument
+
+        :return:
+            List of validated platform names or None when the argument is omitted.
+        """
+        if not self._args.platforms:
+            return None
+        platforms = self._args.platforms.split(',')
+        unknown = [platform for platform in platforms if platform not in PLATFORMS]
+        if unknown:
+            logging.error("Unknown platforms: {} (choose from {})".format(', '.join(unknown), ', '.join(PLATFORMS)))
+            raise miner.BuilderStop
+        return platforms
+
     def set_args(self, argv, args):
         self._argv = argv
         self._args = args
-        self._config = miner.load_config(args.config)
+        # release saves configuration back so it is always parsed from its current content without the cache
+        self._config = miner.load_config(args.config, round_trip=args.func == self.release)
 
         # set optional keys to default value
         self._config.setdefault('miner.pool.host', 'stratum+tcp://stratum.slushpool.com')
@@ -50,6 +77,9 @@ class CommandManager:
         self._config.setdefault('build.verbose', 'no')
         self._config.setdefault('remote.fetch', 'no')
         self._config.setdefault('remote.fetch_always', 'no')
+        self._config.setdefault('remote.jobs', 4)
+        self._config.setdefault('deploy.jobs', 8)
+        self._config.setdefault('deploy.feeds_keep', 0)
         self._config.setdefault('uenv.mac', 'yes')
         self._config.setdefault('uenv.factory_reset', 'no')
         self._config.setdefault('uenv.sd_images', 'no')
@@ -66,13 +96,33 @@ class CommandManager:
         if not os.path.exists(builder.build_dir):
             os.makedirs(builder.build_dir)
 
-        opt_vals = {'dep_file': os.path.join(builder.build_dir, '.doit.db')}
-        commander = DoitMain(ModuleTaskLoader(miner.dodo),
-                             extra_config={'GLOBAL': opt_vals})
-        commander.BIN_NAME = 'doit'
+        # skip planning of all doit tasks when nothing has been changed since last successful prepare
+        if task == 'prepare' and builder.prepare_unchanged():
+            logging.info('LEDE build system is already prepared')
+            return
 
         logging.info('Preparing LEDE build system...')
-        commander.run(['--verbosity', '2', task])
+        miner.dodo.repos_ready = False
+        jobs = int(self._config.remote.jobs)
+        if jobs > 1:
+            # only clone and fetch of remote repositories are run concurrently
+            # the other tasks modify the same LEDE tree and they expect serial execution
+            if self._doit_run(builder, ['--process', str(jobs), '--parallel-type', 'thread', 'checkout']) != 0:
+                return
+            if task == 'checkout':
+                return
+            miner.dodo.repos_ready = True
+
+        if self._doit_run(builder, [task]) == 0 and task == 'prepare':
+            builder.save_prepare_state()
+
+    @staticmethod
+    def _doit_run(builder, doit_args):
+        opt_vals = {'dep_file': os.path.join(builder.build_dir, '.doit.db')}
+        commander = doit_cmd.DoitMain(doit_cmd_base.ModuleTaskLoader(miner.dodo),
+                                      extra_config={'GLOBAL': opt_vals})
+        commander.BIN_NAME = 'doit'
+        return commander.run(['--verbosity', '2'] + doit_args)
 
     def get_builder(self, task=None):
         """
@@ -114,9 +164,39 @@ class CommandManager:
             self._config.build.jobs = self._args.jobs
         if self._args.verbose:
             self._config.build.verbose = 'yes'
+        if self._args.no_cache:
+            cache = self._config.setdefault('build.cache', miner.ConfigDict())
+            cache.dir = None
+
+        platforms = self._get_platforms()
+        if platforms:
+            self._build_matrix(platforms)
+            return
 
         builder = self.get_builder('prepare')
-        builder.build(targets=self._args.target)
+        if self._args.download_only:
+            builder.download()
+        else:
+            builder.build(targets=self._args.target, changed=self._args.changed)
+
+    def _build_matrix(self, platforms):
+        # split available jobs between all concurrently built platforms
+        jobs = miner.matrix.get_platform_jobs(self._config.build.jobs, platforms)
+        config_paths = miner.matrix.write_platform_configs(self._config, platforms, jobs)
+
+        # sources are downloaded sequentially to shared download directory before parallel build
+        if not miner.matrix.prepare(config_paths):
+            raise miner.BuilderStop
+        if self._args.download_only:
+            return
+
+        logging.info("Start building {} platforms with {} jobs each...".format(len(platforms), jobs))
+        build_args = (['--changed'] if self._args.changed else []) + self._args.target
+        results = miner.matrix.build(config_paths, build_args)
+        miner.matrix.print_summary(results)
+
+        if any(result.returncode for result in results):
+            raise miner.BuilderStop
 
     def deploy(self):
         logging.debug("Called command 'deploy'")
@@ -139,9 +219,18 @@ class CommandManager:
         uenv = self._config.uenv
         for option in set(self._args.uenv or []):
             setattr(uenv, option, 'yes')
+        # do not write unchanged NAND partitions
+        if self._args.skip_unchanged:
+            self._config.deploy.skip_unchanged = 'yes'
         # set feeds base index file
         if self._args.feeds_base:
             self._config.deploy.feeds_base = self._args.feeds_base
+        # set number of the last firmware versions kept in feeds index
+        if self._args.feeds_keep is not None:
+            if self._args.feeds_keep < 0:
+                logging.error("Number of kept firmware versions cannot be negative")
+                raise miner.BuilderStop
+            self._config.deploy.feeds_keep = self._args.feeds_keep
 
         # override default targets from command line
         if self._args.target:
@@ -160,13 +249,71 @@ class CommandManager:
                         setattr(local, target + '_config', path)
                     setattr(local, target, path)
 
+        if self._args.jobs:
+            self._config.deploy.jobs = self._args.jobs
+
+        report = miner.report.Report()
+        try:
+            if self._args.hosts_file:
+                self._deploy_fleet(report)
+            else:
+                builder = self.get_builder()
+                builder.deploy(report=report)
+        finally:
+            # close all SSH connections kept open for reuse
+            if 'miner.ssh' in sys.modules:
+                remote_ssh.SSHManager.close_all()
+            if self._args.report:
+                self._write_report(report)
+
+    def _write_report(self, report):
+        logging.info("Saving deploy report to '{}'...".format(self._args.report))
+        with open(self._args.report, 'w') as report_file:
+            report.dump(report_file)
+        report.print_summary()
+
+    def _get_host_builder(self, host):
+        """
+        Return miner builder with configuration overridden for one miner from hosts file
+        """
         builder = self.get_builder()
-        builder.deploy()
+        config = builder.configuration
+        # hostname is derived from MAC address when it is omitted
+        config.deploy.ssh.hostname = host.hostname
+        if host.mac:
+            config.miner.mac = host.mac
+        if host.hwid:
+            config.miner.hwid = host.hwid
+        return builder
+
+    def _deploy_fleet(self, report):
+        local_targets = [target for target in self._config.deploy.targets if target.startswith('local_')]
+        if local_targets:
+            logging.error("Local targets '{}' cannot be deployed to more miners".format(', '.join(local_targets)))
+            raise miner.BuilderStop
+
+        try:
+            hosts = miner.fleet.load_hosts(self._args.hosts_file)
+        except (OSError, miner.fleet.FleetError) as e:
+            logging.error(str(e))
+            raise miner.BuilderStop
+
+        logging.info("Start deploying to {} miners...".format(len(hosts)))
+        results = miner.fleet.deploy(self._get_host_builder, hosts, self._config.deploy.jobs, report)
+        miner.fleet.print_summary(results)
+
+        if any(result.error for result in results):
+            raise miner.BuilderStop
 
     def status(self):
         logging.debug("Called command 'status'")
         builder = self.get_builder()
-        builder.status()
+        builder.status(json_output=self._args.json)
+
+    def packages(self):
+        logging.debug("Called command 'packages'")
+        builder = self.get_builder()
+        builder.find_packages(self._args.package)
 
     def debug(self):
         logging.debug("Called command 'debug'")
@@ -184,12 +331,13 @@ class CommandManager:
         for include in set(self._args.include or []):
             setattr(sysupgrade, include, 'yes')
 
+        platforms = self._get_platforms()
         if not self._args.no_fetch:
             # always fetch all repositories before creating release
             self._config.remote.fetch_always = 'yes'
 
         builder = self.get_builder('checkout')
-        builder.release()
+        builder.release(platforms=platforms)
 
     def key(self):
         logging.debug("Called command 'key'")
@@ -243,6 +391,16 @@ def main(argv):
     subparser.add_argument('-k', '--key',
                            help='specify path to build key in a format <secret>[:<public>]; '
                                 'when the <public> key is omitted then <secret>.pub is used')
+    subparser.add_argument('--platforms',
+                           help='build comma separated list of platforms concurrently with shared downloads; '
+                                'the jobs are split between platforms')
+    subparser.add_argument('--changed', action='store_true',
+                           help='build only targets of repositories changed since last successful build '
+                                'and assemble firmware images')
+    subparser.add_argument('--no-cache', action='store_true',
+                           help='always run build and do not use cache of firmware images')
+    subparser.add_argument('--download-only', action='store_true',
+                           help='only download sources of all packages to shared download directory')
     subparser.add_argument('target', nargs='*',
                            help='build only specific targets when specified')
 
@@ -263,6 +421,18 @@ def main(argv):
     subparser.add_argument('--feeds-base', nargs='?',
                            help='path to the Packages file for concatenation with new feeds index '
                                 '(for local_feeds target only)')
+    subparser.add_argument('--feeds-keep', type=int,
+                           help='number of the last firmware versions kept in merged feeds index '
+                                '(0 keeps all of them)')
+    subparser.add_argument('--skip-unchanged', action='store_true',
+                           help='do not write NAND partitions which already contain the same images')
+    subparser.add_argument('--hosts-file', nargs='?',
+                           help='path to the file with list of miners in a format <hostname> [<mac> [<hwid>]] '
+                                'per line for deployment to more miners at once (for remote targets only)')
+    subparser.add_argument('-j', '--jobs', type=int,
+                           help='specifies the number of miners deployed simultaneously')
+    subparser.add_argument('--report', nargs='?',
+                           help='path to the JSON output with duration and transferred data of all deploy steps')
     subparser.add_argument('target', nargs='*',
                            help='list of targets for deployment (local target can specify also output directory '
                                 'in a format <target>[:<path>])')
@@ -270,8 +440,17 @@ def main(argv):
     # create the parser for the "status" command
     subparser = subparsers.add_parser('status',
                                       help="show status of LEDE repository and all dependent projects")
+    subparser.add_argument('--json', action='store_true',
+                           help='print status of all repositories as a JSON list')
     subparser.set_defaults(func=command.status)
 
+    # create the parser for the "packages" command
+    subparser = subparsers.add_parser('packages',
+                                      help="show images which include packages")
+    subparser.set_defaults(func=command.packages)
+    subparser.add_argument('package', nargs='+',
+                           help='name of package searched in package lists of all images')
+
     # create the parser for the "debug" command
     subparser = subparsers.add_parser('debug',
                                       help="debug application on remote target")
@@ -290,6 +469,8 @@ def main(argv):
                            help='components included in sysupgrade (firmware)')
     subparser.add_argument('--no-fetch', action='store_true',
                            help='do not force fetching all repositories before creating release configuration')
+    subparser.add_argument('--platforms',
+                           help='comma separated list of platforms released at once from the same commits')
 
     # create the parser for the "key" command
     subparser = subparsers.add_parser('key',
@@ -305,7 +486,7 @@ def main(argv):
                         help='logging level')
     parser.add_argument('--config', default=miner.DEFAULT_CONFIG,
                         help='path to configuration file')
-    parser.add_argument('--platform', choices=['zynq-dm1-g9', 'zynq-dm1-g19', 'zynq-am1-s9'], nargs='?',
+    parser.add_argument('--platform', choices=PLATFORMS, nargs='?',
                         help='change default miner platform')
 
     # parse command line arguments
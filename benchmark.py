@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2018  Braiins Systems s.r.o.
+#
+# This file is part of Braiins Build System (BB).
+#
+# BB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+
+import miner
+
+from miner.lazy import lazy_import
+
+# simulator needs paramiko which is not necessary for other benchmarks
+simulator = lazy_import('miner.simulator')
+git = lazy_import('git')
+tags = lazy_import('miner.tags')
+packages = lazy_import('miner.packages')
+
+BB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bb.py')
+
+DEPLOY_TARGETS = ['sd', 'sd_config', 'nand_recovery', 'nand_firmware1', 'nand_config']
+
+# commands which do not need any remote repository or network connection
+STARTUP_COMMANDS = ['--help', 'toolchain']
+
+# platforms used for synthetic release tags
+TAG_PLATFORMS = ['zynq-dm1-g9', 'zynq-dm1-g19', 'zynq-am1-s9']
+
+# configuration attributes read by builder during deployment
+CONFIG_ATTRIBUTES = ['deploy.ssh.username', 'miner.mac', 'miner.pool.host', 'uenv.mac', 'local.sd',
+                     'feeds.links.packages']
+
+# name of package looked up in synthetic feeds index
+FEED_FIRMWARE = 'firmware'
+
+
+def write_random_file(path: str, size: int):
+    """
+    Create file with pseudo-random content which cannot be compressed
+
+    :param path:
+        Path to new file.
+    :param size:
+        Size of file in bytes.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as image_file:
+        image_file.write(os.urandom(size))
+
+
+def create_images(config, scale: float):
+    """
+    Create synthetic firmware images in build directory
+
+    The images have the same paths as images produced by the build and sizes similar to real ones.
+
+    :param config:
+        Configuration object with build directory.
+    :param scale:
+        Multiplier of image sizes.
+    """
+    platform = config.miner.platform
+    target, subtarget = platform.split('-', 1)
+    build_dir = os.path.join(os.path.abspath(config.build.dir), config.build.name.format(target=target))
+    generic_dir = os.path.join(build_dir, 'lede', 'bin', 'targets', 'zynq')
+
+    def size(value):
+        return max(1, int(value * scale))
+
+    for uboot_dir in ('uboot-{}'.format(platform), 'uboot-{}-sd'.format(platform)):
+        write_random_file(os.path.join(generic_dir, uboot_dir, 'boot.bin'), size(0x40000))
+        write_random_file(os.path.join(generic_dir, uboot_dir, 'u-boot.img'), size(0x80000))
+    write_random_file(os.path.join(build_dir, 'platform', subtarget, 'system.bit'), size(0x1f0000))
+    for image in ('sd', 'recovery'):
+        write_random_file(os.path.join(generic_dir, 'lede-{}-{}-squashfs-fit.itb'.format(platform, image)),
+                          size(0x600000))
+    write_random_file(os.path.join(generic_dir, 'lede-{}-nand-squashfs-factory.bin'.format(platform)),
+                      size(0xc00000))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        kernel = os.path.join(tmp_dir, 'kernel')
+        root = os.path.join(tmp_dir, 'root')
+        write_random_file(kernel, size(0x400000))
+        write_random_file(root, size(0x800000))
+        sysupgrade = os.path.join(generic_dir, 'lede-{}-nand-squashfs-sysupgrade.tar'.format(platform))
+        with tarfile.open(sysupgrade, 'w') as tar:
+            tar.add(kernel, 'sysupgrade-miner-nand/kernel')
+            tar.add(root, 'sysupgrade-miner-nand/root')
+
+
+def get_transferred_size(report_path: str) -> int:
+    """
+    Return number of bytes transferred to miners according to deploy report
+
+    :param report_path:
+        Path to JSON report created by deploy command.
+    :return:
+        Number of transferred bytes.
+    """
+    with open(report_path, 'r') as report_file:
+        report = json.load(report_file)
+    # each transfer is counted only by one step
+    return sum(step['size'] for step in report['steps'])
+
+
+def benchmark_deploy(args):
+    """
+    Measure deploy of all targets to local emulated miners
+    """
+    work_dir = os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix='bb-bench-'))
+    os.makedirs(work_dir, exist_ok=True)
+    logging.info("Benchmark directory is '{}'".format(work_dir))
+
+    config = miner.load_config(args.config)
+    config.build.dir = os.path.join(work_dir, 'build')
+    config.build.name = 'bench'
+    config.deploy.ssh.password = 'admin'
+    config.deploy.reboot = 'no'
+    config.deploy.write_bitstream = 'yes'
+    # miner configuration image needs LEDE utility 'mkenvimage' which is not built for synthetic images
+    config.deploy.write_miner_cfg = 'no'
+    config.deploy.reset_uboot_env = 'yes'
+    if args.skip_unchanged:
+        config.deploy.skip_unchanged = 'yes'
+    config_path = os.path.join(work_dir, 'bench.yml')
+    with open(config_path, 'w') as config_file:
+        config.dump(config_file)
+
+    if not args.no_images:
+        logging.info('Creating synthetic images...')
+        create_images(config, args.scale)
+
+    simulators = []
+    hosts_path = os.path.join(work_dir, 'hosts')
+    for index in range(args.miners):
+        mac = '00:0A:35:00:{:02X}:{:02X}'.format(index >> 8 & 0xff, index & 0xff)
+        miner_simulator = simulator.MinerSimulator(os.path.join(work_dir, 'miner{}'.format(index)), mac=mac,
+                                                   latency=args.latency / 1000,
+                                                   bandwidth=args.bandwidth and args.bandwidth * 1e6)
+        simulators.append(miner_simulator.start())
+    with open(hosts_path, 'w') as hosts_file:
+        for miner_simulator in simulators:
+            hosts_file.write('{} {}\n'.format(miner_simulator.address, miner_simulator.miner.mac))
+
+    results = []
+    try:
+        for target in args.targets or DEPLOY_TARGETS:
+            report_path = os.path.join(work_dir, 'report-{}.json'.format(target))
+            cmd = [sys.executable, BB_PATH, '--config', config_path, 'deploy', target, '--hosts-file', hosts_path,
+                   '--jobs', str(args.jobs), '--report', report_path]
+            logging.info("Running '{}'...".format(' '.join(cmd)))
+            start = time.monotonic()
+            returncode = subprocess.call(cmd, stdout=subprocess.DEVNULL if not args.verbose else None)
+            duration = time.monotonic() - start
+            size = get_transferred_size(report_path) if os.path.exists(report_path) else 0
+            results.append((target, returncode, duration, size))
+    finally:
+        for miner_simulator in simulators:
+            miner_simulator.stop()
+
+    print()
+    print('{:<16}  {:>6}  {:>9}  {:>10}  {:>8}'.format('target', 'status', 'time [s]', 'size [MB]', 'MB/s'))
+    for target, returncode, duration, size in results:
+        print('{:<16}  {:>6}  {:>9.2f}  {:>10.2f}  {:>8.2f}'.format(
+            target, 'OK' if returncode == 0 else 'FAILED', duration, size / 1e6, size / duration / 1e6))
+    print()
+    return all(returncode == 0 for _, returncode, _, _ in results)
+
+
+def _get_import_times(stderr: str):
+    """
+    Parse output of Python option `-X importtime` and return top level modules with cumulative import time
+    """
+    result = []
+    for line in stderr.splitlines():
+        match = re.match(r'^import time:\s+(\d+) \|\s+(\d+) \| (\S.*)$', line)
+        if match:
+            result.append((int(match.group(2)) / 1000, match.group(3)))
+    return sorted(result, reverse=True)
+
+
+def benchmark_startup(args):
+    """
+    Measure start-up time of build system commands which should return immediately
+    """
+    results = []
+    for command in args.commands or STARTUP_COMMANDS:
+        cmd = [sys.executable, BB_PATH, '--config', args.config, '--log', 'error'] + shlex.split(command)
+        durations = []
+        returncode = 0
+        stderr = ''
+        for _ in range(args.runs):
+            start = time.monotonic()
+            process = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                     universal_newlines=True)
+            durations.append(time.monotonic() - start)
+            returncode = process.returncode
+        if returncode:
+            logging.warning("Command '{}' failed with code {}".format(command, returncode))
+        if args.import_time:
+            process = subprocess.run(cmd[:1] + ['-X', 'importtime'] + cmd[1:], stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.PIPE, universal_newlines=True)
+            stderr = process.stderr
+        durations.sort()
+        results.append((command, durations[0], durations[len(durations) // 2], durations[-1], stderr))
+
+    target = args.target / 1000
+    print()
+    print('{:<16}  {:>8}  {:>8}  {:>8}  {:>6}'.format('command', 'min [ms]', 'med [ms]', 'max [ms]', 'target'))
+    for command, minimum, median, maximum, _ in results:
+        print('{:<16}  {:>8.1f}  {:>8.1f}  {:>8.1f}  {:>6}'.format(
+            command, minimum * 1000, median * 1000, maximum * 1000, 'OK' if median <= target else 'FAILED'))
+    print()
+    for command, _, _, _, stderr in results:
+        if not stderr:
+            continue
+        print("Slowest imports of '{}':".format(command))
+        for duration, module in _get_import_times(stderr)[:10]:
+            print('  {:>8.1f} ms  {}'.format(duration, module))
+        print()
+    return all(median <= target for _, _, median, _, _ in results)
+
+
+def create_tagged_repo(path: str, count: int):
+    """
+    Create git repository with synthetic firmware release tags
+
+    Tags are created for all platforms with several patch levels per day going back to the past and they are packed
+    like in a repository cloned from remote.
+
+    :param path:
+        Path to new repository.
+    :param count:
+        Number of tags.
+    :return:
+        List of tag names.
+    """
+    subprocess.run(['git', 'init', '-q', path], check=True)
+    env = dict(os.environ, GIT_AUTHOR_NAME='bb', GIT_AUTHOR_EMAIL='bb@localhost',
+               GIT_COMMITTER_NAME='bb', GIT_COMMITTER_EMAIL='bb@localhost')
+    subprocess.run(['git', 'commit', '-q', '--allow-empty', '-m', 'Initial commit'], cwd=path, env=env, check=True)
+    commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=path, universal_newlines=True).strip()
+
+    names = []
+    day = 24 * 60 * 60
+    for i in range(count):
+        platform = TAG_PLATFORMS[i % len(TAG_PLATFORMS)]
+        patch_level = i // len(TAG_PLATFORMS) % 3
+        date = time.gmtime(time.time() - (i // (3 * len(TAG_PLATFORMS)) + 1) * day)
+        names.append('firmware_{}_{}-{}-{:08x}'.format(platform, time.strftime('%Y-%m-%d', date), patch_level, i))
+    commands = ''.join('create refs/tags/{} {}\n'.format(name, commit) for name in names)
+    subprocess.run(['git', 'update-ref', '--stdin'], input=commands, cwd=path, check=True, universal_newlines=True)
+    subprocess.run(['git', 'pack-refs', '--all'], cwd=path, check=True)
+    return names
+
+
+def get_latest_tag_slow(repo, prefix: str):
+    """
+    Return the greatest tag name starting with prefix by iterating all tags (original implementation)
+    """
+    fw_tags = (str(tag) for tag in repo.tags if str(tag).startswith(prefix))
+    return next(iter(sorted(fw_tags, reverse=True)), None)
+
+
+def _measure(function, runs: int):
+    durations = []
+    result = None
+    for _ in range(runs):
+        start = time.monotonic()
+        result = function()
+        durations.append(time.monotonic() - start)
+    durations.sort()
+    return durations[len(durations) // 2], result
+
+
+def benchmark_tags(args):
+    """
+    Compare lookup of the latest firmware version tag in repository with thousands of tags
+    """
+    with tempfile.TemporaryDirectory(prefix='bb-tags-') as work_dir:
+        logging.info("Creating repository with {} tags...".format(args.tags))
+        names = create_tagged_repo(work_dir, args.tags)
+        repo = git.Repo(work_dir)
+        # look up the newest and the oldest day and prefix without any tag
+        prefixes = [name.rsplit('-', 2)[0] + '-' for name in (names[0], names[-1])]
+        prefixes.append('firmware_{}_1970-01-01-'.format(TAG_PLATFORMS[0]))
+
+        print()
+        print('{:<44}  {:>10}  {:>10}'.format('prefix', 'tags [ms]', 'index [ms]'))
+        success = True
+        for prefix in prefixes:
+            slow_time, slow_result = _measure(lambda: get_latest_tag_slow(repo, prefix), args.runs)
+            fast_time, fast_result = _measure(lambda: tags.get_latest_tag(repo, prefix), args.runs)
+            if slow_result != fast_result:
+                logging.error("Different results for prefix '{}': '{}' != '{}'".format(prefix, slow_result,
+                                                                                       fast_result))
+                success = False
+            print('{:<44}  {:>10.1f}  {:>10.1f}'.format(prefix, slow_time * 1000, fast_time * 1000))
+        print()
+    return success
+
+
+def benchmark_config(args):
+    """
+    Compare reading of configuration attributes through wrapper and through resolved snapshot
+    """
+    config = miner.load_config(args.config)
+    config = miner.Builder(config, []).configuration
+
+    def read(root):
+        for path in CONFIG_ATTRIBUTES:
+            current = root
+            for item in path.split('.'):
+                current = getattr(current, item)
+
+    def read_snapshot():
+        read(config.snapshot())
+
+    def read_modified():
+        # each modification invalidates the snapshot
+        config.miner.firmware = 1
+        read(config.snapshot())
+
+    def create_builder():
+        # builder per miner with overridden MAC address like in deployment to more miners
+        builder = miner.Builder(config, [])
+        builder.configuration.miner.mac = '00:0A:35:00:00:01'
+
+    cases = [
+        ('wrapper', lambda: read(config), len(CONFIG_ATTRIBUTES)),
+        ('snapshot', read_snapshot, len(CONFIG_ATTRIBUTES)),
+        ('snapshot after change', read_modified, len(CONFIG_ATTRIBUTES)),
+        ('builder with override', create_builder, 1)
+    ]
+    print()
+    print('{:<24}  {:>12}'.format('access', 'time [us]'))
+    for name, function, count in cases:
+        duration, _ = _measure(lambda: [function() for _ in range(args.count)], args.runs)
+        print('{:<24}  {:>12.2f}'.format(name, duration * 1e6 / args.count / count))
+    print()
+    return True
+
+
+def benchmark_load(args):
+    """
+    Compare parsing of configuration files with loading them from cache of parsed files
+    """
+    packages = miner.load_config(args.config, round_trip=True).build.packages
+    paths = [args.config, packages]
+
+    with tempfile.TemporaryDirectory(prefix='bb-config-') as cache_dir:
+        os.environ[miner.config.CACHE_DIR_ENV] = cache_dir
+
+        def load_cold():
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            for path in paths:
+                miner.load_config(path)
+
+        cases = [
+            ('round-trip parse', lambda: [miner.load_config(path, round_trip=True) for path in paths]),
+            ('cold cache', load_cold),
+            ('warm cache', lambda: [miner.load_config(path) for path in paths])
+        ]
+        print()
+        print('{:<20}  {:>10}'.format('load', 'time [ms]'))
+        for name, function in cases:
+            duration, _ = _measure(function, args.runs)
+            print('{:<20}  {:>10.2f}'.format(name, duration * 1000))
+        print()
+    return True
+
+
+def create_packages_index(path: str, count: int):
+    """
+    Create synthetic feeds index file with packages
+
+    The firmware package is the last record like in an index concatenated from base index and new release.
+
+    :param path:
+        Path to new feeds index file (it is compressed when it ends with `.gz`).
+    :param count:
+        Number of packages.
+    """
+    records = []
+    for i in range(count):
+        records.append('Package: package{0}\n'
+                       'Version: 1.{0}-1\n'
+                       'Depends: libc\n'
+                       'Source: feeds/packages/package{0}\n'
+                       'License: GPL-2.0\n'
+                       'Section: utils\n'
+                       'Architecture: arm_cortex-a9_neon\n'
+                       'Installed-Size: {1}\n'
+                       'Filename: package{0}_1.{0}-1_arm_cortex-a9_neon.ipk\n'
+                       'Size: {1}\n'
+                       'SHA256sum: {2:064x}\n'
+                       'Description:  Synthetic package {0}\n'
+                       '  with description on more lines\n'.format(i, 1024 + i, i))
+    records.append('Package: {0}\n'
+                   'Version: 2018-09-01-0-00000000\n'
+                   'Filename: {0}_2018-09-01-0-00000000_arm_cortex-a9_neon.ipk\n'.format(FEED_FIRMWARE))
+    data = '\n'.join(records).encode()
+    with (gzip.open if path.endswith('.gz') else open)(path, 'wb') as index_file:
+        index_file.write(data)
+
+
+def benchmark_packages(args):
+    """
+    Compare lookup of firmware package in feeds index by sequential parser and by indexed parser
+    """
+    def find_sequential(path):
+        with packages.Packages(path) as src_packages:
+            return next((dict(package) for package in src_packages
+                         if package['Package'] == FEED_FIRMWARE), None)
+
+    def find_indexed(path):
+        with packages.PackagesIndex(path) as src_packages:
+            package = src_packages.get(FEED_FIRMWARE)
+            return package and dict(package)
+
+    def parse_sequential(path):
+        with packages.Packages(path) as src_packages:
+            return sum(1 for _ in src_packages)
+
+    def parse_indexed(path):
+        with packages.PackagesIndex(path) as src_packages:
+            return len(src_packages)
+
+    with tempfile.TemporaryDirectory(prefix='bb-packages-') as work_dir:
+        index_path = os.path.join(work_dir, 'Packages')
+        logging.info("Creating feeds index with {} packages...".format(args.packages))
+        create_packages_index(index_path, args.packages)
+        create_packages_index(index_path + '.gz', args.packages)
+
+        cases = [
+            ('find firmware', find_sequential, find_indexed),
+            ('count records', parse_sequential, parse_indexed)
+        ]
+        print()
+        print('{:<16}  {:>12}  {:>12}  {:>12}'.format('operation', 'parser [ms]', 'index [ms]', 'gzip [ms]'))
+        success = True
+        for name, sequential, indexed in cases:
+            # sequential parser does not support compressed index
+            slow_time, slow_result = _measure(lambda: sequential(index_path), args.runs)
+            fast_time, fast_result = _measure(lambda: indexed(index_path), args.runs)
+            gzip_time, gzip_result = _measure(lambda: indexed(index_path + '.gz'), args.runs)
+            if not slow_result == fast_result == gzip_result:
+                logging.error("Different results of '{}'".format(name))
+                success = False
+            print('{:<16}  {:>12.1f}  {:>12.1f}  {:>12.1f}'.format(name, slow_time * 1000, fast_time * 1000,
+                                                                  gzip_time * 1000))
+        print()
+    return success
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmarks of Braiins Build System')
+    parser.add_argument('--config', default=miner.DEFAULT_CONFIG,
+                        help='path to configuration file')
+    parser.add_argument('--log', choices=['error', 'warn', 'info', 'debug'], default='info',
+                        help='logging level')
+    subparsers = parser.add_subparsers(dest='command', help='benchmark')
+    subparsers.required = True
+
+    # create the parser for the "deploy" command
+    subparser = subparsers.add_parser('deploy',
+                                      help='deploy firmware to emulated miners on local SSH servers')
+    subparser.add_argument('targets', nargs='*',
+                           help='list of deploy targets (default: {})'.format(', '.join(DEPLOY_TARGETS)))
+    subparser.add_argument('-n', '--miners', type=int, default=4,
+                           help='number of emulated miners')
+    subparser.add_argument('-j', '--jobs', type=int, default=4,
+                           help='number of miners deployed simultaneously')
+    subparser.add_argument('--latency', type=float, default=0.0,
+                           help='round trip time in milliseconds added to each remote command')
+    subparser.add_argument('--bandwidth', type=float,
+                           help='link bandwidth of each miner in MB/s (unlimited when omitted)')
+    subparser.add_argument('--scale', type=float, default=1.0,
+                           help='multiplier of synthetic image sizes')
+    subparser.add_argument('--skip-unchanged', action='store_true',
+                           help='do not write unchanged NAND partitions')
+    subparser.add_argument('--no-images', action='store_true',
+                           help='use existing images from build directory')
+    subparser.add_argument('--work-dir',
+                           help='directory for configuration, images, reports and miner data')
+    subparser.add_argument('-v', '--verbose', action='store_true',
+                           help='show output of deploy command')
+    subparser.set_defaults(func=benchmark_deploy)
+
+    # create the parser for the "startup" command
+    subparser = subparsers.add_parser('startup',
+                                      help='measure start-up time of fast commands')
+    subparser.add_argument('commands', nargs='*',
+                           help='list of commands with arguments (default: {})'.format(', '.join(STARTUP_COMMANDS)))
+    subparser.add_argument('-n', '--runs', type=int, default=10,
+                           help='number of runs of each command')
+    subparser.add_argument('--target', type=float, default=100.0,
+                           help='maximal median start-up time in milliseconds')
+    subparser.add_argument('--import-time', action='store_true',
+                           help='show slowest imports (requires Python 3.7)')
+    subparser.set_defaults(func=benchmark_startup)
+
+    # create the parser for the "tags" command
+    subparser = subparsers.add_parser('tags',
+                                      help='look up firmware version in repository with many release tags')
+    subparser.add_argument('-t', '--tags', type=int, default=5000,
+                           help='number of synthetic release tags')
+    subparser.add_argument('-n', '--runs', type=int, default=10,
+                           help='number of runs of each lookup')
+    subparser.set_defaults(func=benchmark_tags)
+
+    # create the parser for the "config" command
+    subparser = subparsers.add_parser('config',
+                                      help='measure reading of configuration attributes')
+    subparser.add_argument('-c', '--count', type=int, default=10000,
+                           help='number of reads of all attributes in one run')
+    subparser.add_argument('-n', '--runs', type=int, default=5,
+                           help='number of runs')
+    subparser.set_defaults(func=benchmark_config)
+
+    # create the parser for the "load" command
+    subparser = subparsers.add_parser('load',
+                                      help='measure loading of configuration and package list files')
+    subparser.add_argument('-n', '--runs', type=int, default=10,
+                           help='number of runs')
+    subparser.set_defaults(func=benchmark_load)
+
+    # create the parser for the "packages" command
+    subparser = subparsers.add_parser('packages',
+                                      help='look up firmware package in large feeds index')
+    subparser.add_argument('-p', '--packages', type=int, default=10000,
+                           help='number of synthetic packages in feeds index')
+    subparser.add_argument('-n', '--runs', type=int, default=10,
+                           help='number of runs of each operation')
+    subparser.set_defaults(func=benchmark_packages)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log.upper()), format='%(levelname)s: %(message)s')
+
+    return 0 if args.func(args) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
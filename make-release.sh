@@ -15,9 +15,10 @@ $DRY_RUN virtualenv --python=/usr/bin/python3.5 .env
 $DRY_RUN source .env/bin/activate
 $DRY_RUN pip3 install -r requirements.txt
 
-# Create release for all subtargets
+# Create release for all subtargets at once (all repositories are fetched only once)
+platforms=
 for subtarget in $release_subtargets; do
-    platform=$target-$subtarget
-    echo Releasing $platform
-    $DRY_RUN ./bb.py --platform $platform release
+    platforms=${platforms:+$platforms,}$target-$subtarget
 done
+echo Releasing $platforms
+$DRY_RUN ./bb.py release --platforms $platforms
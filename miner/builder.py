@@ -19,28 +19,39 @@ import logging
 import subprocess
 import shutil
 import tarfile
-import copy
 import gzip
-import git
 import io
+import tempfile
 import os
 import sys
 import glob
 import filecmp
+import hashlib
+import json
+import time
 
 import miner.hwid as hwid
+import miner.filestate as filestate
+import miner.status as repo_status
+import miner.tags as tags
+
+from miner.lazy import lazy_import
 
-from itertools import chain
 from collections import OrderedDict, namedtuple
 from termcolor import colored
-from functools import partial
+from functools import partial, lru_cache
 from datetime import datetime, timezone
-from doit.tools import run_once, config_changed, check_timestamp_unchanged
 
-from miner.config import ListWalker, RemoteWalker, load_config
-from miner.repo import RepoProgressPrinter
-from miner.ssh import SSHManager
-from miner.packages import Packages
+from miner.config import ConfigWrapper, ListResolver, RemoteWalker, load_config
+from miner.packages import PackagesIndex, merge_index
+from miner.report import Report
+from miner.cache import ArtifactCache, Fingerprint
+
+# modules with heavy dependencies are imported only by commands which use them
+git = lazy_import('git')
+doit_tools = lazy_import('doit.tools')
+repo_progress = lazy_import('miner.repo')
+remote_ssh = lazy_import('miner.ssh')
 
 
 class BuilderStop(Exception):
@@ -64,6 +75,75 @@ def get_stream_size(stream):
     return stream_size
 
 
+def copy_compressed(src, dst):
+    """
+    Compress data from source stream with gzip and write it to destination stream
+
+    The data are compressed in chunks so the memory usage does not depend on the size of stream and compressed data
+    are written to the destination while the compression is still running.
+
+    :param src:
+        Opened stream for reading uncompressed data.
+    :param dst:
+        Opened stream for writing compressed data. The stream is not closed.
+    """
+    # zero modification time makes compressed data reproducible so they can be compared with remote content
+    with gzip.GzipFile(filename='', mode='wb', fileobj=dst, mtime=0) as compressed:
+        shutil.copyfileobj(src, compressed)
+
+
+class HashWriter:
+    """
+    Writable stream which only computes SHA-256 digest and size of written data
+    """
+    def __init__(self):
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+@lru_cache(maxsize=None)
+def _get_image_hash(path: str, mtime: int, size: int, member: str, compress: bool):
+    hash_writer = HashWriter()
+    with open(path, 'rb') as image_file:
+        if member:
+            # the image is a member of tar archive
+            with tarfile.open(fileobj=image_file, mode='r') as tar:
+                image_file = tar.extractfile(member)
+                shutil.copyfileobj(image_file, hash_writer)
+        elif compress:
+            copy_compressed(image_file, hash_writer)
+        else:
+            shutil.copyfileobj(image_file, hash_writer)
+    return hash_writer.hash.hexdigest(), hash_writer.size
+
+
+def get_image_hash(path: str, member: str=None, compress: bool=False):
+    """
+    Return SHA-256 digest and size of data written from local image to the device
+
+    The result is cached until the image file is modified.
+
+    :param path:
+        Path to local image file.
+    :param member:
+        Name of member when the image is stored in tar archive.
+    :param compress:
+        Compute digest of image compressed with gzip.
+    :return:
+        Pair with hexadecimal digest and size of data.
+    """
+    stat = os.stat(path)
+    return _get_image_hash(path, stat.st_mtime_ns, stat.st_size, member, compress)
+
+
 class Builder:
     """
     Main class for building the Miner firmware based on the LEDE (OpenWRT) project.
@@ -86,6 +166,33 @@ class Builder:
     LINUX = 'linux'
     CGMINER = 'cgminer'
     FEEDS_CONF = 'feeds.conf'
+    DL_DIR = 'dl'
+    FILE_STATE_DIR = '.file_state'
+    BUILD_STATE = '.build_state.json'
+    PREPARE_STATE = '.prepare_state'
+
+    # configuration attributes which affect prepared LEDE build system
+    PREPARE_CONFIG = ['miner.platform', 'remote', 'feeds', 'build.name', 'build.config', 'build.key',
+                      'build.sysupgrade']
+    # configuration attributes which force some prepare step to be always done
+    PREPARE_ALWAYS = ['feeds.create_always', 'feeds.update_always', 'feeds.install_always', 'build.config_always']
+    # patterns of files in feeds which affect LEDE package configuration
+    FEEDS_CONFIG_FILES = [
+        ['**', 'Makefile'],
+        ['**', 'Config.in'],
+        ['*.index']
+    ]
+    # files generated by feeds installation which are used for creating full configuration
+    FEEDS_TMP_FILES = [
+        '.config-feeds.in',
+        '.packagedeps',
+        '.packageinfo',
+        '.config-package.in',
+        '.packagesubdirs'
+    ]
+
+    # LEDE targets for assembling firmware images after build of selected packages
+    IMAGE_TARGETS = ['package/install', 'target/install', 'package/index']
     FEEDS_DIR = 'feeds'
     CONFIG_NAME = '.config'
     BUILD_KEY_NAME = 'key-build'
@@ -114,6 +221,16 @@ class Builder:
 
     UENV_TXT = 'uEnv.txt'
 
+    SSH_AUTH_CACHE = '.ssh_auth.json'
+
+    # name of remote in local clones
+    REMOTE_ORIGIN = 'origin'
+
+    # number of attempts for cloning or fetching one remote repository
+    REMOTE_ATTEMPTS = 3
+    # delay in seconds before next attempt (it is multiplied by number of failed attempts)
+    REMOTE_RETRY_DELAY = 5
+
     MTD_BITSTREAM = 'fpga'
 
     DM_VERSIONS = 3
@@ -169,6 +286,37 @@ class Builder:
         platform = platform or self._config.miner.platform
         return tuple(platform.split('-', 1))
 
+    def _get_package_lists(self):
+        """
+        Return resolver of package lists with already resolved lists of all images
+
+        :return:
+            Resolver of package lists.
+        """
+        package_lists = ListResolver(load_config(self._config.build.packages))
+        try:
+            # shared base lists are expanded only once for all images
+            package_lists.resolve_all(self.PACKAGE_LIST_PREFIX)
+        except (AttributeError, ValueError) as e:
+            logging.error("Invalid package lists in '{}': {}".format(self._config.build.packages, e))
+            raise BuilderStop
+        return package_lists
+
+    def _get_image_packages(self):
+        """
+        Return packages of all images from package lists configuration
+
+        :return:
+            Dictionary with tuple of packages for each image.
+        """
+        package_lists = self._get_package_lists()
+        try:
+            return OrderedDict((image, package_lists.resolve(self.PACKAGE_LIST_PREFIX + image))
+                               for image in self.CONFIG_DEVICES)
+        except AttributeError as e:
+            logging.error("Invalid package lists in '{}': {}".format(self._config.build.packages, e))
+            raise BuilderStop
+
     def _write_target_config(self, stream, config):
         """
         Write all settings concerning target configuration
@@ -178,7 +326,7 @@ class Builder:
         :param config:
             Configuration name prefix.
         """
-        image_packages = load_config(self._config.build.packages)
+        image_packages = self._get_image_packages()
 
         platform = self._config.miner.platform
         target_name, _ = self._split_platform(platform)
@@ -191,7 +339,7 @@ class Builder:
         stream.write('{}PER_DEVICE_ROOTFS=y\n'.format(config))
 
         for image in self.CONFIG_DEVICES:
-            packages = ' '.join(ListWalker(image_packages, self.PACKAGE_LIST_PREFIX + image))
+            packages = ' '.join(image_packages[image])
             stream.write('{}DEVICE_{}_DEVICE_{}=y\n'.format(config, device_name, image))
             stream.write('{}DEVICE_PACKAGES_{}_DEVICE_{}="{}"\n'.format(config, device_name, image, packages))
 
@@ -310,7 +458,8 @@ class Builder:
                 """
                 return value.format(**self._format_tags)
 
-        self._config = copy.deepcopy(config)
+        # builder modifies only its own layer of configuration which shares all unmodified nodes with the original
+        self._config = config.overlay()
         self._config.formatter = StrFormatter(self)
         self._argv = argv
         self._build_dir = os.path.join(os.path.abspath(self._config.build.dir), self._config.build.name)
@@ -319,8 +468,9 @@ class Builder:
         # set working directory to LEDE root directory
         self._working_dir = self._get_repo_path(self.LEDE)
         self._tmp_dir = os.path.join(self._working_dir, 'tmp')
+        # repositories are opened on first access
         self._repos = OrderedDict()
-        self._init_repos()
+        self._report = Report()
 
     @property
     def build_dir(self):
@@ -382,7 +532,7 @@ class Builder:
         if output:
             return process.stdout
 
-    def _get_firmware_version(self) -> str:
+    def _get_firmware_version(self, platform: str = None) -> str:
         """
         Return version name for firmware
 
@@ -390,20 +540,21 @@ class Builder:
         The patch level is incremented when several firmwares have been released in the same day.
         The current firmware version is get from git tag which is created when release is done.
 
+        :param platform:
+            Name of platform or None for the current one.
         :return:
             String with firmware version without 'firmware_' prefix.
         """
         repo = git.Repo()
+        platform = platform or self._config.miner.platform
 
         # get commit time in RFC 3339 format
         commit_timestamp = repo.head.object.committed_date
         commit_time = datetime.fromtimestamp(commit_timestamp, timezone.utc)
-        fw_current = '{}_{}_{:%Y-%m-%d}-'.format(self.FEED_FIRMWARE, self._config.miner.platform, commit_time)
+        fw_current = '{}_{}_{:%Y-%m-%d}-'.format(self.FEED_FIRMWARE, platform, commit_time)
 
-        # filter out only versions for current date
-        fw_tags = (str(tag) for tag in repo.tags if str(tag).startswith(fw_current))
-        # get latest version
-        fw_latest = next(iter(sorted(fw_tags, reverse=True)), None)
+        # get latest version for current date
+        fw_latest = tags.get_latest_tag(repo, fw_current)
 
         commit = repo.head.object.hexsha[:8]
         dirty = '-dirty' if repo.is_dirty() else ''
@@ -420,15 +571,28 @@ class Builder:
 
         return '{:%Y-%m-%d}-{}-{}{}'.format(commit_time, patch_level, commit, dirty)
 
-    def _get_repo(self, name: str) -> git.Repo:
+    def _get_repo(self, name: str) -> 'git.Repo':
         """
         Return git repository by its name
 
         :param name: The name of repository as it has been specified in configuration file.
         :return: Associated git repository or raise exception if the repository does not exist.
         """
+        if name not in self._repos:
+            if name not in self._config.snapshot().remote.repos:
+                raise KeyError(name)
+            self._repos[name] = self._open_repo(name)
         return self._repos[name]
 
+    def _get_repos(self):
+        """
+        Return all repositories specified in configuration file
+
+        :return:
+            Generator of pairs with repository name and git repository or None when it is not cloned yet.
+        """
+        return ((name, self._get_repo(name)) for name in self._config.snapshot().remote.repos)
+
     def _get_repo_path(self, name: str) -> str:
         """
         Return absolute path to repository specified by its name
@@ -470,7 +634,7 @@ class Builder:
         :return:
             Miner hostname for current configuration.
         """
-        mac = self._config.miner.mac
+        mac = self._config.snapshot().miner.mac
         return 'miner-' + ''.join(mac.split(':')[-3:]).lower()
 
     def _get_utility(self, name: str):
@@ -488,32 +652,29 @@ class Builder:
             raise BuilderStop
         return utility_path
 
-    def _init_repos(self):
+    def _open_repo(self, name: str):
         """
-        Initialize all repositories specified in configuration file
+        Open repository specified in configuration file
 
         The list of repositories is stored under `remote.repos`.
 
-        If repository is not cloned yet then None is used otherwise the repository is opened by `git.Repo`.
+        :param name:
+            The name of repository.
+        :return:
+            None if repository is not cloned yet otherwise the repository opened by `git.Repo`.
         """
-        error = False
-        for name in self._config.remote.repos:
-            path = self._get_repo_path(name)
-            logging.debug("Init repo '{}' in '{}'".format(name, path))
-            repo = None
-            try:
-                repo = git.Repo(path)
-            except git.exc.NoSuchPathError:
-                logging.debug("Missing directory '{}'".format(path))
-            except git.exc.InvalidGitRepositoryError:
-                if os.listdir(path):
-                    logging.error("Invalid Git repository '{}'".format(path))
-                    error = True
-                else:
-                    logging.warning("Empty Git repository '{}'".format(path))
-            self._repos[name] = repo
-        if error:
-            raise BuilderStop
+        path = self._get_repo_path(name)
+        logging.debug("Init repo '{}' in '{}'".format(name, path))
+        try:
+            return git.Repo(path)
+        except git.exc.NoSuchPathError:
+            logging.debug("Missing directory '{}'".format(path))
+        except git.exc.InvalidGitRepositoryError:
+            if os.listdir(path):
+                logging.error("Invalid Git repository '{}'".format(path))
+                raise BuilderStop
+            logging.warning("Empty Git repository '{}'".format(path))
+        return None
 
     def _clone_repo(self, remote):
         """
@@ -529,13 +690,118 @@ class Builder:
 
         yield {
             'name': name,
-            'uptodate': [self._repos[name] is not None,
-                         config_changed(remote.uri)]
+            'uptodate': [self._get_repo(name) is not None,
+                         doit_tools.config_changed(remote.uri)]
         }
 
-        shutil.rmtree(path, ignore_errors=True)
-        repo = git.Repo.clone_from(remote.uri, path, progress=RepoProgressPrinter())
-        self._repos[name] = repo
+        mirror_path = self._get_mirror_path(remote.uri)
+        if mirror_path:
+            self._update_mirror(name, remote.uri, mirror_path)
+
+        def clone():
+            # remove partially cloned repository from previous attempt
+            shutil.rmtree(path, ignore_errors=True)
+            kwargs = {}
+            if mirror_path:
+                # objects are borrowed from the mirror through git alternates
+                kwargs['reference'] = mirror_path
+            return git.Repo.clone_from(remote.uri, path, progress=self._get_repo_progress(name), **kwargs)
+
+        self._repos[name] = self._run_remote(name, 'clone', clone)
+
+    def _get_mirror_path(self, uri: str):
+        """
+        Return path to shared bare mirror of remote repository
+
+        All build directories share the same mirrors so each remote repository is downloaded only once.
+
+        :param uri:
+            Address of remote git repository.
+        :return:
+            Absolute path to mirror or None when mirrors are disabled.
+        """
+        mirror_dir = self._config.remote.get('mirror_dir', None)
+        if not mirror_dir:
+            return None
+        mirror_dir = os.path.join(os.path.abspath(self._config.build.dir), os.path.expanduser(mirror_dir))
+        # the name contains hash of URI to distinguish remotes with the same repository name
+        uri_hash = hashlib.sha1(uri.encode()).hexdigest()[:12]
+        repo_name = os.path.basename(uri.rstrip('/'))
+        if repo_name.endswith('.git'):
+            repo_name = repo_name[:-len('.git')]
+        return os.path.join(mirror_dir, '{}-{}.git'.format(repo_name, uri_hash))
+
+    def _update_mirror(self, name: str, uri: str, mirror_path: str):
+        """
+        Create shared bare mirror of remote repository or fetch new objects to existing one
+
+        :param name:
+            Name of repository.
+        :param uri:
+            Address of remote git repository.
+        :param mirror_path:
+            Path to mirror.
+        """
+        if os.path.isdir(mirror_path):
+            logging.info("Updating mirror of '{}'...".format(name))
+            mirror = git.Repo(mirror_path)
+            self._run_remote(name, 'update mirror of', partial(mirror.remotes[self.REMOTE_ORIGIN].fetch,
+                                                               progress=self._get_repo_progress(name)))
+            return
+
+        logging.info("Creating mirror of '{}' in '{}'...".format(name, mirror_path))
+        # clone to temporary directory to not leave incomplete mirror after interruption
+        tmp_path = mirror_path + '.tmp'
+
+        def clone():
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return git.Repo.clone_from(uri, tmp_path, progress=self._get_repo_progress(name), mirror=True)
+
+        mirror = self._run_remote(name, 'create mirror of', clone)
+        # objects of rewound branches may still be referenced by alternates of local clones
+        mirror.git.config('gc.pruneExpire', 'never')
+        mirror.git.config('gc.reflogExpireUnreachable', 'never')
+        os.rename(tmp_path, mirror_path)
+
+    def _get_repo_progress(self, name: str):
+        """
+        Return progress printer for remote operation with repository
+
+        Progress bars cannot be used when more repositories are processed concurrently so line based progress is used
+        instead.
+
+        :param name:
+            Name of repository.
+        :return:
+            Object derived from `git.RemoteProgress`.
+        """
+        if int(self._config.remote.jobs) > 1:
+            return repo_progress.RepoProgressLogger(name)
+        return repo_progress.RepoProgressPrinter()
+
+    def _run_remote(self, name: str, operation: str, action):
+        """
+        Run operation with remote repository and retry it when it fails
+
+        :param name:
+            Name of repository.
+        :param operation:
+            Name of operation used in log messages.
+        :param action:
+            Callable object doing the operation.
+        :return:
+            Return value of action.
+        """
+        for attempt in range(1, self.REMOTE_ATTEMPTS + 1):
+            try:
+                return action()
+            except git.exc.GitCommandError as e:
+                if attempt == self.REMOTE_ATTEMPTS:
+                    logging.error("Cannot {} repository '{}': {}".format(operation, name, str(e).strip()))
+                    raise BuilderStop
+                logging.warning("Attempt {}/{} to {} repository '{}' failed, retrying..."
+                                .format(attempt, self.REMOTE_ATTEMPTS, operation, name))
+                time.sleep(self.REMOTE_RETRY_DELAY * attempt)
 
     def clone_repos(self):
         """
@@ -544,7 +810,7 @@ class Builder:
         :return:
             List of generators used for doit task.
         """
-        for remote in RemoteWalker(self._config.remote):
+        for remote in RemoteWalker(self._config.snapshot().remote):
             yield self._clone_repo(remote)
 
     def _checkout_repo(self, remote):
@@ -600,7 +866,8 @@ class Builder:
                 head.checkout()
                 if remote.fetch:
                     for repo_remote in repo.remotes:
-                        repo_remote.pull()
+                        self._run_remote(name, 'pull', partial(repo_remote.pull,
+                                                                progress=self._get_repo_progress(name)))
                 return True
 
             for repo_remote in repo.remotes:
@@ -620,9 +887,14 @@ class Builder:
 
         # try to checkout head from local repository when fetch is disabled
         if remote.fetch or not head_checkout():
+            # download new objects to shared mirror first so fetch of local clone transfers only references
+            mirror_path = self._get_mirror_path(remote.uri)
+            if mirror_path and os.path.isdir(mirror_path):
+                self._update_mirror(name, remote.uri, mirror_path)
+
             # fetch remote repository when fetch is enabled or local checkout wasn't successful
             for repo_remote in repo.remotes:
-                repo_remote.fetch()
+                self._run_remote(name, 'fetch', partial(repo_remote.fetch, progress=self._get_repo_progress(name)))
 
             # try checkout after remote fetch (it is second attempt when fetch is disabled)
             if not head_checkout():
@@ -636,7 +908,7 @@ class Builder:
         :return:
             List of generators used for doit task.
         """
-        for remote in RemoteWalker(self._config.remote):
+        for remote in RemoteWalker(self._config.snapshot().remote):
             yield self._checkout_repo(remote)
 
     def prepare_feeds_conf(self):
@@ -654,7 +926,7 @@ class Builder:
         yield {
             'targets': [feeds_path],
             'uptodate': [self._config.feeds.create_always != 'yes',
-                         config_changed({name: link for name, link in feeds_links.items()})]
+                         doit_tools.config_changed({name: link for name, link in feeds_links.items()})]
         }
 
         logging.debug("Creating '{}'".format(feeds_path))
@@ -684,6 +956,20 @@ class Builder:
         logging.debug('Updating all feeds')
         self._run(os.path.join('scripts', 'feeds'), 'update', '-a')
 
+    def _get_feeds_fingerprint(self, name, link) -> str:
+        """
+        Return fingerprint of all configuration files in feeds directory
+
+        :param name:
+            Feeds name.
+        :param link:
+            Local link to feeds directory.
+        :return:
+            String which is changed whenever any configuration file is added, removed or modified.
+        """
+        index_path = os.path.join(self._build_dir, self.FILE_STATE_DIR, '{}.json'.format(name))
+        return filestate.get_fingerprint(link, self.FEEDS_CONFIG_FILES, index_path)
+
     def _prepare_feeds_link(self, name, link):
         """
         Install updated feeds
@@ -701,27 +987,18 @@ class Builder:
 
             These files cannot be used as a file dependencies because they are gathered dynamically and previous
             task can modify them (e.g. checkout another branch)
+
+            Instead of checking timestamps of thousands of files only fingerprint of all files is compared with the
+            previous one. It is obtained from git status or from persistent index of directory modification times.
             """
-            config_files_key = 'config_files'
-            count = 0
+            config_files_key = 'config_files_fingerprint'
+            fingerprint = self._get_feeds_fingerprint(name, link)
 
             def save_now():
-                return {config_files_key: count}
+                return {config_files_key: fingerprint}
             task.value_savers.append(save_now)
 
-            patterns = [
-                ['**', 'Makefile'],
-                ['**', 'Config.in'],
-                ['*.index']
-            ]
-            result = True
-            for config_file in chain(*(glob.glob(os.path.join(link, *pattern), recursive=True)
-                                       for pattern in patterns)):
-                result &= check_timestamp_unchanged(config_file)(task, values)
-                count += 1
-
-            prev_count = values.get(config_files_key)
-            return result and prev_count == count
+            return values.get(config_files_key) == fingerprint
 
         yield {
             'name': name,
@@ -755,7 +1032,7 @@ class Builder:
             Generator returning dictionary with dependencies and action for doit task.
         """
         yield {
-            'uptodate': [run_once]
+            'uptodate': [doit_tools.run_once]
         }
 
         logging.debug("Creating default configuration")
@@ -780,19 +1057,11 @@ class Builder:
 
         target_config.seek(0)
 
-        feeds_files = [
-            '.config-feeds.in',
-            '.packagedeps',
-            '.packageinfo',
-            '.config-package.in',
-            '.packagesubdirs'
-        ]
-
         yield {
             'file_dep': [config_src_path] +
-                        [os.path.join(self._tmp_dir, file_name) for file_name in feeds_files],
+                        [os.path.join(self._tmp_dir, file_name) for file_name in self.FEEDS_TMP_FILES],
             'targets': [config_dst_path],
-            'uptodate': [config_changed(target_config.getvalue()),
+            'uptodate': [doit_tools.config_changed(target_config.getvalue()),
                          self._config.build.config_always != 'yes']
         }
 
@@ -822,7 +1091,7 @@ class Builder:
             'name': '{}_key'.format(attribute),
             'uptodate': [not key_src_path or
                          (os.path.exists(key_dst_path) and filecmp.cmp(key_src_path, key_dst_path)),
-                         config_changed('user' if key_src_path else 'generated')]
+                         doit_tools.config_changed('user' if key_src_path else 'generated')]
         }
 
         if key_src_path:
@@ -850,6 +1119,90 @@ class Builder:
             self._prepare_key('public', self.BUILD_KEY_PUB_NAME)
         ])
 
+    def _get_prepare_fingerprint(self):
+        """
+        Return fingerprint of all inputs of prepare task
+
+        The inputs are related parts of configuration, generated target configuration, checked out heads of all
+        repositories, configuration files in all feeds, LEDE configuration sources and build keys.
+
+        :return:
+            String with fingerprint or None when prepare must be always done.
+        """
+        if any(self._config.get(attribute) == 'yes' for attribute in self.PREPARE_ALWAYS):
+            return None
+
+        fingerprint = Fingerprint()
+        for attribute in self.PREPARE_CONFIG:
+            value = self._config.get(attribute)
+            if isinstance(value, ConfigWrapper):
+                stream = io.StringIO()
+                value.dump(stream)
+                value = stream.getvalue()
+            fingerprint.add('config:{}'.format(attribute), str(value))
+
+        # generated configuration contains also firmware version and paths to external repositories
+        target_config = io.StringIO()
+        for config, generator in self.GENERATED_CONFIGS:
+            generator and generator(self, target_config, config)
+        fingerprint.add('target_config', target_config.getvalue())
+
+        for remote in RemoteWalker(self._config.snapshot().remote):
+            repo = self._get_repo(remote.name)
+            if remote.fetch or not repo:
+                return None
+            head = repo.head
+            fingerprint.add('repo:{}'.format(remote.name),
+                            head.commit.hexsha if head.is_detached else head.reference.path)
+            fingerprint.add('commit:{}'.format(remote.name), head.commit.hexsha)
+
+        for name, link in self._config.feeds.links.items():
+            fingerprint.add('feeds:{}'.format(name), self._get_feeds_fingerprint(name, link))
+
+        config_src_path, config_dst_path = self._get_config_paths()
+        fingerprint.add_file('config_src', config_src_path)
+        fingerprint.add('config_dst', str(os.path.exists(config_dst_path)))
+        fingerprint.add_stat(self.FEEDS_CONF, os.path.join(self._working_dir, self.FEEDS_CONF))
+        for file_name in self.FEEDS_TMP_FILES:
+            fingerprint.add_stat(file_name, os.path.join(self._tmp_dir, file_name))
+
+        for attribute, key_name in (('secret', self.BUILD_KEY_NAME), ('public', self.BUILD_KEY_PUB_NAME)):
+            key_src_path = self._config.build.get('key.' + attribute, None)
+            if key_src_path:
+                fingerprint.add_file('key:{}'.format(attribute), key_src_path)
+            fingerprint.add_stat(key_name, os.path.join(self._working_dir, key_name))
+        return fingerprint.hexdigest()
+
+    def prepare_unchanged(self) -> bool:
+        """
+        Check if LEDE build system has been prepared with the same inputs as current ones
+
+        Stored fingerprint is removed when prepare is not up to date so it is not valid after interrupted prepare.
+
+        :return:
+            True when all inputs of prepare task are unchanged since last successful prepare.
+        """
+        state_path = os.path.join(self._build_dir, self.PREPARE_STATE)
+        try:
+            with open(state_path, 'r') as state_file:
+                last_fingerprint = state_file.read().strip()
+        except OSError:
+            return False
+
+        if last_fingerprint and last_fingerprint == self._get_prepare_fingerprint():
+            return True
+        os.remove(state_path)
+        return False
+
+    def save_prepare_state(self):
+        """
+        Save fingerprint of all inputs of prepare task after successful prepare
+        """
+        fingerprint = self._get_prepare_fingerprint()
+        if fingerprint:
+            with open(os.path.join(self._build_dir, self.PREPARE_STATE), 'w') as state_file:
+                state_file.write(fingerprint)
+
     def _config_lede(self):
         """
         Configure LEDE project
@@ -894,7 +1247,7 @@ class Builder:
         if not purge:
             self._run('make', 'clean')
         else:
-            for name, repo in self._repos.items():
+            for name, repo in self._get_repos():
                 if not repo:
                     continue
                 logging.debug("Purging '{}'".format(name))
@@ -914,7 +1267,123 @@ class Builder:
             logging.info("Start Linux kernel configuration...'")
             self._config_kernel()
 
-    def build(self, targets=None):
+    def _link_download_dir(self):
+        """
+        Replace LEDE download directory with a link to shared download directory
+
+        The shared directory is specified in `build.download_dir` and it is used by all build directories so package
+        sources are downloaded only once.
+        """
+        download_dir = self._config.build.get('download_dir', None)
+        if not download_dir:
+            return
+        download_dir = os.path.join(os.path.abspath(self._config.build.dir), os.path.expanduser(download_dir))
+        dl_path = os.path.join(self._working_dir, self.DL_DIR)
+        os.makedirs(download_dir, exist_ok=True)
+
+        if os.path.islink(dl_path):
+            if os.path.realpath(dl_path) == os.path.realpath(download_dir):
+                return
+            os.remove(dl_path)
+        elif os.path.isdir(dl_path):
+            logging.info("Moving downloaded sources to '{}'...".format(download_dir))
+            for name in os.listdir(dl_path):
+                dst_path = os.path.join(download_dir, name)
+                if not os.path.exists(dst_path):
+                    shutil.move(os.path.join(dl_path, name), dst_path)
+            shutil.rmtree(dl_path)
+        logging.debug("Linking '{}' to '{}'".format(dl_path, download_dir))
+        os.symlink(download_dir, dl_path)
+
+    def download(self):
+        """
+        Download sources of all selected packages without building them
+        """
+        logging.info('Start downloading sources...')
+        self._link_download_dir()
+        self._run('make', '-j{}'.format(self._config.build.jobs), 'download')
+
+    def _get_repo_state(self, repo) -> dict:
+        """
+        Return state of repository with current commit and hash of all local changes
+        """
+        changes = hashlib.sha256()
+        changes.update(repo.git.diff('HEAD', '--binary').encode())
+        for path in repo.untracked_files:
+            file_path = os.path.join(repo.working_tree_dir, path)
+            changes.update('{}\0{}\0'.format(path, os.path.getmtime(file_path)).encode())
+        return {
+            'commit': repo.head.commit.hexsha,
+            'changes': changes.hexdigest()
+        }
+
+    def _get_inputs_state(self) -> str:
+        """
+        Return fingerprint of all build inputs except repositories
+        """
+        fingerprint = Fingerprint()
+        fingerprint.add('platform', self._config.miner.platform)
+        self._add_build_inputs(fingerprint)
+        return fingerprint.hexdigest()
+
+    def _save_build_state(self):
+        """
+        Save state of all repositories and other build inputs after successful build
+        """
+        state = OrderedDict([
+            ('inputs', self._get_inputs_state()),
+            ('repos', OrderedDict((name, self._get_repo_state(repo)) for name, repo in self._get_repos() if repo))
+        ])
+        with open(os.path.join(self._build_dir, self.BUILD_STATE), 'w') as state_file:
+            json.dump(state, state_file, indent=4)
+
+    def _remove_build_state(self):
+        """
+        Remove state of last build when build directory does not correspond to its outputs
+        """
+        try:
+            os.remove(os.path.join(self._build_dir, self.BUILD_STATE))
+        except FileNotFoundError:
+            pass
+
+    def _get_changed_targets(self):
+        """
+        Return build targets for repositories changed since last successful build
+
+        The repositories are mapped to build aliases by `build.changed_aliases`.
+
+        :return:
+            List of aliases or None when the whole firmware has to be built.
+        """
+        try:
+            with open(os.path.join(self._build_dir, self.BUILD_STATE), 'r') as state_file:
+                last_state = json.load(state_file)
+        except (OSError, ValueError):
+            logging.info('No previous build found, building the whole firmware...')
+            return None
+
+        if last_state.get('inputs') != self._get_inputs_state():
+            logging.info('Build configuration has been changed, building the whole firmware...')
+            return None
+
+        changed_aliases = self._config.build.get('changed_aliases', {})
+        last_repos = last_state.get('repos', {})
+        targets = []
+        for name, repo in self._get_repos():
+            if not repo:
+                continue
+            if last_repos.get(name) == self._get_repo_state(repo):
+                continue
+            alias = changed_aliases.get(name)
+            if not alias:
+                logging.info("Repository '{}' has been changed, building the whole firmware...".format(name))
+                return None
+            logging.info("Repository '{}' has been changed, building '{}'...".format(name, alias))
+            if alias not in targets:
+                targets.append(alias)
+        return targets
+
+    def build(self, targets=None, changed: bool=False):
         """
         Build the Miner firmware for current configuration
 
@@ -926,13 +1395,33 @@ class Builder:
         :param targets:
             List of targets for build. Target is specified as an alias to real LEDE target.
             The aliases are stored in configuration file under `build.aliases`
+        :param changed:
+            Build only targets of repositories changed since last successful build and assemble firmware images.
         """
         logging.info("Start building LEDE...'")
 
+        if changed:
+            targets = self._get_changed_targets()
+            if targets == []:
+                logging.info('No repository has been changed since last build')
+                return
+
+        # only complete build of firmware can be restored from cache
+        cache = self._get_artifact_cache() if not targets else None
+        fingerprint = cache and self._get_build_fingerprint()
+        output_dirs = self._get_output_dirs()
+        if fingerprint and cache.restore(fingerprint, output_dirs):
+            # restored images do not correspond to intermediate files in build directory
+            # so the next build of changed repositories has to be the complete one
+            self._remove_build_state()
+            return
+
         # set PATH environment variable
         env_path = self._config.build.get('env_path', None)
         path = env_path and [os.path.abspath(os.path.expanduser(env_path))]
 
+        self._link_download_dir()
+
         # prepare arguments for build
         args = ['make', '-j{}'.format(self._config.build.jobs)]
         if self._config.build.verbose == 'yes':
@@ -940,10 +1429,86 @@ class Builder:
         if targets:
             aliases = self._config.build.aliases
             args.extend('{}/install'.format(aliases[target]) for target in targets)
+            if changed:
+                # install rebuilt packages to root file system and create new images
+                args.extend(self.IMAGE_TARGETS)
         # run make to build whole LEDE
         # set umask to 0022 to fix issue with incorrect root fs access rights
         self._run(args, path=path, init=partial(os.umask, 0o0022))
 
+        if fingerprint:
+            cache.store(fingerprint, output_dirs)
+        if not targets or changed:
+            # explicitly selected targets do not say anything about state of other repositories
+            self._save_build_state()
+
+    def _get_packages_dir(self) -> str:
+        """
+        Return LEDE directory with feeds index and packages for current platform target
+        """
+        platform_target, _ = self._split_platform()
+        return os.path.join(self._working_dir, 'staging_dir', 'packages', platform_target)
+
+    def _get_output_dirs(self):
+        """
+        Return LEDE directories with firmware images and packages for current platform target
+
+        :return:
+            Ordered dictionary with path to output directory for each name of output.
+        """
+        platform_target, _ = self._split_platform()
+        return OrderedDict([
+            ('images', os.path.join(self._working_dir, 'bin', 'targets', platform_target)),
+            # firmware package and feeds index for 'local_feeds' deploy target
+            ('packages', self._get_packages_dir())
+        ])
+
+    def _get_artifact_cache(self):
+        """
+        Return cache of build outputs or None when the cache is disabled
+
+        The cache is specified by `build.cache.dir` and `build.cache.size` in MB.
+        """
+        cache_dir = self._config.build.get('cache.dir', None)
+        if not cache_dir:
+            return None
+        cache_dir = os.path.join(os.path.abspath(self._config.build.dir), os.path.expanduser(cache_dir))
+        return ArtifactCache(cache_dir, int(self._config.build.get('cache.size', 0)) * 1024 * 1024)
+
+    def _get_build_fingerprint(self):
+        """
+        Return fingerprint of all inputs which affect built firmware
+
+        The inputs are commits of all repositories, LEDE configuration, list of image packages and build keys.
+
+        :return:
+            String with fingerprint or None when some repository contains local changes.
+        """
+        fingerprint = Fingerprint()
+        fingerprint.add('platform', self._config.miner.platform)
+        # layout of cache entry
+        fingerprint.add('outputs', ','.join(self._get_output_dirs()))
+        for name, repo in self._get_repos():
+            if not repo:
+                return None
+            if repo.is_dirty(untracked_files=True):
+                logging.info("Build output is not cached because repository '{}' is dirty".format(name))
+                return None
+            fingerprint.add('repo:{}'.format(name), repo.head.commit.hexsha)
+        self._add_build_inputs(fingerprint)
+        return fingerprint.hexdigest()
+
+    def _add_build_inputs(self, fingerprint):
+        """
+        Add LEDE configuration, list of image packages and build keys to fingerprint
+        """
+        fingerprint.add_file('config', os.path.join(self._working_dir, self.CONFIG_NAME))
+        fingerprint.add_file('packages', self._config.build.packages)
+        for key_name in (self.BUILD_KEY_NAME, self.BUILD_KEY_PUB_NAME):
+            key_path = os.path.join(self._working_dir, key_name)
+            if os.path.exists(key_path):
+                fingerprint.add_file(key_name, key_path)
+
     def _write_uenv(self, stream, recovery: bool=False):
         """
         Generate content of uEnv.txt to the file stream
@@ -953,8 +1518,9 @@ class Builder:
         :param recovery:
             Write also recovery parameters.
         """
-        if self._config.uenv.get('mac', 'no') == 'yes':
-            stream.write("{}={}\n".format(self.MINER_MAC, self._config.miner.mac))
+        config = self._config.snapshot()
+        if config.uenv.get('mac', 'no') == 'yes':
+            stream.write("{}={}\n".format(self.MINER_MAC, config.miner.mac))
 
         bool_attributes = (
             'factory_reset',
@@ -962,9 +1528,87 @@ class Builder:
             'sd_boot'
         )
         for attribute in bool_attributes:
-            if self._config.uenv.get(attribute, 'no') == 'yes':
+            if config.uenv.get(attribute, 'no') == 'yes':
                 stream.write("{}=yes\n".format(attribute))
 
+    def _skip_unchanged(self) -> bool:
+        """
+        Check if writing of images which are already present on the device should be skipped
+
+        :return:
+            True when unchanged partitions are not written.
+        """
+        return self._config.snapshot().deploy.get('skip_unchanged', 'no') == 'yes'
+
+    @staticmethod
+    def _get_remote_hash(ssh, command: str, size: int) -> str:
+        """
+        Return SHA-256 digest of remote data
+
+        :param ssh:
+            Connected SSH client.
+        :param command:
+            Remote command which writes data to the standard output.
+        :param size:
+            Number of bytes used for digest computation.
+        :return:
+            String with hexadecimal digest or None when remote digest cannot be computed.
+        """
+        try:
+            stdout, _ = ssh.run('{} | head -c {} | sha256sum'.format(command, size))
+        except subprocess.CalledProcessError:
+            return None
+        return next(iter(stdout.read().decode().split()), None)
+
+    @staticmethod
+    def _get_mtd_device(ssh, name: str) -> str:
+        """
+        Return path to MTD device for partition name
+
+        :param ssh:
+            Connected SSH client.
+        :param name:
+            Name of NAND partition.
+        :return:
+            String with path to MTD device or None when the partition does not exist.
+        """
+        stdout, _ = ssh.run('cat', '/proc/mtd')
+        for line in stdout.read().decode().splitlines():
+            # line has format 'mtd0: 00080000 00020000 "boot"'
+            device, _, info = line.partition(':')
+            if info.split()[-1:] == ['"{}"'.format(name)]:
+                return '/dev/' + device
+        return None
+
+    def _mtd_unchanged(self, ssh, image_path: str, device: str, offset: int=0, compress: bool=False) -> bool:
+        """
+        Check if remote NAND partition already contains the image
+
+        :param ssh:
+            Connected SSH client.
+        :param image_path:
+            Path to local image file.
+        :param device:
+            Name of NAND partition or path to MTD device.
+        :param offset:
+            Skip the first n bytes of partition.
+        :param compress:
+            The image is written compressed with gzip.
+        :return:
+            True when partition content is the same as the image.
+        """
+        image_hash, image_size = get_image_hash(image_path, compress=compress)
+        mtd_device = device if device.startswith('/dev/') else self._get_mtd_device(ssh, device)
+        if not mtd_device:
+            return False
+        remote_hash = self._get_remote_hash(ssh, 'nanddump -q -s {} -l {} {}'.format(offset, image_size, mtd_device),
+                                            image_size)
+        unchanged = remote_hash == image_hash
+        if unchanged:
+            logging.info("Skipping '{}' because NAND partition '{}' is unchanged..."
+                         .format(os.path.basename(image_path), device))
+        return unchanged
+
     def _mtd_write(self, ssh, image_path: str, device: str, offset: int=0, compress: bool=False, erase: bool=True):
         """
         Write image to remote NAND partition
@@ -988,9 +1632,11 @@ class Builder:
         if offset:
             command.extend(('-p', str(offset)))
         command.extend(('write', '-', device))
-        with open(image_path, "rb") as image_file, ssh.pipe(command) as remote:
+        step = 'write {} to {}'.format(os.path.basename(image_path), device)
+        with self._report.measure('mtd', step) as measurement, open(image_path, "rb") as image_file, \
+                ssh.pipe(command, counter=measurement.add) as remote:
             if compress:
-                remote.stdin.write(gzip.compress(image_file.read()))
+                copy_compressed(image_file, remote.stdin)
             else:
                 shutil.copyfileobj(image_file, remote.stdin)
 
@@ -1040,10 +1686,11 @@ class Builder:
         :excluded:
             Dictionary with excluded attributes.
         """
+        config = self._config.snapshot()
         for name, path, default in self.MINER_CFG_INPUT:
             if name in excluded:
                 continue
-            value = self._config.get(path)
+            value = config.get(path)
             if value is None:
                 if default is None:
                     logging.error("Missing miner configuration for '{}' in '{}'".format(name, path))
@@ -1068,6 +1715,8 @@ class Builder:
             (image.uboot, 'uboot')
         )
         for local, mtd in boot_images:
+            if self._skip_unchanged() and self._mtd_unchanged(ssh, local, mtd):
+                continue
             logging.info("Writing '{}' to NAND partition '{}'...".format(os.path.basename(local), mtd))
             self._mtd_write(ssh, local, mtd)
 
@@ -1093,11 +1742,13 @@ class Builder:
         if recovery:
             upload.append((image.factory, 'factory.bin'))
 
-        for local, remote in upload:
-            compress = remote in compressed
-            if compress:
-                remote += '.gz'
-            upload_manager.put(local, remote, compress)
+        # transferred data are counted by steps of upload manager
+        with self._report.measure('images', 'upload {} images'.format(len(upload))):
+            for local, remote in upload:
+                compress = remote in compressed
+                if compress:
+                    remote += '.gz'
+                upload_manager.put(local, remote, compress)
 
     def _deploy_ssh_sd(self, ssh, sftp, image, recovery: bool):
         """
@@ -1112,13 +1763,16 @@ class Builder:
         :param recovery:
             Transfer recovery images.
         """
+        report = self._report
+
         class UploadManager:
             def __init__(self, sftp):
                 self.sftp = sftp
 
             def put(self, src, dst, compress=False):
                 logging.info("Uploading '{}'...".format(dst))
-                self.sftp.put(src, dst)
+                with report.measure('upload', dst, os.path.getsize(src)):
+                    self.sftp.put(src, dst)
 
         ssh.run('mount', '/dev/mmcblk0p1', '/mnt')
         sftp.chdir('/mnt')
@@ -1143,6 +1797,15 @@ class Builder:
 
         self._write_nand_uboot(ssh, image)
 
+        recovery_images = (
+            (image.kernel, 0, False),
+            (image.factory, 0x800000, True),
+            (image.fpga, 0x1400000, True)
+        )
+        if self._skip_unchanged() and all(self._mtd_unchanged(ssh, local, mtd_name, offset, compress)
+                                          for local, offset, compress in recovery_images):
+            return
+
         # erase device before formating
         ssh.run('mtd', 'erase', mtd_name)
 
@@ -1185,37 +1848,50 @@ class Builder:
         if self._config.deploy.write_bitstream == 'yes':
             mtds = (self._get_bitstream_mtd_name(i) for name, i in firmwares if name in targets)
             for mtd_name in mtds:
+                if self._skip_unchanged() and self._mtd_unchanged(ssh, image.fpga, mtd_name, compress=True):
+                    continue
                 logging.info("Writing bitstream for platform '{}' to NAND partition '{}'..."
                              .format(platform, mtd_name))
                 self._mtd_write(ssh, image.fpga, mtd_name, compress=True)
 
-        mtds = ((name[5:], self._get_firmware_mtd(i)) for name, i in firmwares if name in targets)
-        for firmware, mtd in mtds:
-            if self._config.deploy.factory_image == 'yes':
+        mtds = [(name[5:], self._get_firmware_mtd(i)) for name, i in firmwares if name in targets]
+        if self._config.deploy.factory_image == 'yes':
+            # erase all devices before formating at once
+            ssh.run_batch(['mtd', 'erase', mtd] for _, mtd in mtds)
+            image_size = os.path.getsize(image.factory)
+            for firmware, mtd in mtds:
                 logging.info("Formating '{}' ({}) with 'factory.bin'...".format(firmware, mtd))
-                # erase device before formating
-                ssh.run('mtd', 'erase', mtd)
                 # use factory image which deletes overlay data from UBIFS
-                image_size = os.path.getsize(image.factory)
                 with open(image.factory, "rb") as image_file:
                     with ssh.pipe('ubiformat', mtd, '-f', '-', '-S', str(image_size)) as remote:
                         shutil.copyfileobj(image_file, remote.stdin)
-            else:
-                logging.info("Updating '{}' ({}) volumes with 'sysupgrade.tar'...".format(firmware, mtd))
-                # use sysupgrade image which preserves overlay data from UBIFS
-                ssh.run('ubiattach', '-p', mtd)
-                volume_images = (
-                    ('kernel', 'sysupgrade-miner-nand/kernel', '/dev/ubi0_0'),
-                    ('rootfs', 'sysupgrade-miner-nand/root', '/dev/ubi0_1')
-                )
-                for volume_name, volume_image, device in volume_images:
-                    logging.info("Updating volume '{}' ({}) with '{}'...".format(volume_name, device, volume_image))
-                    with tarfile.open(image.sysupgrade, 'r') as sysupgrade_file:
-                        image_info = sysupgrade_file.getmember(volume_image)
-                        image_file = sysupgrade_file.extractfile(image_info)
-                        with ssh.pipe('ubiupdatevol', device, '-', '-s', str(image_info.size)) as remote:
-                            shutil.copyfileobj(image_file, remote.stdin)
-                ssh.run('ubidetach', '-p', mtd)
+            return
+
+        # detaching of previous firmware is batched with attaching of the next one
+        detach = []
+        for firmware, mtd in mtds:
+            logging.info("Updating '{}' ({}) volumes with 'sysupgrade.tar'...".format(firmware, mtd))
+            # use sysupgrade image which preserves overlay data from UBIFS
+            ssh.run_batch(detach + [['ubiattach', '-p', mtd]])
+            detach = [['ubidetach', '-p', mtd]]
+            volume_images = (
+                ('kernel', 'sysupgrade-miner-nand/kernel', '/dev/ubi0_0'),
+                ('rootfs', 'sysupgrade-miner-nand/root', '/dev/ubi0_1')
+            )
+            for volume_name, volume_image, device in volume_images:
+                if self._skip_unchanged():
+                    image_hash, image_size = get_image_hash(image.sysupgrade, member=volume_image)
+                    if self._get_remote_hash(ssh, 'cat {}'.format(device), image_size) == image_hash:
+                        logging.info("Skipping volume '{}' ({}) because it is unchanged..."
+                                     .format(volume_name, device))
+                        continue
+                logging.info("Updating volume '{}' ({}) with '{}'...".format(volume_name, device, volume_image))
+                with tarfile.open(image.sysupgrade, 'r') as sysupgrade_file:
+                    image_info = sysupgrade_file.getmember(volume_image)
+                    image_file = sysupgrade_file.extractfile(image_info)
+                    with ssh.pipe('ubiupdatevol', device, '-', '-s', str(image_info.size)) as remote:
+                        shutil.copyfileobj(image_file, remote.stdin)
+        ssh.run_batch(detach)
 
     def _config_ssh_sd(self, ssh, sftp, recovery: bool):
         """
@@ -1274,12 +1950,18 @@ class Builder:
             with ssh.pipe('mtd', 'write', '-', 'miner_cfg') as remote:
                 remote.stdin.write(output)
 
+        # all remaining changes are run as one batch of remote commands and reported only when the batch succeeds
+        commands = []
+        messages = []
+
         # change miner configuration in U-Boot env
         if self._config.deploy.set_miner_env == 'yes' and self._config.deploy.reset_uboot_env == 'no':
-            logging.info("Writing miner configuration to U-Boot env in NAND...")
-            ssh.run('fw_setenv', self.MINER_MAC, self._config.miner.mac)
-            ssh.run('fw_setenv', self.MINER_HWID, self._config.miner.hwid)
-            ssh.run('fw_setenv', self.MINER_FIRMWARE, str(self._config.miner.firmware))
+            messages.append("Miner configuration written to U-Boot env in NAND")
+            commands.append(ssh.get_setenv_cmd((
+                (self.MINER_MAC, self._config.miner.mac),
+                (self.MINER_HWID, self._config.miner.hwid),
+                (self.MINER_FIRMWARE, self._config.miner.firmware)
+            )))
 
         reset_uboot_env = self._config.deploy.reset_uboot_env == 'yes'
         reset_overlay = self._config.deploy.reset_overlay == 'yes'
@@ -1288,21 +1970,27 @@ class Builder:
 
         if ubi_attach:
             firmware_mtd = self._get_firmware_mtd(self._config.miner.firmware)
-            ssh.run('ubiattach', '-p', firmware_mtd)
+            commands.append(['ubiattach', '-p', firmware_mtd])
 
         if reset_uboot_env:
-            logging.info("Erasing NAND partition 'uboot_env'...")
-            ssh.run('mtd', 'erase', 'uboot_env')
+            messages.append("NAND partition 'uboot_env' erased")
+            commands.append(['mtd', 'erase', 'uboot_env'])
 
         # truncate overlay for current firmware
         if reset_overlay:
-            logging.info("Truncating UBI volume 'rootfs_data'...")
-            ssh.run('ubiupdatevol', '/dev/ubi0_2', '-t')
+            messages.append("UBI volume 'rootfs_data' truncated")
+            commands.append(['ubiupdatevol', '/dev/ubi0_2', '-t'])
 
         if ubi_attach:
-            ssh.run('ubidetach', '-p', firmware_mtd)
+            commands.append(['ubidetach', '-p', firmware_mtd])
+
+        if commands:
+            logging.info("Changing configuration in NAND...")
+        ssh.run_batch(commands)
+        for message in messages:
+            logging.info(message)
 
-    def _deploy_ssh(self, images, sd_config: bool, nand_config: bool):
+    def _deploy_ssh(self, images, sd_config: bool, nand_config: bool, interactive: bool=True):
         """
         Deploy NAND or SD card image over SSH connection
 
@@ -1320,29 +2008,37 @@ class Builder:
             Modify configuration files on SD card.
         :param nand_config:
             Modify configuration files/partitions on NAND.
+        :param interactive:
+            Prompt the user for SSH password when other authentication methods fail.
         """
-        hostname = self._config.deploy.ssh.get('hostname', None)
-        password = self._config.deploy.ssh.get('password', None)
-        username = self._config.deploy.ssh.username
+        ssh_config = self._config.snapshot().deploy.ssh
+        hostname = ssh_config.get('hostname', None)
+        password = ssh_config.get('password', None)
+        username = ssh_config.username
 
         if not hostname:
             # when hostname is not set, use standard name derived from MAC address
-            hostname_suffix = self._config.deploy.ssh.get('hostname_suffix', '')
+            hostname_suffix = ssh_config.get('hostname_suffix', '')
             hostname = self._get_hostname() + hostname_suffix
 
-        with SSHManager(hostname, username, password) as ssh:
-            sftp = ssh.open_sftp()
+        self._report = self._report.for_host(hostname)
 
+        # remember successful authentication method and keep connection open for subsequent deployments
+        auth_cache = os.path.join(self._build_dir, self.SSH_AUTH_CACHE)
+        with self._report.measure('deploy', 'total'), \
+                remote_ssh.SSHManager(hostname, username, password, keep_alive=True, auth_cache=auth_cache,
+                                      tracer=self._report.add, interactive=interactive) as ssh:
             image_sd = images.get('sd')
             image_nand_recovery = images.get('nand_recovery')
             image_nand = images.get('nand')
 
             sd_recovery = image_sd and isinstance(image_sd, ImageRecovery)
 
+            # SFTP session is opened only when it is needed
             if image_sd:
-                self._deploy_ssh_sd(ssh, sftp, image_sd, sd_recovery)
+                self._deploy_ssh_sd(ssh, ssh.sftp, image_sd, sd_recovery)
             if sd_config:
-                self._config_ssh_sd(ssh, sftp, sd_recovery)
+                self._config_ssh_sd(ssh, ssh.sftp, sd_recovery)
             if image_nand_recovery:
                 self._deploy_ssh_nand_recovery(ssh, image_nand_recovery)
             if image_nand:
@@ -1352,10 +2048,9 @@ class Builder:
 
             # reboot system if requested
             if self._config.deploy.reboot == 'yes':
+                ssh.forget()
                 ssh.run('reboot')
 
-            sftp.close()
-
     def _get_local_target_dir(self, dir_name: str):
         """
         Return path to local target directory
@@ -1462,12 +2157,12 @@ class Builder:
         """
         file_info = tar.gettarinfo(file_path, arcname=arcname)
 
-        with open(file_path, "rb") as image_file:
-            compressed_file = gzip.compress(image_file.read())
-            file_info.size = len(compressed_file)
-            compressed_file = io.BytesIO(compressed_file)
-
-        tar.addfile(file_info, compressed_file)
+        # tar header needs size of compressed file so it is compressed to temporary file first
+        with open(file_path, "rb") as image_file, tempfile.TemporaryFile() as compressed_file:
+            copy_compressed(image_file, compressed_file)
+            file_info.size = compressed_file.tell()
+            compressed_file.seek(0)
+            tar.addfile(file_info, compressed_file)
 
     def _create_dm_stage2(self, image):
         """
@@ -1600,6 +2295,36 @@ class Builder:
         upload_manager.put(upgrade, self.DM_UPGRADE_SCRIPT)
         upload_manager.put(requirements, self.DM_SCRIPT_REQUIREMENTS)
 
+        # restore script needs SSH module which is not packaged for the first version
+        scripts = [self.DM_UPGRADE_SCRIPT] + ([self.DM_RESTORE_SCRIPT] if version in [2, 3] else [])
+        self._check_dm_scripts(target_dir, scripts)
+
+    def _check_dm_scripts(self, target_dir: str, scripts):
+        """
+        Check that packaged upgrade scripts run only with modules from the same directory
+
+        The scripts import `ssh` and `hwid` as top-level modules so these modules must not depend on any other module
+        from this project.
+
+        :param target_dir:
+            Directory with packaged upgrade.
+        :param scripts:
+            List of script names which are run with `--help` argument.
+        """
+        modules = [name for name in os.listdir(target_dir) if name.endswith('.py')]
+        with tempfile.TemporaryDirectory() as check_dir:
+            for name in modules:
+                shutil.copy(os.path.join(target_dir, name), check_dir)
+            for script in scripts:
+                logging.debug("Checking packaged script '{}'...".format(script))
+                # environment variables are ignored so the project is not in the module search path
+                process = subprocess.run([sys.executable, '-B', '-E', script, '--help'], cwd=check_dir,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                if process.returncode:
+                    logging.error("Packaged script '{}' cannot run with modules {}:\n{}"
+                                  .format(script, ', '.join(sorted(modules)), process.stderr.decode(errors='replace')))
+                    raise BuilderStop
+
     def _deploy_local(self, images, sd_config: bool, sd_recovery_config: bool):
         """
         Deploy NAND or SD card image to local file system
@@ -1613,6 +2338,8 @@ class Builder:
         :param sd_recovery_config:
             Generate configuration files for recovery SD card version.
         """
+        report = self._report
+
         class UploadManager:
             def __init__(self, target_dir: str):
                 self.target_dir = target_dir
@@ -1622,8 +2349,9 @@ class Builder:
                 src_path = type(src) is str
                 src_file = open(src, 'rb') if src_path else src
                 dst_open = open if not compress else gzip.open
-                with dst_open(os.path.join(self.target_dir, dst), 'wb') as dst_file:
-                    shutil.copyfileobj(src_file, dst_file)
+                with report.measure('copy', dst) as measurement, \
+                        dst_open(os.path.join(self.target_dir, dst), 'wb') as dst_file:
+                    shutil.copyfileobj(src_file, measurement.writer(dst_file))
                 if src_path:
                     src_file.close()
 
@@ -1668,41 +2396,30 @@ class Builder:
         dst_feeds_index = os.path.join(target_dir, self.FEEDS_INDEX)
 
         # find package firmware meta information
-        with Packages(src_feeds_index) as src_packages:
-            firmware_package = next((package for package in src_packages
-                                     if package[self.FEEDS_ATTR_PACKAGE] == self.FEED_FIRMWARE), None)
+        with PackagesIndex(src_feeds_index) as src_packages:
+            firmware_package = src_packages.get(self.FEED_FIRMWARE)
         if not firmware_package:
             logging.error("Missing firmware package in '{}'".format(src_feeds_index))
             raise BuilderStop
 
-        # overwrite previous file
-        mode = 'w'
-
-        # prepare base feeds index
+        # merge base feeds index with new firmware record
         feeds_base = self._config.deploy.get('feeds_base', None)
-        if feeds_base:
-            # append to base file if file is not empty
-            if os.path.getsize(feeds_base) > 0:
-                shutil.copy(feeds_base, dst_feeds_index)
-                mode = 'a'
-
-        # create destination feeds index
-        with open(dst_feeds_index, mode) as dst_packages:
-            if mode == 'a':
-                # appending to previous index
-                dst_packages.write('\n')
-            for attribute, value in firmware_package.items():
-                if attribute not in self.FEEDS_EXCLUDED_ATTRIBUTES:
-                    dst_packages.write('{}: {}\n'.format(attribute, value))
+        feeds_keep = self._config.deploy.get('feeds_keep', 0) or 0
+        if not isinstance(feeds_keep, int) or feeds_keep < 0:
+            logging.error("Invalid number of kept firmware versions '{}' (it must be 0 or greater)".format(feeds_keep))
+            raise BuilderStop
+        firmware_record = OrderedDict((attribute, value) for attribute, value in firmware_package.items()
+                                      if attribute not in self.FEEDS_EXCLUDED_ATTRIBUTES)
+        result = merge_index(feeds_base or None, [firmware_record], dst_feeds_index, feeds_keep)
+        for name, version, _ in result.removed:
+            logging.info("Removed package '{}' version '{}' from feeds index".format(name, version))
+        logging.info("Created feeds index '{}' with {} packages (size {}, sha256 {})"
+                     .format(dst_feeds_index, result.count, result.size, result.digest))
 
         # sign the created index file
         usign = self._get_utility(self.LEDE_USIGN)
         self._run(usign, '-S', '-m', dst_feeds_index, '-s', local_feeds.key)
 
-        # compress signed index file
-        with open(dst_feeds_index, 'rb') as file_in, gzip.open(dst_feeds_index + '.gz', 'wb') as file_out:
-            shutil.copyfileobj(file_in, file_out)
-
         # copy firmware packages
         firmware_ipk = firmware_package[self.FEEDS_ATTR_FILENAME]
         src_package = os.path.join(local_feeds.packages, firmware_ipk)
@@ -1732,12 +2449,17 @@ class Builder:
                     factory=os.path.join(generic_dir, 'lede-{}-nand-squashfs-factory.bin'.format(platform))
                 )
 
-    def deploy(self):
+    def deploy(self, report: Report=None, interactive: bool=True):
         """
         Deploy Miner firmware to target platform
+
+        :param report:
+            Report object where all deploy steps are measured.
+        :param interactive:
+            Prompt the user for SSH password when other authentication methods fail.
         """
+        self._report = report or Report()
         platform = self._config.miner.platform
-        platform_target, _ = self._split_platform(platform)
         targets = self._config.deploy.targets
 
         logging.info("Start deploying Miner firmware...")
@@ -1850,7 +2572,7 @@ class Builder:
             if 'local_feeds' in targets:
                 feeds = ImageFeeds(
                     key=os.path.join(self._working_dir, self.BUILD_KEY_NAME),
-                    packages=os.path.join(self._working_dir, 'staging_dir', 'packages', platform_target),
+                    packages=self._get_packages_dir(),
                     sysupgrade=os.path.join(generic_dir, 'lede-{}-nand-squashfs-sysupgrade.tar'.format(platform))
                 )
                 images_feeds['local'] = feeds
@@ -1862,62 +2584,80 @@ class Builder:
         sd_recovery_config = 'local_sd_recovery_config' in targets
 
         if images_ssh or sd_config or nand_config:
-            self._deploy_ssh(images_ssh, sd_config, nand_config)
+            self._deploy_ssh(images_ssh, sd_config, nand_config, interactive)
         if images_local or sd_config_local or sd_recovery_config:
             self._deploy_local(images_local, sd_config_local, sd_recovery_config)
         if images_feeds:
             self._deploy_feeds(images_feeds)
 
-    def status(self):
+    def status(self, json_output: bool = False):
         """
         Show status of all repositories
 
-        It is equivalent of `git status` and shows all changes in related projects.
+        It is equivalent of `git status` and shows all changes in related projects. Status of all repositories is
+        obtained concurrently and it is printed in the order of configuration file.
+
+        :param json_output:
+            Print status as a JSON list for further processing instead of human readable output.
         """
-        def get_diff_path(diff):
-            if diff.change_type[0] == 'R':
-                return '{} -> {}'.format(diff.a_path, diff.b_path)
+        def get_change_path(change):
+            if change.orig_path:
+                return '{} -> {}'.format(change.orig_path, change.path)
             else:
-                return diff.a_path
+                return change.path
 
-        for name, repo in self._repos.items():
-            if not repo:
-                logging.warning("Status for '{}'".format(name))
+        statuses = repo_status.get_statuses((name, self._get_repo_path(name))
+                                            for name in self._config.snapshot().remote.repos)
+
+        if json_output:
+            json.dump([repo_status.get_status_dict(status) for status in statuses], sys.stdout, indent=2)
+            print()
+            return
+
+        for status in statuses:
+            if status.error:
+                logging.warning("Status for '{}'".format(status.name))
                 print('missing or corrupted repository')
                 print()
                 continue
 
-            working_dir = os.path.relpath(repo.working_dir, os.getcwd())
-            branch_name = repo.active_branch.name if not repo.head.is_detached else \
-                'HEAD detached at {}'.format(repo.head.object.hexsha[:8])
-            logging.info("Status for '{}': '{}' ({})".format(name, working_dir, branch_name))
-            clean = True
-            indexed_files = repo.head.commit.diff()
-            if len(indexed_files):
+            working_dir = os.path.relpath(status.path, os.getcwd())
+            branch_name = status.branch or 'HEAD detached at {}'.format((status.commit or '')[:8])
+            logging.info("Status for '{}': '{}' ({})".format(status.name, working_dir, branch_name))
+            if status.staged:
                 print('Changes to be committed:')
-                for indexed_file in indexed_files:
-                    change_type = indexed_file.change_type[0]
-                    print('\t{}'.format(change_type), colored(get_diff_path(indexed_file), 'green'))
+                for change in status.staged:
+                    print('\t{}'.format(change.change_type), colored(get_change_path(change), 'green'))
                 print()
-                clean = False
-            staged_files = repo.index.diff(None)
-            if len(staged_files):
+            if status.unstaged:
                 print('Changes not staged for commit:')
-                for staged_file in staged_files:
-                    change_type = staged_file.change_type[0]
-                    print('\t{}'.format(change_type), colored(get_diff_path(staged_file), 'red'))
+                for change in status.unstaged:
+                    print('\t{}'.format(change.change_type), colored(get_change_path(change), 'red'))
                 print()
-                clean = False
-            if len(repo.untracked_files):
+            if status.untracked:
                 print('Untracked files:')
-                for untracked_file in repo.untracked_files:
+                for untracked_file in status.untracked:
                     print(colored('\t{}'.format(untracked_file), 'red'))
                 print()
-                clean = False
-            if clean:
+            if not (status.staged or status.unstaged or status.untracked):
                 print('nothing to commit, working tree clean')
                 print()
 
+    def find_packages(self, packages):
+        """
+        Show images which include packages
+
+        Packages are searched in the lists of all images directly or through inheritance of base lists.
+
+        :param packages:
+            List of package names.
+        """
+        package_lists = self._get_package_lists()
+        prefix_length = len(self.PACKAGE_LIST_PREFIX)
+        for package in packages:
+            images = [name[prefix_length:] for name in package_lists.find(package, self.PACKAGE_LIST_PREFIX)]
+            print("{}: {}".format(package, ', '.join(images) if images else '-'))
+
     def debug(self):
         """
         Remotely run program on target platform and attach debugger to it
@@ -1969,7 +2709,95 @@ class Builder:
             # export PATH only if it has not been exported already
             sys.stdout.write('export PATH="${TOOLCHAIN}/bin:$PATH";\n')
 
-    def release(self):
+    def _get_release_config(self, platform: str, commits):
+        """
+        Return copy of current configuration with all repositories set to specific commits
+
+        :param platform:
+            Name of released platform.
+        :param commits:
+            Dictionary with commit of each repository.
+        :return:
+            Configuration object for release commit.
+        """
+        config = self._config.overlay()
+        config.miner.platform = platform
+        config_repos = config.remote.repos
+        del config.remote.branch
+
+        for name, commit_sha in commits.items():
+            logging.debug("Set repository '{}' to commit {}...".format(name, commit_sha))
+            config_repos.get(name).branch = commit_sha
+        return config
+
+    def _get_platform_remotes(self, platform: str):
+        """
+        Return remote repositories with URI and branch expanded for specific platform
+
+        :param platform:
+            Name of platform.
+        :return:
+            Ordered dictionary with remote named tuple for each repository name.
+        """
+        config = self._config.overlay()
+        config.miner.platform = platform
+        # the new builder expands all format tags for the platform
+        builder = Builder(config, self._argv)
+        return OrderedDict((remote.name, remote) for remote in RemoteWalker(builder._config.snapshot().remote))
+
+    def _get_release_commits(self, platforms):
+        """
+        Return commits of all repositories for each released platform
+
+        The repositories have the same remote URI for all platforms but their branches can differ (e.g. CGMiner has
+        branch for each subtarget family). The current platform uses commits checked out in its repositories and the
+        other branches are resolved from fetched remote references. Each distinct branch is resolved only once.
+
+        :param platforms:
+            List of released platforms.
+        :return:
+            Dictionary with ordered dictionary of commits for each platform.
+        """
+        current_remotes = self._get_platform_remotes(self._config.miner.platform)
+        resolved = {(name, remote.branch): self._get_repo(name).head.object.hexsha
+                    for name, remote in current_remotes.items()}
+        platform_commits = {}
+        for platform in platforms:
+            commits = platform_commits[platform] = OrderedDict()
+            for name, remote in self._get_platform_remotes(platform).items():
+                if remote.uri != current_remotes[name].uri:
+                    logging.error("Repository '{}' has different remote '{}' for platform '{}'"
+                                  .format(name, remote.uri, platform))
+                    raise BuilderStop
+                key = (name, remote.branch)
+                if key not in resolved:
+                    logging.debug("Resolving branch '{}' of repository '{}'...".format(remote.branch, name))
+                    resolved[key] = self._resolve_branch(name, remote.branch)
+                commits[name] = resolved[key]
+        return platform_commits
+
+    def _resolve_branch(self, name: str, branch: str) -> str:
+        """
+        Return commit of branch in repository without its checkout
+
+        :param name:
+            Name of repository.
+        :param branch:
+            Name of remote branch or commit.
+        :return:
+            Hexadecimal SHA of commit.
+        """
+        repo = self._get_repo(name)
+        for repo_remote in repo.remotes:
+            if branch in repo_remote.refs:
+                return repo_remote.refs[branch].commit.hexsha
+        try:
+            return repo.commit(branch).hexsha
+        except (git.BadName, ValueError):
+            logging.error("Cannot resolve branch '{}' of repository '{}'".format(branch, name))
+            raise BuilderStop
+
+    def release(self, platforms=None):
         """
         Create release branch in git based on current configuration
 
@@ -1977,14 +2805,21 @@ class Builder:
         * modify default YAML configuration so that all repositories points to the specific commit
         * create new commit with modified configuration
         * tag new commit with firmware version and push it upstream
+
+        When more platforms are released at once, all repositories are fetched only once and each distinct branch is
+        resolved only once. Each platform has its own release commit and tag and all tags are pushed together.
+
+        :param platforms:
+            List of released platforms. Only the current platform is released when it is omitted.
         """
+        platforms = platforms or [self._config.miner.platform]
         repo_meta = git.Repo()
 
         if repo_meta.is_dirty():
             logging.error("Meta repository is dirty!")
             raise BuilderStop
 
-        for name, repo in self._repos.items():
+        for name, repo in self._get_repos():
             if repo.is_dirty():
                 logging.error("Repository '{}' is dirty!".format(name))
                 raise BuilderStop
@@ -1995,37 +2830,36 @@ class Builder:
         logging.debug("Fetching all tags from remote repository...")
         repo_meta.remotes.origin.fetch()
 
-        logging.debug("Detaching head from branch...")
-        repo_meta.head.reference = repo_meta.head.commit
+        logging.debug("Resolving commits of all repositories...")
+        base_commit = repo_meta.head.commit
+        platform_commits = self._get_release_commits(platforms)
 
-        logging.debug("Patching repository branches in config...")
-        config = copy.deepcopy(self._config)
-        config_repos = config.remote.repos
-        del config.remote.branch
+        fw_versions = []
+        for platform in platforms:
+            logging.debug("Detaching head from branch...")
+            repo_meta.head.reference = base_commit
 
-        for name, repo in self._repos.items():
-            commit_sha = repo.head.object.hexsha
-            logging.debug("Set repository '{}' to commit {}...".format(name, commit_sha))
-            config_repos.get(name).branch = commit_sha
+            logging.debug("Patching repository branches in config for platform '{}'...".format(platform))
+            config = self._get_release_config(platform, platform_commits[platform])
 
-        logging.info("Saving default configuration file to {}...".format(self.DEFAULT_CONFIG))
-        with open(self.DEFAULT_CONFIG, 'w') as default_config:
-            config.dump(default_config)
+            logging.info("Saving default configuration file to {}...".format(self.DEFAULT_CONFIG))
+            with open(self.DEFAULT_CONFIG, 'w') as default_config:
+                config.dump(default_config)
 
-        # always checkout all repositories to correct commit
-        config.remote.fetch_always = 'yes'
+            logging.debug("Creating new release commit...")
+            repo_meta.index.add([self.DEFAULT_CONFIG])
+            repo_meta.index.commit("[{}] Release "
+                                   "Firmware".format(platform))
 
-        logging.debug("Creating new release commit...")
-        repo_meta.index.add([self.DEFAULT_CONFIG])
-        repo_meta.index.commit("[{}] Release "
-                               "Firmware".format(self._config.miner.platform))
+            fw_version = '{}_{}_{}'.format(self.FEED_FIRMWARE,
+                                           platform,
+                                           self._get_firmware_version(platform))
+            logging.info("Creating new release tag '{}'...".format(fw_version))
+            repo_meta.create_tag(fw_version)
+            fw_versions.append(fw_version)
 
-        fw_version = '{}_{}_{}'.format(self.FEED_FIRMWARE,
-                                       self._config.miner.platform,
-                                       self._get_firmware_version())
-        logging.info("Creating new release tag '{}'...".format(fw_version))
-        repo_meta.create_tag(fw_version)
-        repo_meta.remotes.origin.push(fw_version)
+        logging.info("Pushing {} release tags...".format(len(fw_versions)))
+        repo_meta.remotes.origin.push(fw_versions)
 
         # return back to active branch
         meta_active_branch.checkout()
@@ -0,0 +1,205 @@
+# Copyright (C) 2018  Braiins Systems s.r.o.
+#
+# This file is part of Braiins Build System (BB).
+#
+# BB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+
+class Fingerprint:
+    """
+    Incremental hash of named build inputs
+    """
+    def __init__(self):
+        self._hash = hashlib.sha256()
+
+    def add(self, name: str, value):
+        """
+        Add named value to the fingerprint
+
+        :param name:
+            Name of build input.
+        :param value:
+            String or bytes with value of input.
+        """
+        if isinstance(value, str):
+            value = value.encode()
+        self._hash.update('{}\0{}\0'.format(name, len(value)).encode())
+        self._hash.update(value)
+
+    def add_file(self, name: str, path: str):
+        """
+        Add content of file to the fingerprint
+
+        :param name:
+            Name of build input.
+        :param path:
+            Path to file.
+        """
+        with open(path, 'rb') as input_file:
+            self.add(name, input_file.read())
+
+    def add_stat(self, name: str, path: str):
+        """
+        Add modification time and size of file to the fingerprint
+
+        :param name:
+            Name of build input.
+        :param path:
+            Path to file which may not exist.
+        """
+        try:
+            stat = os.stat(path)
+            self.add(name, '{}:{}'.format(stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            self.add(name, 'missing')
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+class ArtifactCache:
+    """
+    Local cache of build outputs addressed by fingerprint of build inputs
+
+    Each entry contains a copy of all output directories. Modification time of entry metadata is updated on each access and the
+    least recently used entries are removed when the cache exceeds its size limit.
+    """
+    ENTRY_INFO = '.entry.json'
+    TMP_SUFFIX = '.tmp'
+
+    def __init__(self, path: str, max_size: int):
+        """
+        Initialize cache
+
+        :param path:
+            Path to cache directory.
+        :param max_size:
+            Maximal size of all entries in bytes.
+        """
+        self._path = path
+        self._max_size = max_size
+
+    def _get_entry_path(self, key: str) -> str:
+        return os.path.join(self._path, key)
+
+    @staticmethod
+    def _get_dir_size(path: str) -> int:
+        size = 0
+        for dir_path, _, file_names in os.walk(path):
+            for name in file_names:
+                file_path = os.path.join(dir_path, name)
+                if not os.path.islink(file_path):
+                    size += os.path.getsize(file_path)
+        return size
+
+    def _get_entries(self):
+        """
+        Return list of all entries sorted from the least recently used
+
+        :return:
+            List of triples with last access time, size and key.
+        """
+        entries = []
+        for key in os.listdir(self._path):
+            info_path = os.path.join(self._get_entry_path(key), self.ENTRY_INFO)
+            try:
+                with open(info_path, 'r') as info_file:
+                    info = json.load(info_file)
+                entries.append((os.path.getmtime(info_path), info['size'], key))
+            except (OSError, ValueError, KeyError):
+                # incomplete entries and temporary directories are not part of the cache
+                continue
+        return sorted(entries)
+
+    def restore(self, key: str, dst_paths) -> bool:
+        """
+        Replace output directories with cached ones
+
+        :param key:
+            Fingerprint of build inputs.
+        :param dst_paths:
+            Dictionary with path to output directory for each name of output.
+        :return:
+            True when entry has been found and restored.
+        """
+        entry_path = self._get_entry_path(key)
+        info_path = os.path.join(entry_path, self.ENTRY_INFO)
+        if not os.path.isfile(info_path):
+            return False
+
+        logging.info("Restoring build output from cache entry '{}'...".format(key))
+        # mark entry as recently used
+        os.utime(info_path)
+        for name, dst_path in dst_paths.items():
+            tmp_path = dst_path + self.TMP_SUFFIX
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            src_path = os.path.join(entry_path, name)
+            if os.path.isdir(src_path):
+                shutil.copytree(src_path, tmp_path, symlinks=True)
+            shutil.rmtree(dst_path, ignore_errors=True)
+            if os.path.isdir(tmp_path):
+                os.rename(tmp_path, dst_path)
+        return True
+
+    def store(self, key: str, src_paths):
+        """
+        Store output directories to the cache and remove least recently used entries above size limit
+
+        :param key:
+            Fingerprint of build inputs.
+        :param src_paths:
+            Dictionary with path to output directory for each name of output. Missing directories are not stored.
+        """
+        entry_path = self._get_entry_path(key)
+        if os.path.isdir(entry_path):
+            return
+
+        src_paths = {name: src_path for name, src_path in src_paths.items() if os.path.isdir(src_path)}
+        size = sum(self._get_dir_size(src_path) for src_path in src_paths.values())
+        if size > self._max_size:
+            logging.warning("Build output is bigger than cache limit and it is not cached")
+            return
+
+        logging.info("Storing build output to cache entry '{}'...".format(key))
+        os.makedirs(self._path, exist_ok=True)
+        tmp_path = entry_path + self.TMP_SUFFIX
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, src_path in src_paths.items():
+            shutil.copytree(src_path, os.path.join(tmp_path, name), symlinks=True)
+        with open(os.path.join(tmp_path, self.ENTRY_INFO), 'w') as info_file:
+            json.dump({'size': size, 'created': time.time()}, info_file)
+        os.rename(tmp_path, entry_path)
+
+        self._evict()
+
+    def _evict(self):
+        """
+        Remove least recently used entries until the cache fits to its size limit
+        """
+        entries = self._get_entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total_size <= self._max_size:
+                break
+            logging.debug("Removing cache entry '{}'".format(key))
+            shutil.rmtree(self._get_entry_path(key), ignore_errors=True)
+            total_size -= size
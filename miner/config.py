@@ -16,16 +16,313 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import copy
+import hashlib
+import os
+import pickle
 
-from collections import namedtuple
-from ruamel import yaml
-from ruamel.yaml.comments import CommentedMap, CommentedSeq
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+from importlib import util as importlib_util
 
-YAML_DICT_TYPE = CommentedMap
-YAML_LIST_TYPE = CommentedSeq
+from miner.lazy import lazy_import
 
-EmptyDict = CommentedMap
-EmptyList = CommentedSeq
+# the YAML parser is slow to import and it is needed only when configuration is parsed or dumped
+yaml = lazy_import('ruamel.yaml')
+yaml_comments = lazy_import('ruamel.yaml.comments')
+
+# parsed configuration consists of `ruamel.yaml` types with comments and configuration loaded from cache consists of
+# plain ordered dictionaries and lists so nodes are recognized by their base types
+YAML_DICT_TYPE = dict
+YAML_LIST_TYPE = list
+YAML_NODE_TYPES = (YAML_DICT_TYPE, YAML_LIST_TYPE)
+
+EmptyDict = OrderedDict
+EmptyList = list
+
+# directory with parsed configuration files (it can be changed or disabled by empty value in environment variable)
+CACHE_DIR_ENV = 'BB_CONFIG_CACHE'
+CACHE_DIR_DEFAULT = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join('~', '.cache')), 'bb', 'config')
+
+
+class _Template:
+    """
+    Configuration string with format tags which is expanded on first access
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value: str):
+        self.value = value
+
+
+class ConfigView:
+    """
+    Read-only snapshot of configuration with resolved values
+
+    All nested dictionaries and lists are converted only once when the snapshot is created and strings with format tags
+    are expanded on first access so repeated reading of the same attribute does not allocate any new object.
+    The interface for reading is the same as in `ConfigWrapper`.
+    """
+    __slots__ = ('path', '_items', '_formatter')
+
+    def __init__(self, root, path='', formatter=None):
+        """
+        Create snapshot of `YAML` list or dictionary
+
+        :param root:
+            `YAML` root list or dictionary.
+        :param path:
+            Current path to this root attribute.
+        :param formatter:
+            Callable object which is called to format string value where '{' is found.
+        """
+        if isinstance(root, YAML_DICT_TYPE):
+            items = OrderedDict((key, self._compile(value, self._join_path(path, key), formatter))
+                                for key, value in root.items())
+        else:
+            items = [self._compile(value, '{}[{}]'.format(path, index), formatter)
+                     for index, value in enumerate(root)]
+        object.__setattr__(self, 'path', path)
+        object.__setattr__(self, '_items', items)
+        object.__setattr__(self, '_formatter', formatter)
+
+    @staticmethod
+    def _join_path(path: str, attribute) -> str:
+        return str(attribute) if not path else '{}.{}'.format(path, attribute)
+
+    @staticmethod
+    def _compile(value, path: str, formatter):
+        if isinstance(value, YAML_NODE_TYPES):
+            return ConfigView(value, path, formatter)
+        if formatter and type(value) is str and '{' in value:
+            return _Template(value)
+        return value
+
+    def _resolve(self, key):
+        """
+        Return value of item and expand its format tags when it is accessed for the first time
+        """
+        value = self._items[key]
+        if type(value) is _Template:
+            value = self._formatter(value.value)
+            self._items[key] = value
+        return value
+
+    def _is_dict(self) -> bool:
+        return type(self._items) is OrderedDict
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Configuration view '{}' is read-only".format(self.path))
+
+    def __delattr__(self, item):
+        raise AttributeError("Configuration view '{}' is read-only".format(self.path))
+
+    def __str__(self) -> str:
+        return str(self._items)
+
+    def __getattr__(self, item: str):
+        """
+        Access to dictionary key with object attribute
+
+        :param item:
+            The name of attribute.
+        :return:
+            Resolved value or nested ConfigView object.
+        """
+        # private attributes are never looked up in configuration (e.g. uninitialized slots)
+        result = self._items.get(item) if item[0] != '_' and type(self._items) is OrderedDict else None
+        if type(result) is _Template:
+            result = self._resolve(item)
+        if result is None:
+            raise AttributeError("Configuration '{}' has no attribute '{}'".format(self.path, item))
+        return result
+
+    def __getitem__(self, item):
+        """
+        Access configuration as an array
+
+        :param item:
+            The name of attribute or index to the list.
+        :return:
+            Resolved value or nested ConfigView object.
+        """
+        if self._is_dict():
+            result = self._resolve(item) if item in self._items else None
+            if result is None:
+                raise KeyError("Configuration '{}' has no attribute '{}'".format(self.path, item))
+            return result
+        elif type(item) is not int:
+            raise TypeError('list indices must be integers, not {}'.format(str(type(item))))
+        elif item < len(self._items):
+            return self._resolve(item)
+        else:
+            raise IndexError("Configuration '{}' index out of range".format(self.path))
+
+    def __iter__(self):
+        """
+        Return iterator over keys of dictionary or values of list
+        """
+        if self._is_dict():
+            return iter(self._items)
+        return (self._resolve(index) for index in range(len(self._items)))
+
+    def __contains__(self, item):
+        """
+        Check if item is in the current configuration
+
+        :param item:
+            Key or value.
+        :return:
+            True when item is in the current configuration.
+        """
+        return item in self._items if self._is_dict() else item in iter(self)
+
+    def get_item(self, item, default=None):
+        """
+        Return value of item or default value when item is not set
+
+        :param item:
+            The name of attribute.
+        :param default:
+            Default value used when no value is set for specified item.
+        :return:
+            Value of item or default value when item is not set.
+        """
+        value = self._resolve(item) if item in self._items else None
+        return value if value is not None else default
+
+    def get(self, path, default=None):
+        """
+        Return value of item or default value when item is not set
+
+        :param path:
+            Path to the attribute specified by attributes separated by dot.
+        :param default:
+            Default value used when no value is set for specified item.
+        :return:
+            Value of item or default value when item is not set.
+        """
+        if not path:
+            raise AttributeError("Missing path to the configuration attrigute")
+        current = self
+        for item in path.split('.'):
+            if type(current) is not ConfigView or not current._is_dict():
+                return default
+            current = current.get_item(item)
+            if current is None:
+                return default
+        return current
+
+    def items(self):
+        """
+        Return generator object as an iterator
+
+        :return:
+            Items are pairs where is contain key and value.
+        """
+        keys = self._items.keys() if self._is_dict() else range(len(self._items))
+        return ((key, self._resolve(key)) for key in keys)
+
+
+def _copy_node(node):
+    """
+    Return shallow copy of `YAML` dictionary or list with the same comments and formatting
+    """
+    result = type(node)()
+    if isinstance(node, YAML_DICT_TYPE):
+        for key, value in node.items():
+            result[key] = value
+    else:
+        result.extend(node)
+    # comments are shared because the wrapper never modifies them (only deletion of list items shifts them)
+    if hasattr(node, 'copy_attributes'):
+        node.copy_attributes(result)
+    return result
+
+
+def _construct_ordered_map(loader, node):
+    """
+    Construct `YAML` mapping as ordered dictionary so the order of keys is kept also with older Python
+    """
+    data = OrderedDict()
+    yield data
+    loader.flatten_mapping(node)
+    data.update(loader.construct_pairs(node))
+
+
+@lru_cache(maxsize=None)
+def _get_fast_loader():
+    """
+    Return `YAML` loader without round-trip data which builds plain ordered dictionaries and lists
+
+    :return:
+        Safe loader class implemented in C when the extension of parser is available.
+    """
+    loader = type('FastLoader', (getattr(yaml, 'CSafeLoader', yaml.SafeLoader),), {})
+    loader.add_constructor('tag:yaml.org,2002:map', _construct_ordered_map)
+    return loader
+
+
+def _to_yaml(node):
+    """
+    Return copy of dictionary or list converted to `ruamel.yaml` types with the same comments and formatting
+    """
+    if isinstance(node, YAML_DICT_TYPE):
+        result = yaml_comments.CommentedMap((key, _to_yaml(value)) for key, value in node.items())
+    elif isinstance(node, YAML_LIST_TYPE):
+        result = yaml_comments.CommentedSeq(_to_yaml(value) for value in node)
+    else:
+        return node
+    if hasattr(node, 'copy_attributes'):
+        node.copy_attributes(result)
+    return result
+
+
+class _ConfigState:
+    """
+    State shared by all wrappers of the same configuration tree
+
+    The tree can share its nodes with other trees created by `ConfigWrapper.overlay`. Shared nodes are never modified
+    and they are copied on first write together with all their predecessors. Nodes which have been copied or added
+    by this tree are owned by the tree and they are modified in place.
+
+    It also holds snapshots which are invalidated whenever the configuration is modified through any wrapper.
+    """
+    __slots__ = ('root', 'owned', 'version', 'views')
+
+    def __init__(self, root):
+        self.root = root
+        # None means that all nodes are owned by this tree
+        self.owned = None
+        # incremented whenever any node of the tree is replaced by its copy
+        self.version = 0
+        self.views = {}
+
+    def __deepcopy__(self, memo):
+        # copy of configuration owns all its nodes and has its own snapshots
+        return _ConfigState(copy.deepcopy(self.root, memo))
+
+    def share(self):
+        """
+        Mark all current nodes as shared with another tree
+        """
+        self.owned = {}
+
+    def is_owned(self, node) -> bool:
+        return self.owned is None or id(node) in self.owned
+
+    def own(self, node):
+        """
+        Mark new node as owned by this tree
+
+        :param node:
+            New `YAML` dictionary or list or any other value.
+        :return:
+            The same node.
+        """
+        if self.owned is not None and isinstance(node, YAML_NODE_TYPES):
+            # reference to node is kept to prevent reuse of its id
+            self.owned[id(node)] = node
+        return node
 
 
 class ConfigWrapper:
@@ -34,7 +331,7 @@ class ConfigWrapper:
     """
     Class to simplify access to `YAML` configuration object
     """
-    def __new__(cls, root, path='', formatter=None):
+    def __new__(cls, root, path='', formatter=None, state=None, keys=()):
         """
         Create ConfigWrapper object or return original `root` object
 
@@ -44,18 +341,22 @@ class ConfigWrapper:
             Current path to this root attribute.
         :param formatter:
             Callable object which is called to format string value where '{' is found.
+        :param state:
+            State shared by all wrappers of the same configuration tree.
+        :param keys:
+            Keys of all nodes from the root of configuration tree to this node.
         :return:
             If root is not `YAML` dictionary or list then return its original value otherwise return root wrapped in
             `ConfigWraper`.
         """
-        if type(root) not in (YAML_DICT_TYPE, YAML_LIST_TYPE):
+        if not isinstance(root, YAML_NODE_TYPES):
             if formatter and type(root) is str and '{' in root:
                 root = formatter(root)
             return root
         else:
             return super().__new__(cls)
 
-    def __init__(self, root, path='', formatter=None):
+    def __init__(self, root, path='', formatter=None, state=None, keys=()):
         """
         Initialize ConfigWrapper object
 
@@ -65,10 +366,15 @@ class ConfigWrapper:
             Current path to this root attribute.
         :param formatter:
             Callable object which is called to format string value where '{' is found.
+        :param state:
+            State shared by all wrappers of the same configuration tree.
+        :param keys:
+            Keys of all nodes from the root of configuration tree to this node.
         """
-        self._root = root
-        self.path = path
-        self.formatter = formatter
+        state = state or _ConfigState(root)
+        # wrappers are created on each access so attributes are set directly without calling __setattr__
+        self.__dict__.update(_root=root, path=path, formatter=formatter, _state=state, _keys=keys,
+                             _version=state.version)
 
         # special attribute to mark initialized object have to be set last
         setattr(self, self.INITIALIZED, True)
@@ -89,11 +395,74 @@ class ConfigWrapper:
         setattr(result, result.INITIALIZED, True)
         return result
 
+    def overlay(self):
+        """
+        Return new configuration layered on top of this one
+
+        Both configurations share all nodes and they are copied only when they are modified in any of them so the new
+        configuration is created in constant time and its modifications are not visible in this one and vice versa.
+
+        :return:
+            ConfigWrapper object with the root of new configuration.
+        """
+        state = self._state
+        state.share()
+        overlay_state = _ConfigState(state.root)
+        overlay_state.share()
+        return ConfigWrapper(state.root, formatter=self.formatter, state=overlay_state)
+
+    def _node(self):
+        """
+        Return current node of this wrapper
+
+        The node is looked up again from the root of configuration tree when it has been replaced by its copy.
+        """
+        state = self._state
+        if self._version != state.version:
+            node = state.root
+            try:
+                for key in self._keys:
+                    node = node[key]
+            except (KeyError, IndexError, TypeError):
+                # the node has been removed from configuration tree
+                node = self._root
+            self.__dict__['_root'] = node
+            self.__dict__['_version'] = state.version
+        return self._root
+
+    def _writable_node(self):
+        """
+        Return node of this wrapper which can be modified
+
+        Shared nodes on the path from the root of configuration tree are replaced by their copies.
+        """
+        state = self._state
+        if state.owned is None:
+            return self._node()
+
+        copied = False
+        node = state.root
+        if not state.is_owned(node):
+            node = state.root = state.own(_copy_node(node))
+            copied = True
+        for key in self._keys:
+            child = node[key]
+            if not state.is_owned(child):
+                child = node[key] = state.own(_copy_node(child))
+                copied = True
+            node = child
+        if copied:
+            state.version += 1
+        self.__dict__['_root'] = node
+        self.__dict__['_version'] = state.version
+        return node
+
     def __delattr__(self, item):
         """
         Delete attribute from configuration
         """
-        del self._root[item]
+        del self._writable_node()[item]
+        self.invalidate()
 
     def __setattr__(self, key, value):
         """
@@ -106,7 +475,31 @@ class ConfigWrapper:
             # any class attributes are handled normally
             super().__setattr__(key, value)
         else:
-            self._root[key] = value
+            self._writable_node()[key] = self._state.own(value)
+        # changed formatter also changes expanded values
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Drop all snapshots of configuration tree after its modification
+        """
+        self._state.views.clear()
+
+    def snapshot(self) -> ConfigView:
+        """
+        Return read-only snapshot of current configuration with resolved values
+
+        The snapshot is created only once and it is shared until the configuration is modified through any of its
+        wrappers. The snapshot should not be stored for a long time because it does not reflect later modifications.
+
+        :return:
+            ConfigView object with the same interface for reading as the wrapper.
+        """
+        view = self._state.views.get(self._keys)
+        if view is None:
+            view = ConfigView(self._node(), self.path, self.formatter)
+            self._state.views[self._keys] = view
+        return view
 
     def _is_dict(self) -> bool:
         """
@@ -115,7 +508,7 @@ class ConfigWrapper:
         :return:
             True when root is `YAML` dictionary
         """
-        return type(self._root) is YAML_DICT_TYPE
+        return isinstance(self._node(), YAML_DICT_TYPE)
 
     def __str__(self) -> str:
         """
@@ -124,7 +517,7 @@ class ConfigWrapper:
         :return:
             String with configuration
         """
-        return str(self._root)
+        return str(self._node())
 
     def _join_attribute(self, attribute: str) -> str:
         """
@@ -137,6 +530,9 @@ class ConfigWrapper:
         """
         return attribute if not self.path else '.'.join((self.path, attribute))
 
+    def _wrap(self, value, key, path=''):
+        return ConfigWrapper(value, path=path, formatter=self.formatter, state=self._state, keys=self._keys + (key,))
+
     def __getattr__(self, item: str):
         """
         Access to dictionary key with object attribute
@@ -146,10 +542,11 @@ class ConfigWrapper:
         :return:
             ConfigWrapper object with value get from `YAML` dictionary.
         """
-        if self._is_dict():
-            result = self._root.get(item)
+        root = self._node()
+        if isinstance(root, YAML_DICT_TYPE):
+            result = root.get(item)
             if result is not None:
-                return ConfigWrapper(result, path=self._join_attribute(item), formatter=self.formatter)
+                return self._wrap(result, item, self._join_attribute(item))
         raise AttributeError("Configuration '{}' has no attribute '{}'".format(self.path, item))
 
     def __getitem__(self, item):
@@ -161,21 +558,22 @@ class ConfigWrapper:
         :return:
             ConfigWrapper object with value get from `YAML` dictionary or list.
         """
+        root = self._node()
         result = None
         path = None
-        if self._is_dict():
-            result = self._root.get(item)
+        if isinstance(root, YAML_DICT_TYPE):
+            result = root.get(item)
             if result is None:
                 raise KeyError("Configuration '{}' has no attribute '{}'".format(self.path, item))
             path = self._join_attribute(item)
         elif type(item) is not int:
             raise TypeError('list indices must be integers, not {}'.format(str(type(item))))
-        elif item < len(self._root):
-            result = self._root[item]
+        elif item < len(root):
+            result = root[item]
             path = '{}[{}]'.format(self.path, item)
         else:
             raise IndexError("Configuration '{}' index out of range".format(self.path))
-        return ConfigWrapper(result, path=path, formatter=self.formatter)
+        return self._wrap(result, item, path)
 
     def __iter__(self):
         """
@@ -184,7 +582,10 @@ class ConfigWrapper:
         :return:
             Items are objects ConfigWrapper or basic types when value is not `YAML` dictionary or list.
         """
-        return (ConfigWrapper(value, formatter=self.formatter) for value in self._root)
+        root = self._node()
+        if isinstance(root, YAML_DICT_TYPE):
+            return (self._wrap(key, key) for key in root)
+        return (self._wrap(value, index) for index, value in enumerate(root))
 
     def __contains__(self, item):
         """
@@ -195,7 +596,7 @@ class ConfigWrapper:
         :return:
             True when item is in the current configuration.
         """
-        return item in self._root
+        return item in self._node()
 
     def get_item(self, item, default=None):
         """
@@ -208,8 +609,9 @@ class ConfigWrapper:
         :return:
             Value of item or default value when item is not set.
         """
-        value = self._root[item] if item in self._root else None
-        return ConfigWrapper(value, formatter=self.formatter) if value is not None else default
+        root = self._node()
+        value = root[item] if item in root else None
+        return self._wrap(value, item) if value is not None else default
 
     def get(self, path, default=None):
         """
@@ -266,7 +668,8 @@ class ConfigWrapper:
         """
         Appends a passed item into the existing list
         """
-        self._root.append(ConfigWrapper(item))
+        self._writable_node().append(self._state.own(ConfigWrapper(item)))
+        self.invalidate()
 
     def items(self):
         """
@@ -275,8 +678,9 @@ class ConfigWrapper:
         :return:
             Items are pairs where is contain key and value.
         """
-        pairs = self._root.items() if self._is_dict() else enumerate(self._root)
-        return ((key, ConfigWrapper(value, formatter=self.formatter)) for key, value in pairs)
+        root = self._node()
+        pairs = root.items() if isinstance(root, YAML_DICT_TYPE) else enumerate(root)
+        return ((key, self._wrap(value, key)) for key, value in pairs)
 
     def dump(self, stream):
         """
@@ -287,54 +691,83 @@ class ConfigWrapper:
         :param stream:
             Opened stream for writing.
         """
-        yaml.dump(self._root, stream=stream, Dumper=yaml.RoundTripDumper)
+        # nodes from cache or added by wrapper are plain types which would be dumped with `!!omap` tag
+        yaml.dump(_to_yaml(self._node()), stream=stream, Dumper=yaml.RoundTripDumper)
 
 
-class ListWalker:
+class ListResolver:
     """
-    Iterator class for access list with inheritance based on `YAML` configuration
+    Resolver of all lists with inheritance based on `YAML` configuration
+
+    Each list is expanded only once and its items are shared by all lists which inherit from it. Duplicate items are
+    removed so only the first occurrence is kept.
     """
-    def __init__(self, root: ConfigWrapper, list_name: str):
+    def __init__(self, root):
         """
-        Initialize ListWalker for specified list
+        Initialize ListResolver for all lists in configuration
 
         :param root:
-            Configuration root where selected and base lists are searched.
+            Configuration root with lists in a form `{name: {base: [names], list: [items]}}`.
+        """
+        self._root = root.snapshot() if isinstance(root, ConfigWrapper) else root
+        self._lists = {}
+
+    def _resolve(self, list_name: str, chain):
+        items = self._lists.get(list_name)
+        if items is not None:
+            return items
+        if list_name in chain:
+            cycle = chain[chain.index(list_name):] + [list_name]
+            raise ValueError("Cyclic inheritance of lists '{}'".format(' -> '.join(cycle)))
+
+        list_node = self._root.get(list_name)
+        if not list_node:
+            raise AttributeError("Cannot find list base with the name '{}'".format(list_name))
+        chain.append(list_name)
+        items = OrderedDict()
+        for base_list in list_node.get('base', ()):
+            items.update((item, None) for item in self._resolve(base_list, chain))
+        items.update((item, None) for item in list_node.get('list', ()))
+        chain.pop()
+
+        items = tuple(items)
+        self._lists[list_name] = items
+        return items
+
+    def resolve(self, list_name: str):
+        """
+        Return all items of list and its predecessors
+
         :param list_name:
             Name of selected list.
+        :return:
+            Tuple with unique items in the order of their first occurrence.
         """
-        self._root = root
-        self._list_name = list_name
+        return self._resolve(list_name, [])
 
-    def _get_list(self, list_name: str):
+    def resolve_all(self, prefix: str=''):
         """
-        Generator for accessing all items from the list with inheritance
+        Resolve all lists with name starting with prefix
 
-        :param list_name:
-            Name of root list.
+        :param prefix:
+            Prefix of list names.
         :return:
-            Generator object with list iterator.
+            Dictionary with items of each list.
         """
-        list_node = self._root.get(list_name)
-        if not list_node:
-            raise AttributeError("Cannot find list base with the name '{}'".format(list_name))
-        base = list_node.get('base')
-        list = list_node.get('list')
-        if base:
-            for base_list in base:
-                yield from self._get_list(base_list)
-        if list:
-            for item in list:
-                yield item
+        return OrderedDict((name, self.resolve(name)) for name in self._root if name.startswith(prefix))
 
-    def __iter__(self):
+    def find(self, item, prefix: str=''):
         """
-        Return generator object as an iterator
+        Return names of lists which contain item directly or through inheritance
 
+        :param item:
+            Searched item (e.g. package name).
+        :param prefix:
+            Prefix of list names.
         :return:
-            Items are objects contained in the list and its predecessors.
+            List of names.
         """
-        yield from self._get_list(self._list_name)
+        return [name for name, items in self.resolve_all(prefix).items() if item in items]
 
 
 class RemoteWalker:
@@ -369,14 +802,65 @@ class RemoteWalker:
             yield self.Remote(name, repo.uri, branch, fetch)
 
 
-def load_config(path: str):
+def _get_cache_path(path: str):
+    """
+    Return path to cached parsed configuration file or None when the cache is disabled
+
+    The cache file is addressed by absolute path, modification time and size of configuration file and by version of
+    the `YAML` parser so any change of the file or parser creates a new cache entry.
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV, CACHE_DIR_DEFAULT)
+    if not cache_dir:
+        return None
+    stat = os.stat(path)
+    # the parser is identified by its installed module without importing it
+    parser_stat = os.stat(importlib_util.find_spec('ruamel.yaml').origin)
+    key = '{}\0{}\0{}\0{}'.format(os.path.abspath(path), stat.st_mtime_ns, stat.st_size, parser_stat.st_mtime_ns)
+    return os.path.join(os.path.expanduser(cache_dir), '{}.pickle'.format(hashlib.sha1(key.encode()).hexdigest()))
+
+
+def _load_cached(cache_path: str):
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            return pickle.load(cache_file)
+    except (OSError, pickle.PickleError, EOFError, AttributeError, ImportError):
+        return None
+
+
+def _save_cached(cache_path: str, root):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+        with open(tmp_path, 'wb') as cache_file:
+            pickle.dump(root, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except (OSError, pickle.PickleError):
+        # the cache is only an optimization
+        pass
+
+
+def load_config(path: str, round_trip: bool=False):
     """
     Load and return configuration file
 
+    Parsing of `YAML` with round-trip loader is slow so it is used only when the configuration is going to be saved
+    back (e.g. release) and the file is always parsed from its current content. Otherwise the file is parsed with safe
+    loader to plain ordered dictionaries and lists and the parsed tree is cached on disk and it is reused until the
+    configuration file is modified.
+
     :param path:
         Path to configuration file in `YAML` format.
+    :param round_trip:
+        Always parse the file with round-trip loader and do not use the cache.
     :return:
         ConfigWrapper object used for easier access to configuration attributes.
     """
-    with open(path, 'r') as ymlfile:
-        return ConfigWrapper(yaml.load(ymlfile, Loader=yaml.RoundTripLoader))
+    cache_path = None if round_trip else _get_cache_path(path)
+    root = cache_path and _load_cached(cache_path)
+    if root is None:
+        with open(path, 'r') as ymlfile:
+            root = yaml.load(ymlfile, Loader=yaml.RoundTripLoader if round_trip else _get_fast_loader())
+        if cache_path:
+            # plain types are loaded from cache without importing the parser
+            _save_cached(cache_path, root)
+    return ConfigWrapper(root)
@@ -17,6 +17,8 @@
 
 # global configuration set outside
 builder = None
+# repositories have been already cloned and checked out by previous run of doit
+repos_ready = False
 
 
 def _get_sub_task(name, generator, task_dep=None) -> dict:
@@ -55,7 +57,10 @@ def task_clone():
     Task responsible for initial cloning of all repositories
     """
     for clone_repo in builder.clone_repos():
-        yield _get_sub_task(None, clone_repo)
+        task = _get_sub_task(None, clone_repo)
+        if repos_ready:
+            task['uptodate'] = [True]
+        yield task
 
 
 def task_checkout():
@@ -63,7 +68,12 @@ def task_checkout():
     Task responsible for switching all repositories to requested branch or commit
     """
     for checkout_repo in builder.checkout_repos():
-        yield _get_sub_task(None, checkout_repo, ['clone'])
+        task = _get_sub_task(None, checkout_repo)
+        # each repository waits only for its own clone so they can be processed in parallel
+        task['task_dep'] = ['clone:{}'.format(task['name'])]
+        if repos_ready:
+            task['uptodate'] = [True]
+        yield task
 
 
 def task_prepare():
@@ -73,14 +83,15 @@ def task_prepare():
     yield _get_sub_task('feeds_conf', builder.prepare_feeds_conf(), ['checkout'])
     yield _get_sub_task('feeds_update', builder.prepare_feeds_update(), ['prepare:feeds_conf'])
 
-    feeds_tasks = []
+    # feeds are installed to the same LEDE tree so they are chained to run one by one even with parallel runner
+    feeds_task = 'prepare:feeds_update'
     for prepare_feeds in builder.prepare_feeds():
-        task = _get_sub_task(None, prepare_feeds, ['prepare:feeds_update'])
+        task = _get_sub_task(None, prepare_feeds, [feeds_task])
         task['name'] = 'feeds_install:{}'.format(task['name'])
-        feeds_tasks.append('prepare:{}'.format(task['name']))
+        feeds_task = 'prepare:{}'.format(task['name'])
         yield task
 
-    yield _get_sub_task('default_config', builder.prepare_default_config(), feeds_tasks)
+    yield _get_sub_task('default_config', builder.prepare_default_config(), [feeds_task])
     yield _get_sub_task('config', builder.prepare_config(), ['prepare:default_config'])
 
     for prepare_key in builder.prepare_keys():
@@ -0,0 +1,222 @@
+# Copyright (C) 2018  Braiins Systems s.r.o.
+#
+# This file is part of Braiins Build System (BB).
+#
+# BB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Fast detection of changes in a set of files specified by glob patterns
+
+Git working trees are checked by git itself which keeps stat information of all tracked files in its index and
+refreshes it in parallel. Other directories use persistent index with modification times of all directories so the
+list of matching files is gathered again only when some directory is changed.
+"""
+
+import fnmatch
+import hashlib
+import json
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from miner.lazy import lazy_import
+
+git = lazy_import('git')
+
+# number of threads used for stat of files when the index is cold
+STAT_JOBS = 16
+
+
+def _get_git_pathspec(pattern) -> str:
+    """
+    Convert pattern in a form of list of path components to git pathspec
+    """
+    return ':(glob){}'.format('/'.join(pattern))
+
+
+def _get_stat(path: str):
+    """
+    Return modification time and size of file or None when the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _get_git_fingerprint(path: str, patterns):
+    """
+    Return fingerprint of matching files in git working tree
+
+    The fingerprint consists of current commit and status of all matching files. Modified and untracked files are
+    also identified by their modification time and size so their next change is detected too.
+
+    :param path:
+        Path to root of git working tree.
+    :param patterns:
+        List of patterns in a form of list of path components.
+    :return:
+        String with fingerprint or None when path is not root of git working tree.
+    """
+    try:
+        repo = git.Repo(path)
+    except (git.exc.InvalidGitRepositoryError, git.exc.NoSuchPathError):
+        return None
+    if os.path.realpath(repo.working_tree_dir) != os.path.realpath(path):
+        return None
+
+    try:
+        head = repo.head.commit.hexsha
+    except ValueError:
+        # repository without any commit
+        head = None
+    status = repo.git.status('--porcelain', '-z', '--untracked-files=all', '--',
+                             *(_get_git_pathspec(pattern) for pattern in patterns))
+    digest = hashlib.sha256()
+    digest.update(str(head).encode())
+    entries = iter(status.split('\0'))
+    for entry in entries:
+        if not entry:
+            continue
+        digest.update(entry.encode())
+        digest.update(str(_get_stat(os.path.join(path, entry[3:]))).encode())
+        if 'R' in entry[:2] or 'C' in entry[:2]:
+            # renamed or copied entry is followed by its original path in a separate field
+            digest.update(next(entries, '').encode())
+    return 'git:{}'.format(digest.hexdigest())
+
+
+class FileStateIndex:
+    """
+    Persistent index with state of files matching glob patterns in a directory tree
+    """
+    def __init__(self, index_path: str, path: str, patterns):
+        """
+        Initialize index
+
+        :param index_path:
+            Path to file where the index is stored.
+        :param path:
+            Root of directory tree.
+        :param patterns:
+            List of patterns in a form of list of path components (`**` matches any number of directories).
+        """
+        self._index_path = index_path
+        self._path = path
+        self._patterns = [os.path.join(*pattern) for pattern in patterns]
+        self._dirs = {}
+        self._files = []
+
+    def _load(self):
+        try:
+            with open(self._index_path, 'r') as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return False
+        if index.get('path') != self._path or index.get('patterns') != self._patterns:
+            return False
+        self._dirs = index['dirs']
+        self._files = index['files']
+        return True
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self._index_path), exist_ok=True)
+        index = {
+            'path': self._path,
+            'patterns': self._patterns,
+            'dirs': self._dirs,
+            'files': self._files
+        }
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w') as index_file:
+            json.dump(index, index_file)
+        os.replace(tmp_path, self._index_path)
+
+    def _match(self, rel_path: str) -> bool:
+        for pattern in self._patterns:
+            if '**' not in pattern:
+                # `*` does not match path separator in glob patterns
+                if rel_path.count(os.sep) == pattern.count(os.sep) and fnmatch.fnmatch(rel_path, pattern):
+                    return True
+            elif fnmatch.fnmatch(rel_path, pattern):
+                return True
+            elif pattern.startswith('**' + os.sep) and fnmatch.fnmatch(rel_path, pattern[3:]):
+                # the leading `**` matches also the root directory
+                return True
+        return False
+
+    def _dirs_unchanged(self) -> bool:
+        """
+        Check that no file has been added, removed or renamed in any directory
+        """
+        for rel_dir, mtime in self._dirs.items():
+            try:
+                if os.stat(os.path.join(self._path, rel_dir)).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def _scan(self):
+        """
+        Walk the whole directory tree and gather all matching files
+        """
+        self._dirs = {}
+        self._files = []
+        for dir_path, dir_names, file_names in os.walk(self._path):
+            rel_dir = os.path.relpath(dir_path, self._path)
+            self._dirs[rel_dir] = os.stat(dir_path).st_mtime_ns
+            # hidden directories (e.g. .git) never contain configuration files
+            dir_names[:] = [name for name in dir_names if not name.startswith('.')]
+            for name in file_names:
+                rel_path = os.path.normpath(os.path.join(rel_dir, name))
+                if self._match(rel_path):
+                    self._files.append(rel_path)
+        self._files.sort()
+
+    def get_fingerprint(self) -> str:
+        """
+        Return fingerprint of all matching files
+
+        Directory tree is walked only when the index is missing or some directory has been changed. Otherwise only
+        stat of already known files is done in parallel.
+
+        :return:
+            String with hash of names, modification times and sizes of all matching files.
+        """
+        if not self._load() or not self._dirs_unchanged():
+            self._scan()
+            self._save()
+        with ThreadPoolExecutor(max_workers=STAT_JOBS) as executor:
+            stats = executor.map(_get_stat, (os.path.join(self._path, name) for name in self._files))
+            digest = hashlib.sha256()
+            for name, stat in zip(self._files, stats):
+                digest.update('{}\0{}\0'.format(name, stat).encode())
+        return 'stat:{}'.format(digest.hexdigest())
+
+
+def get_fingerprint(path: str, patterns, index_path: str) -> str:
+    """
+    Return fingerprint of files matching glob patterns in a directory tree
+
+    :param path:
+        Root of directory tree.
+    :param patterns:
+        List of patterns in a form of list of path components (`**` matches any number of directories).
+    :param index_path:
+        Path to persistent index used when the directory is not git working tree.
+    :return:
+        String which is changed whenever any matching file is added, removed or modified.
+    """
+    return _get_git_fingerprint(path, patterns) or FileStateIndex(index_path, path, patterns).get_fingerprint()
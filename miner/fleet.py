@@ -0,0 +1,149 @@
+# Copyright (C) 2018  Braiins Systems s.r.o.
+#
+# This file is part of Braiins Build System (BB).
+#
+# BB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import time
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from termcolor import colored
+
+
+class FleetError(Exception):
+    """
+    Exception raised when hosts file cannot be parsed
+    """
+    pass
+
+
+Host = namedtuple('Host', ['hostname', 'mac', 'hwid'])
+HostResult = namedtuple('HostResult', ['host', 'error', 'duration'])
+
+# placeholder for an empty column in hosts file
+EMPTY_COLUMN = '-'
+
+
+def load_hosts(path: str):
+    """
+    Load list of miners from hosts file
+
+    Each non-empty line describes one miner in a format `<hostname> [<mac> [<hwid>]]`. The columns are separated by
+    white spaces and `-` can be used for an omitted column. When hostname is omitted then it is derived from MAC
+    address. Everything after `#` is a comment.
+
+    :param path:
+        Path to hosts file.
+    :return:
+        List of named tuples with `hostname`, `mac` and `hwid` attribute.
+    """
+    hosts = []
+    with open(path, 'r') as hosts_file:
+        for line_number, line in enumerate(hosts_file, 1):
+            columns = line.split('#', 1)[0].split()
+            if not columns:
+                continue
+            if len(columns) > len(Host._fields):
+                raise FleetError("Too many columns on line {} in '{}'".format(line_number, path))
+            columns = [None if column == EMPTY_COLUMN else column for column in columns]
+            host = Host(*(columns + [None] * len(Host._fields))[:len(Host._fields)])
+            if not host.hostname and not host.mac:
+                raise FleetError("Missing hostname or MAC address on line {} in '{}'".format(line_number, path))
+            hosts.append(host)
+    return hosts
+
+
+def get_host_name(host) -> str:
+    """
+    Return printable name of miner
+
+    :param host:
+        Named tuple with miner description.
+    :return:
+        Hostname or MAC address when hostname is omitted.
+    """
+    return host.hostname or host.mac
+
+
+def _deploy_host(builder, host, report=None):
+    """
+    Deploy firmware to one miner and catch all errors
+
+    :param builder:
+        Builder configured for selected miner.
+    :param host:
+        Named tuple with miner description.
+    :param report:
+        Report object where all deploy steps are measured.
+    :return:
+        Named tuple with deployment result.
+    """
+    name = get_host_name(host)
+    error = None
+    start = time.monotonic()
+    logging.info("Deploying to '{}'...".format(name))
+    try:
+        # password cannot be prompted from concurrent threads so authentication failure fails only this miner
+        builder.deploy(report=report, interactive=False)
+    except Exception as e:
+        # any failure is reported in summary and does not stop deployment to other miners
+        error = str(e) or type(e).__name__
+        logging.error("Deploy to '{}' failed: {}".format(name, error))
+    else:
+        logging.info("Deploy to '{}' finished".format(name))
+    return HostResult(host, error, time.monotonic() - start)
+
+
+def deploy(get_builder, hosts, jobs: int, report=None):
+    """
+    Deploy firmware to all miners concurrently
+
+    Each miner has its own builder with own configuration so it also uses its own SSH connection.
+
+    :param get_builder:
+        Callable object which creates new builder for a miner described by named tuple passed as an argument.
+    :param hosts:
+        List of named tuples with miner description.
+    :param jobs:
+        Maximal number of miners deployed simultaneously.
+    :param report:
+        Report object where all deploy steps are measured.
+    :return:
+        List of named tuples with deployment results in the same order as hosts.
+    """
+    builders = [get_builder(host) for host in hosts]
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(partial(_deploy_host, report=report), builders, hosts))
+
+
+def print_summary(results):
+    """
+    Print summary table with deployment results
+
+    :param results:
+        List of named tuples with deployment results.
+    """
+    name_width = max((len(get_host_name(result.host)) for result in results), default=0)
+    failed = 0
+    print()
+    for result in results:
+        status = colored('OK', 'green') if not result.error else colored('FAILED', 'red')
+        print('{:<{}}  {:>7.1f}s  {}'.format(get_host_name(result.host), name_width, result.duration, status),
+              result.error or '')
+        failed += bool(result.error)
+    print()
+    print('{} miners deployed, {} failed'.format(len(results) - failed, failed))
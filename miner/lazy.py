@@ -0,0 +1,55 @@
+# Copyright (C) 2018  Braiins Systems s.r.o.
+#
+# This file is part of Braiins Build System (BB).
+#
+# BB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import importlib
+
+
+class LazyModule:
+    """
+    Module proxy which imports the module on first attribute access
+
+    Heavy modules (e.g. `git`, `paramiko` or `doit`) are needed only by some commands so they are not imported during
+    start of the build system.
+    """
+    def __init__(self, name: str):
+        """
+        Initialize proxy
+
+        :param name:
+            Absolute name of module.
+        """
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, item):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return getattr(module, item)
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    Return proxy of module which is imported on first use
+
+    :param name:
+        Absolute name of module.
+    :return:
+        Module proxy.
+    """
+    return LazyModule(name)
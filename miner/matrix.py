@@ -0,0 +1,169 @@
+# Copyright (C) 2018  Braiins Systems s.r.o.
+#
+# This file is part of Braiins Build System (BB).
+#
+# BB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import os
+import subprocess
+import sys
+import time
+
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from termcolor import colored
+
+# format tags which make build directory unique for each platform
+PLATFORM_TAGS = ['{platform}', '{subtarget}']
+# build directory name used when configured name is shared by more platforms
+PLATFORM_BUILD_NAME = '{platform}'
+
+MATRIX_DIR = '.matrix'
+
+PlatformResult = namedtuple('PlatformResult', ['platform', 'returncode', 'duration', 'log_path'])
+
+
+def get_platform_jobs(jobs: int, platforms) -> int:
+    """
+    Return number of make jobs for one platform when all platforms are built concurrently
+
+    :param jobs:
+        Total number of jobs available for the whole matrix.
+    :param platforms:
+        List of platforms.
+    :return:
+        Number of jobs for each platform.
+    """
+    return max(1, int(jobs) // max(1, len(platforms)))
+
+
+def write_platform_configs(config, platforms, jobs: int):
+    """
+    Write configuration file for each platform in the matrix
+
+    Each platform must have its own build directory to be built concurrently with other ones so default build name
+    `{target}` is changed to `{platform}`.
+
+    :param config:
+        Configuration object with all command line overrides.
+    :param platforms:
+        List of platforms.
+    :param jobs:
+        Number of make jobs for each platform.
+    :return:
+        Dictionary with paths to configuration files for each platform.
+    """
+    matrix_dir = os.path.join(os.path.abspath(config.build.dir), MATRIX_DIR)
+    os.makedirs(matrix_dir, exist_ok=True)
+
+    paths = OrderedDict()
+    for platform in platforms:
+        platform_config = config.overlay()
+        platform_config.miner.platform = platform
+        platform_config.build.jobs = jobs
+        if not any(tag in str(platform_config.build.name) for tag in PLATFORM_TAGS):
+            platform_config.build.name = PLATFORM_BUILD_NAME
+        paths[platform] = os.path.join(matrix_dir, '{}.yml'.format(platform))
+        with open(paths[platform], 'w') as config_file:
+            platform_config.dump(config_file)
+    return paths
+
+
+def _run_bb(config_path: str, args, log_file=None) -> int:
+    """
+    Run build system as a child process with platform configuration
+
+    :param config_path:
+        Path to platform configuration file.
+    :param args:
+        List of arguments with command.
+    :param log_file:
+        Opened file for output or None for standard output.
+    :return:
+        Return code of child process.
+    """
+    cmd = [sys.executable, os.path.abspath(sys.argv[0]), '--config', config_path] + list(args)
+    logging.debug("Running '{}'...".format(' '.join(cmd)))
+    return subprocess.call(cmd, stdout=log_file, stderr=subprocess.STDOUT if log_file else None)
+
+
+def prepare(config_paths) -> bool:
+    """
+    Prepare all platforms and download their sources one by one
+
+    Download directory is shared by all platforms so the sources are downloaded only once and concurrent builds
+    never write the same file.
+
+    :param config_paths:
+        Dictionary with paths to configuration files for each platform.
+    :return:
+        True when all platforms were successfully prepared.
+    """
+    for platform, config_path in config_paths.items():
+        logging.info("Preparing platform '{}'...".format(platform))
+        if _run_bb(config_path, ['prepare']) or _run_bb(config_path, ['build', '--download-only']):
+            logging.error("Preparation of platform '{}' failed".format(platform))
+            return False
+    return True
+
+
+def _build_platform(platform: str, config_path: str, args):
+    log_path = os.path.splitext(config_path)[0] + '.log'
+    logging.info("Building platform '{}' (log: '{}')...".format(platform, log_path))
+    start = time.monotonic()
+    with open(log_path, 'w') as log_file:
+        returncode = _run_bb(config_path, ['build'] + list(args), log_file)
+    duration = time.monotonic() - start
+    if returncode:
+        logging.error("Build of platform '{}' failed".format(platform))
+    else:
+        logging.info("Build of platform '{}' finished".format(platform))
+    return PlatformResult(platform, returncode, duration, log_path)
+
+
+def build(config_paths, args):
+    """
+    Build all platforms concurrently
+
+    :param config_paths:
+        Dictionary with paths to configuration files for each platform.
+    :param args:
+        List of additional arguments for build command.
+    :return:
+        List of named tuples with build results.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(config_paths))) as executor:
+        futures = [executor.submit(_build_platform, platform, config_path, args)
+                   for platform, config_path in config_paths.items()]
+        return [future.result() for future in futures]
+
+
+def print_summary(results):
+    """
+    Print summary table with build results
+
+    :param results:
+        List of named tuples with build results.
+    """
+    name_width = max((len(result.platform) for result in results), default=0)
+    failed = 0
+    print()
+    for result in results:
+        status = colored('OK', 'green') if not result.returncode else colored('FAILED', 'red')
+        print('{:<{}}  {:>8.1f}s  {}  {}'.format(result.platform, name_width, result.duration, result.log_path,
+                                                 status))
+        failed += bool(result.returncode)
+    print()
+    print('{} platforms built, {} failed'.format(len(results) - failed, failed))
@@ -15,8 +15,22 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import gzip
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+
 from itertools import chain
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
+
+ATTR_PACKAGE = 'Package'
+ATTR_VERSION = 'Version'
+ATTR_ARCHITECTURE = 'Architecture'
+
+MergeResult = namedtuple('MergeResult', ['count', 'removed', 'digest', 'size'])
 
 
 class Packages:
@@ -96,3 +110,301 @@ class Packages:
                 break
             # read the whole record
             yield self._get_package_record(chain((line,), self._input))
+
+
+class PackageRecord(Mapping):
+    """
+    Package record from feeds index with lazily decoded attributes
+
+    The record keeps only its raw bytes and attributes are decoded on first access. It has the same interface as
+    the ordered dictionary returned by `Packages` parser.
+    """
+    __slots__ = ('raw', '_attributes')
+
+    def __init__(self, raw: bytes):
+        """
+        Initialize record
+
+        :param raw:
+            Raw bytes of the whole record including trailing newline.
+        """
+        self.raw = raw
+        self._attributes = None
+
+    def _decode(self):
+        attributes = OrderedDict()
+        attribute = None
+        value = None
+        for line in self.raw.decode('utf-8').splitlines():
+            if not line:
+                continue
+            if not line[0].isspace():
+                if attribute:
+                    attributes[attribute] = value
+                attribute, value = line.split(': ', 1)
+                value = value.rstrip()
+            else:
+                # when line starts with space then previous attribute value continues
+                value = '{}\n{}'.format(value, line.rstrip())
+        if attribute:
+            attributes[attribute] = value
+        self._attributes = attributes
+        return attributes
+
+    def __getitem__(self, attribute):
+        return (self._attributes or self._decode())[attribute]
+
+    def __iter__(self):
+        return iter(self._attributes or self._decode())
+
+    def __len__(self):
+        return len(self._attributes or self._decode())
+
+
+class PackagesIndex:
+    """
+    Indexed parser of LEDE feeds index with packages
+
+    Plain index file is mapped to memory and compressed `Packages.gz` is decompressed at once. Only start offsets of
+    records with package names and versions are found by single regular expression scan when the index is opened so
+    lookup of package by its name is done in constant time and attributes are decoded only for returned records.
+    """
+    # each record starts with package name and version usually follows it (the rest of record is skipped when version
+    # is missing); the expression for records after the first one starts with newline which is much faster to scan
+    RECORD = rb'()Package: *(\S+)[ \t]*(?:\n[^\n]+)*?(?:\nVersion: *(\S+)|(?=\n\n)|\n?\Z)'
+    RE_FIRST_RECORD = re.compile(RECORD)
+    RE_RECORD = re.compile(b'\n' + RECORD)
+
+    def __init__(self, path):
+        """
+        Initialize parser with path to feeds index file
+
+        :param path:
+            File path to feeds index file (it is decompressed when it ends with `.gz`).
+        """
+        self._path = path
+        self._file = None
+        self._data = b''
+        # list of start offsets of all records
+        self._records = []
+        # dictionaries with offset of the first record for package name and pair of name and version
+        self._names = {}
+        self._versions = {}
+
+    def __enter__(self):
+        """
+        Open feeds index file and build index of all records
+
+        :return:
+            Feeds index parser.
+        """
+        if self._path.endswith('.gz'):
+            with gzip.open(self._path, 'rb') as input_file:
+                self._data = input_file.read()
+        else:
+            self._file = open(self._path, 'rb')
+            # empty file cannot be mapped to memory
+            if self._file.seek(0, 2):
+                self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._build_index()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """
+        Close previously opened feeds index file
+        """
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        if self._file:
+            self._file.close()
+        self._data = b''
+
+    def _build_index(self):
+        records = self._records
+        names = self._names
+        versions = self._versions
+        first_record = self.RE_FIRST_RECORD.match(self._data)
+        # names and versions are kept as bytes to avoid decoding of all records
+        for match in chain([first_record] if first_record else [], self.RE_RECORD.finditer(self._data)):
+            start, name, version = match.start(1), match.group(2), match.group(3)
+            records.append(start)
+            names.setdefault(name, start)
+            versions.setdefault((name, version), start)
+
+    def _get_record(self, start: int) -> PackageRecord:
+        end = self._data.find(b'\n\n', start)
+        return PackageRecord(bytes(self._data[start:end + 1 if end >= 0 else len(self._data)]))
+
+    def get(self, name: str, version: str=None):
+        """
+        Return record of package with specified name and optionally version
+
+        :param name:
+            Package name.
+        :param version:
+            Package version or None for the first record with specified name.
+        :return:
+            Package record or None when such package is not present in the index.
+        """
+        name = name.encode()
+        start = self._names.get(name) if version is None else self._versions.get((name, version.encode()))
+        return None if start is None else self._get_record(start)
+
+    def __contains__(self, name):
+        return name.encode() in self._names
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        """
+        Iterate through all package records in feeds index file
+
+        :return:
+            Package records with lazily decoded attributes.
+        """
+        return (self._get_record(start) for start in self._records)
+
+
+def get_record_key(record):
+    """
+    Return key which identifies package record in feeds index
+
+    :param record:
+        Package record with attributes.
+    :return:
+        Tuple with package name, version and architecture.
+    """
+    return record.get(ATTR_PACKAGE), record.get(ATTR_VERSION), record.get(ATTR_ARCHITECTURE)
+
+
+class IndexWriter:
+    """
+    Writer of feeds index which creates plain and gzipped file and computes SHA-256 digest at once
+
+    The files are written to temporary files in the same directory and they replace the output files only when all
+    records are written successfully. The output can therefore be the same file as the base index which is still
+    mapped to memory.
+    """
+    def __init__(self, path: str):
+        """
+        Initialize writer with path to feeds index file
+
+        :param path:
+            Path to plain feeds index file. The compressed file has the same path with `.gz` extension.
+        """
+        self._path = path
+        self._file = None
+        self._compressed_file = None
+        self._compressed = None
+        # pairs of temporary and output path
+        self._paths = []
+        self._count = 0
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def _create_temp_file(self, path: str):
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                         prefix='.{}.'.format(os.path.basename(path)))
+        self._paths.append((temp_path, path))
+        return os.fdopen(fd, 'wb')
+
+    def __enter__(self):
+        self._file = self._create_temp_file(self._path)
+        self._compressed_file = self._create_temp_file(self._path + '.gz')
+        # zero modification time makes compressed index reproducible
+        self._compressed = gzip.GzipFile(filename='', mode='wb', fileobj=self._compressed_file, mtime=0)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.close()
+        # gzip file object does not close underlying file
+        self._compressed.close()
+        self._compressed_file.close()
+        for temp_path, path in self._paths:
+            if exc_type is None:
+                # temporary files are created only with permissions for owner
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, path)
+            else:
+                os.remove(temp_path)
+
+    def write(self, data: bytes):
+        """
+        Write one package record to feeds index
+
+        :param data:
+            Raw bytes of record ending with newline. The records are separated by empty line.
+        """
+        if self._count:
+            data = b'\n' + data
+        self._file.write(data)
+        self._compressed.write(data)
+        self.hash.update(data)
+        self.size += len(data)
+        self._count += 1
+
+
+class _EmptyIndex(list):
+    """
+    Feeds index without any record used instead of missing base index
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+def merge_index(base_path, records, path: str, keep: int=0) -> MergeResult:
+    """
+    Merge base feeds index with new package records
+
+    Records of base index with the same package name, version and architecture as new records are replaced and
+    duplicate records of base index are removed (the last one is kept). Other records are copied without any
+    modification and new records are appended to the end of index. The output file is written, compressed and hashed
+    in one pass.
+
+    :param base_path:
+        Path to base feeds index file or None when the index contains new records only.
+    :param records:
+        List of new package records with attributes.
+    :param path:
+        Path to output feeds index file. It can be the same file as base feeds index.
+    :param keep:
+        Number of the last versions kept for packages with new records or 0 when all versions are kept.
+    :return:
+        Named tuple with number of written records, list of keys of removed records, hexadecimal digest and size of
+        output file.
+    """
+    if keep < 0:
+        raise ValueError("number of kept versions cannot be negative: {}".format(keep))
+    new_keys = [get_record_key(record) for record in records]
+    # ordered versions of packages with new records where the last one is the newest
+    versions = OrderedDict((name, OrderedDict()) for name, _, _ in new_keys)
+    removed = []
+
+    with PackagesIndex(base_path) if base_path else _EmptyIndex() as base_index, IndexWriter(path) as writer:
+        base_keys = [get_record_key(record) for record in base_index]
+        last_records = {key: i for i, key in enumerate(base_keys)}
+        for name, version, _ in chain(base_keys, new_keys):
+            if name in versions:
+                # move version to the end
+                versions[name].pop(version, None)
+                versions[name][version] = None
+        if keep:
+            versions = {name: set(list(name_versions)[-keep:]) for name, name_versions in versions.items()}
+
+        for i, record in enumerate(base_index):
+            key = base_keys[i]
+            name, version, _ = key
+            if key in new_keys or last_records[key] != i or (name in versions and version not in versions[name]):
+                removed.append(key)
+                continue
+            raw = record.raw
+            writer.write(raw if raw.endswith(b'\n') else raw + b'\n')
+        for record in records:
+            writer.write(''.join('{}: {}\n'.format(attribute, value) for attribute, value in record.items()).encode())
+
+    return MergeResult(len(base_keys) - len(removed) + len(records), removed, writer.hash.hexdigest(), writer.size)
+
@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import logging
 import git
 
 from progress.bar import Bar
@@ -107,3 +108,54 @@ class RepoProgressPrinter(git.RemoteProgress):
         self._last_count = cur_count
         if stage_id & self.END:
             self._progress.finish()
+
+
+class RepoProgressLogger(git.RemoteProgress):
+    """
+    Line based progress printer for `git` used when more repositories are cloned or fetched concurrently
+    """
+    # percentage step between two printed progress lines
+    STEP = 25
+
+    def __init__(self, name: str):
+        """
+        Initialize progress logger
+
+        :param name:
+            Name of repository printed with each progress line.
+        """
+        super().__init__()
+        self._name = name
+        self._last_percent = None
+
+    def update(self, op_code, cur_count, max_count=None, message=''):
+        """
+        Callback method called when `git` returns some progress
+
+        Only beginning, end and every `STEP` percent of each operation is logged to keep output of parallel jobs
+        readable.
+
+        :param op_code:
+            Opcode with operation code and stage (BEGIN, END).
+        :param cur_count:
+            Current value of progress.
+        :param max_count:
+            Maximal value of progress.
+        :param message:
+            Message returned for some operation codes.
+        """
+        op_msg = RepoProgressPrinter.operation.get(op_code & self.OP_MASK)
+        stage_id = op_code & self.STAGE_MASK
+        if not op_msg:
+            return
+        if stage_id & self.BEGIN:
+            self._last_percent = None
+        if stage_id & self.END:
+            logging.info("{}: {} done".format(self._name, op_msg))
+            return
+        if not max_count:
+            return
+        percent = int(float(cur_count) * 100 / float(max_count)) // self.STEP * self.STEP
+        if percent != self._last_percent:
+            self._last_percent = percent
+            logging.info("{}: {} {}%".format(self._name, op_msg, percent))
@@ -0,0 +1,200 @@
+# Copyright (C) 2018  Braiins Systems s.r.o.
+#
+# This file is part of Braiins Build System (BB).
+#
+# BB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import threading
+import time
+
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+
+
+class CountingWriter:
+    """
+    Writable stream wrapper which counts written bytes
+    """
+    def __init__(self, stream, measurement):
+        """
+        Initialize wrapper
+
+        :param stream:
+            Original opened stream for writing.
+        :param measurement:
+            Measurement object whose `size` attribute is incremented.
+        """
+        self._stream = stream
+        self._measurement = measurement
+
+    def write(self, data):
+        self._measurement.size += len(data)
+        return self._stream.write(data)
+
+    def __getattr__(self, item):
+        return getattr(self._stream, item)
+
+
+class Measurement:
+    """
+    Mutable size of data transferred during measured step
+    """
+    def __init__(self, size: int=0):
+        self.size = size
+
+    def add(self, size: int):
+        """
+        Add number of transferred bytes to the measured size
+
+        :param size:
+            Number of bytes.
+        """
+        self.size += size
+
+    def writer(self, stream):
+        """
+        Return stream wrapper which adds all written bytes to the measured size
+
+        :param stream:
+            Original opened stream for writing.
+        :return:
+            Writable stream.
+        """
+        return CountingWriter(stream, self)
+
+
+class Report:
+    """
+    Collector of deploy steps with their duration and amount of transferred data
+    """
+    Step = namedtuple('Step', ['host', 'category', 'name', 'start', 'duration', 'size'])
+
+    def __init__(self, host: str='local', steps=None, lock=None):
+        """
+        Initialize empty report
+
+        :param host:
+            Name of host used for all steps added by this report object.
+        :param steps:
+            Shared list of steps (used for host views).
+        :param lock:
+            Lock guarding shared list of steps.
+        """
+        self._host = host
+        self._steps = [] if steps is None else steps
+        self._lock = lock or threading.Lock()
+        self._start = time.time()
+
+    def for_host(self, host: str):
+        """
+        Return view of the report which adds steps for another host
+
+        :param host:
+            Name of host.
+        :return:
+            Report object sharing steps with this one.
+        """
+        return Report(host, self._steps, self._lock)
+
+    def add(self, category: str, name: str, duration: float, size: int=0):
+        """
+        Add finished step to the report
+
+        :param category:
+            Category of step (e.g. connect, ssh, mtd, upload).
+        :param name:
+            Description of step.
+        :param duration:
+            Wall time in seconds.
+        :param size:
+            Number of transferred bytes.
+        """
+        step = self.Step(self._host, category, name, time.time() - duration, duration, size)
+        with self._lock:
+            self._steps.append(step)
+
+    @contextmanager
+    def measure(self, category: str, name: str, size: int=0):
+        """
+        Context manager which measures wall time of enclosed block and adds it as a new step
+
+        :param category:
+            Category of step.
+        :param name:
+            Description of step.
+        :param size:
+            Initial number of transferred bytes.
+        :return:
+            Measurement object which can be used for counting of transferred bytes.
+        """
+        measurement = Measurement(size)
+        start = time.monotonic()
+        try:
+            yield measurement
+        finally:
+            # failed steps are also reported
+            self.add(category, name, time.monotonic() - start, measurement.size)
+
+    @staticmethod
+    def _get_speed(step) -> float:
+        """
+        Return effective speed of step in MB/s
+        """
+        return step.size / step.duration / 1e6 if step.duration > 0 else 0.0
+
+    def _get_step_dict(self, step):
+        """
+        Return step as an ordered dictionary extended with effective speed
+        """
+        result = step._asdict()
+        result['speed'] = self._get_speed(step)
+        return result
+
+    def dump(self, stream):
+        """
+        Dump report in JSON format to the opened stream
+
+        :param stream:
+            Opened stream for writing.
+        """
+        with self._lock:
+            steps = sorted(self._steps, key=lambda step: step.start)
+        report = OrderedDict((
+            ('start', self._start),
+            ('duration', time.time() - self._start),
+            ('steps', [self._get_step_dict(step) for step in steps])
+        ))
+        json.dump(report, stream, indent=4)
+        stream.write('\n')
+
+    def print_summary(self):
+        """
+        Print summary table with all steps
+        """
+        with self._lock:
+            steps = sorted(self._steps, key=lambda step: (step.host, step.start))
+        if not steps:
+            return
+        host_width = max(len(step.host) for step in steps)
+        name_width = max(len(step.name) for step in steps)
+        print()
+        print('{:<{}}  {:<8}  {:<{}}  {:>9}  {:>10}  {:>8}'.format('host', host_width, 'category', 'step', name_width,
+                                                                   'time [s]', 'size [MB]', 'MB/s'))
+        for step in steps:
+            print('{:<{}}  {:<8}  {:<{}}  {:>9.2f}  {:>10.2f}  {:>8.2f}'.format(
+                step.host, host_width, step.category, step.name, name_width, step.duration, step.size / 1e6,
+                self._get_speed(step)))
+        print()
+
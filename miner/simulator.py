@@ -0,0 +1,1082 @@
+# Copyright (C) 2018  Braiins Systems s.r.o.
+#
+# This file is part of Braiins Build System (BB).
+#
+# BB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Local SSH server emulating a miner for deploy testing and benchmarking
+
+The server implements only a small subset of shell and miner utilities used by the build system and upgrade scripts.
+All paths are mapped to a private root directory and NAND partitions are backed by sparse files.
+"""
+
+import argparse
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import re
+import shlex
+import shutil
+import socket
+import sys
+import tarfile
+import threading
+import time
+
+import paramiko
+
+from collections import namedtuple, OrderedDict
+
+# NAND layout of Zynq based miners (the index is MTD number)
+NAND_PARTITIONS = [
+    ('boot', 0x80000),
+    ('uboot', 0x180000),
+    ('fpga1', 0x200000),
+    ('fpga2', 0x200000),
+    ('uboot_env', 0x20000),
+    ('miner_cfg', 0x20000),
+    ('recovery', 0x1e00000),
+    ('firmware1', 0x5000000),
+    ('firmware2', 0x5000000)
+]
+
+# UBI volumes created on firmware partitions
+UBI_VOLUMES = ['kernel', 'rootfs', 'rootfs_data']
+
+# SD card partitions which can be mounted
+SD_PARTITIONS = ['/dev/mmcblk0p1', '/dev/mmcblk0p2']
+
+CHUNK_SIZE = 0x10000
+
+
+class ShellExit(Exception):
+    """
+    Exception raised by `exit` command
+    """
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+class CommandError(Exception):
+    """
+    Exception raised by emulated command when it fails
+    """
+    pass
+
+
+class Link:
+    """
+    Emulation of network link with limited bandwidth and latency
+    """
+    def __init__(self, latency: float=0.0, bandwidth: float=None):
+        """
+        Initialize link parameters
+
+        :param latency:
+            Round trip time in seconds added to each remote command.
+        :param bandwidth:
+            Bandwidth in bytes per second or None for unlimited link.
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def transfer(self, size: int):
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+
+class ChannelReader:
+    """
+    File-like object reading from SSH channel
+    """
+    def __init__(self, channel, link: Link):
+        self._channel = channel
+        self._link = link
+        self._eof = False
+
+    def read(self, size: int=-1) -> bytes:
+        result = io.BytesIO()
+        while not self._eof and (size < 0 or result.tell() < size):
+            chunk_size = CHUNK_SIZE if size < 0 else min(CHUNK_SIZE, size - result.tell())
+            data = self._channel.recv(chunk_size)
+            if not data:
+                self._eof = True
+                break
+            self._link.transfer(len(data))
+            result.write(data)
+        return result.getvalue()
+
+
+class ChannelWriter:
+    """
+    File-like object writing to SSH channel
+    """
+    def __init__(self, channel, link: Link, stderr: bool=False):
+        self._send = channel.sendall_stderr if stderr else channel.sendall
+        self._link = link
+
+    def write(self, data: bytes):
+        self._link.transfer(len(data))
+        self._send(data)
+        return len(data)
+
+
+class SimulatedMiner:
+    """
+    State of emulated miner with file system, NAND partitions and U-Boot environment
+    """
+    def __init__(self, root: str, mac: str='00:0A:35:FF:FF:FF'):
+        """
+        Initialize miner in the root directory
+
+        :param root:
+            Path to directory where all miner data are stored.
+        :param mac:
+            MAC address of miner.
+        """
+        self.root = os.path.abspath(root)
+        self.mac = mac
+        self.lock = threading.RLock()
+        self.mounts = {}
+        self.ubi_attached = None
+        self.reboots = 0
+        self.commands = []
+
+        for path in ('fs', 'nand', 'ubi', 'sd/p1', 'sd/p2'):
+            os.makedirs(os.path.join(self.root, path), exist_ok=True)
+        for index, (_, size) in enumerate(NAND_PARTITIONS):
+            mtd_path = self.get_mtd_path(index)
+            if not os.path.exists(mtd_path):
+                with open(mtd_path, 'wb') as mtd_file:
+                    mtd_file.truncate(size)
+        if not os.path.exists(self._env_path):
+            self.save_env({})
+
+    @property
+    def _env_path(self) -> str:
+        return os.path.join(self.root, 'uboot_env.json')
+
+    def load_env(self):
+        with open(self._env_path, 'r') as env_file:
+            return json.load(env_file, object_pairs_hook=OrderedDict)
+
+    def save_env(self, env):
+        with open(self._env_path, 'w') as env_file:
+            json.dump(env, env_file, indent=4)
+
+    def get_mtd_path(self, index: int) -> str:
+        return os.path.join(self.root, 'nand', 'mtd{}.bin'.format(index))
+
+    def get_mtd_index(self, device: str) -> int:
+        """
+        Return MTD number for partition name or MTD device
+
+        :param device:
+            Name of partition or path to MTD device.
+        :return:
+            Index of MTD partition.
+        """
+        match = re.match(r'^(?:/dev/)?mtd(\d+)$', device)
+        if match and int(match.group(1)) < len(NAND_PARTITIONS):
+            return int(match.group(1))
+        for index, (name, _) in enumerate(NAND_PARTITIONS):
+            if name == device:
+                return index
+        raise CommandError("Can't open device '{}'".format(device))
+
+    def get_volume_path(self, device: str) -> str:
+        """
+        Return path to file with UBI volume
+
+        :param device:
+            Path to UBI volume device.
+        :return:
+            Path to file with UBI volume content.
+        """
+        match = re.match(r'^/dev/ubi0_(\d+)$', device)
+        if not match or int(match.group(1)) >= len(UBI_VOLUMES):
+            raise CommandError("Can't open volume '{}'".format(device))
+        if self.ubi_attached is None:
+            raise CommandError("UBI device 0 does not exist")
+        return os.path.join(self.root, 'ubi', 'mtd{}'.format(self.ubi_attached), 'vol{}'.format(match.group(1)))
+
+    def get_proc_mtd(self) -> bytes:
+        lines = ['dev:    size   erasesize  name']
+        for index, (name, size) in enumerate(NAND_PARTITIONS):
+            lines.append('mtd{}: {:08x} 00020000 "{}"'.format(index, size, name))
+        return ('\n'.join(lines) + '\n').encode()
+
+    def path(self, path: str, cwd: str='/') -> str:
+        """
+        Map path on the miner to local path in root directory
+
+        :param path:
+            Absolute or relative path on the miner.
+        :param cwd:
+            Current working directory on the miner.
+        :return:
+            Local path which is always inside of root directory.
+        """
+        path = posixpath.normpath(posixpath.join(cwd, path))
+        # normpath keeps two leading slashes
+        path = '/' + path.lstrip('/')
+        for mount_point, local in sorted(self.mounts.items(), key=lambda item: -len(item[0])):
+            if path == mount_point or path.startswith(mount_point + '/'):
+                return os.path.join(local, path[len(mount_point):].lstrip('/'))
+        return os.path.join(self.root, 'fs', path.lstrip('/'))
+
+    def open(self, path: str, mode: str='rb', cwd: str='/'):
+        """
+        Open file on the miner including special files
+
+        :param path:
+            Path to file on the miner.
+        :param mode:
+            Mode of opened file.
+        :param cwd:
+            Current working directory on the miner.
+        :return:
+            File object.
+        """
+        path = posixpath.normpath(posixpath.join(cwd, path))
+        if path == '/proc/mtd':
+            return io.BytesIO(self.get_proc_mtd())
+        if path == '/sys/class/net/eth0/address':
+            return io.BytesIO('{}\n'.format(self.mac.lower()).encode())
+        if path == '/dev/null':
+            return open(os.devnull, mode)
+        if path.startswith('/dev/mtd'):
+            return open(self.get_mtd_path(self.get_mtd_index(path)), 'rb' if 'r' in mode else 'r+b')
+        if path.startswith('/dev/ubi'):
+            return open(self.get_volume_path(path), mode)
+        try:
+            return open(self.path(path), mode)
+        except OSError as e:
+            raise CommandError("can't open '{}': {}".format(path, e.strerror))
+
+
+Command = namedtuple('Command', ['words', 'redirections'])
+Group = namedtuple('Group', ['body', 'redirections'])
+
+
+class Shell:
+    """
+    Minimal shell interpreter with emulated miner utilities
+
+    Supported syntax covers command lists separated by `;`, `&&`, `||` or new line, pipelines, command groups in
+    braces, redirections and simple variables (including `$?`).
+    """
+    OPERATORS = {';', '&&', '||', '|'}
+    REDIRECTIONS = {'>', '>>', '<', '>&'}
+
+    def __init__(self, miner: SimulatedMiner):
+        self._miner = miner
+        self._cwd = '/'
+        self._variables = {'?': '0'}
+        self.reboot = False
+
+    @staticmethod
+    def _tokenize(line: str):
+        lexer = shlex.shlex(line, posix=True, punctuation_chars=';&|<>')
+        lexer.whitespace_split = True
+        lexer.commenters = ''
+        return list(lexer)
+
+    def _parse(self, tokens, pos: int, end: str=None):
+        """
+        Parse command list
+
+        :return:
+            Pair with list of operator and pipeline pairs and next token position.
+        """
+        result = []
+        operator = ';'
+        pipeline = []
+        words = []
+        redirections = []
+
+        def finish_command():
+            nonlocal words, redirections
+            if words or redirections:
+                pipeline.append(Command(words, redirections))
+            words, redirections = [], []
+
+        while pos < len(tokens):
+            token = tokens[pos]
+            if token == end:
+                break
+            pos += 1
+            if token == '{' and not words:
+                body, pos = self._parse(tokens, pos, '}')
+                pos += 1
+                pipeline.append(Group(body, redirections))
+                redirections = []
+            elif token in self.REDIRECTIONS:
+                fd = 0 if token == '<' else 1
+                if words and words[-1].isdigit() and token != '<':
+                    fd = int(words.pop())
+                redirections.append((fd, token, tokens[pos]))
+                pos += 1
+            elif token == '|':
+                finish_command()
+            elif token in self.OPERATORS:
+                finish_command()
+                if pipeline:
+                    result.append((operator, pipeline))
+                operator, pipeline = token, []
+            else:
+                words.append(token)
+        finish_command()
+        if pipeline:
+            result.append((operator, pipeline))
+        return result, pos
+
+    def _expand(self, word: str) -> str:
+        return re.sub(r'\$(\?|\w+)', lambda match: self._variables.get(match.group(1), ''), word)
+
+    def run(self, script: str, stdin, stdout, stderr) -> int:
+        """
+        Run shell script
+
+        :param script:
+            Script with commands.
+        :param stdin:
+            File-like object with standard input.
+        :param stdout:
+            File-like object for standard output.
+        :param stderr:
+            File-like object for standard error.
+        :return:
+            Exit status of last command.
+        """
+        status = 0
+        try:
+            for line in script.splitlines():
+                tokens = self._tokenize(line)
+                if tokens:
+                    status = self._run_list(self._parse(tokens, 0)[0], stdin, stdout, stderr)
+        except ShellExit as e:
+            status = e.status
+        except ValueError as e:
+            stderr.write('sh: syntax error: {}\n'.format(e).encode())
+            status = 2
+        return status
+
+    def _run_list(self, commands, stdin, stdout, stderr) -> int:
+        status = 0
+        for operator, pipeline in commands:
+            if operator == '&&' and status != 0 or operator == '||' and status == 0:
+                continue
+            status = self._run_pipeline(pipeline, stdin, stdout, stderr)
+            self._variables['?'] = str(status)
+        return status
+
+    def _run_pipeline(self, pipeline, stdin, stdout, stderr) -> int:
+        status = 0
+        for index, command in enumerate(pipeline):
+            last = index == len(pipeline) - 1
+            output = stdout if last else io.BytesIO()
+            status = self._run_command(command, stdin, output, stderr)
+            if not last:
+                stdin = io.BytesIO(output.getvalue())
+        return status
+
+    def _run_command(self, command, stdin, stdout, stderr) -> int:
+        streams = [stdin, stdout, stderr]
+        opened = []
+        try:
+            for fd, operator, target in command.redirections:
+                target = self._expand(target)
+                if operator == '>&':
+                    streams[fd] = streams[int(target)]
+                    continue
+                mode = {'>': 'wb', '>>': 'ab', '<': 'rb'}[operator]
+                opened.append(self._miner.open(target, mode, self._cwd))
+                streams[fd] = opened[-1]
+            if isinstance(command, Group):
+                return self._run_list(command.body, *streams)
+            return self._run_simple([self._expand(word) for word in command.words], *streams)
+        except CommandError as e:
+            stderr.write('sh: {}\n'.format(e).encode())
+            return 1
+        finally:
+            for stream in opened:
+                stream.close()
+
+    def _run_simple(self, words, stdin, stdout, stderr) -> int:
+        if not words:
+            return 0
+        match = re.match(r'^(\w+)=(.*)$', words[0])
+        if match and len(words) == 1:
+            self._variables[match.group(1)] = match.group(2)
+            return 0
+        name = posixpath.basename(words[0])
+        handler = getattr(self, 'cmd_' + name, None)
+        if not handler:
+            stderr.write('sh: {}: not found\n'.format(words[0]).encode())
+            return 127
+        try:
+            with self._miner.lock:
+                self._miner.commands.append(' '.join(words))
+            result = handler(words[1:], stdin, stdout, stderr)
+            return result or 0
+        except CommandError as e:
+            stderr.write('{}: {}\n'.format(name, e).encode())
+            return 1
+
+    def _path(self, path: str) -> str:
+        return self._miner.path(path, self._cwd)
+
+    @staticmethod
+    def _copy(src, dst, size: int=None) -> int:
+        """
+        Copy data between streams in chunks
+
+        :return:
+            Number of copied bytes.
+        """
+        copied = 0
+        while size is None or copied < size:
+            data = src.read(CHUNK_SIZE if size is None else min(CHUNK_SIZE, size - copied))
+            if not data:
+                break
+            dst.write(data)
+            copied += len(data)
+        return copied
+
+    # shell built-ins and standard utilities
+
+    def cmd_true(self, args, stdin, stdout, stderr):
+        return 0
+
+    def cmd_false(self, args, stdin, stdout, stderr):
+        return 1
+
+    def cmd_exit(self, args, stdin, stdout, stderr):
+        raise ShellExit(int(args[0]) if args else int(self._variables['?']))
+
+    def cmd_cd(self, args, stdin, stdout, stderr):
+        path = posixpath.normpath(posixpath.join(self._cwd, args[0] if args else '/'))
+        if not os.path.isdir(self._miner.path(path)):
+            raise CommandError("can't cd to {}".format(path))
+        self._cwd = path
+
+    def cmd_echo(self, args, stdin, stdout, stderr):
+        newline = True
+        if args and args[0] == '-n':
+            newline, args = False, args[1:]
+        stdout.write((' '.join(args) + ('\n' if newline else '')).encode())
+
+    def cmd_printf(self, args, stdin, stdout, stderr):
+        if not args:
+            raise CommandError('usage: printf FORMAT [ARGUMENT]...')
+        fmt = args[0].replace('\\n', '\n').replace('\\t', '\t').replace('\\\\', '\\')
+        values = args[1:]
+        count = max(1, fmt.count('%s'))
+        while True:
+            chunk, values = values[:count], values[count:]
+            stdout.write((fmt.replace('%s', '{}').format(*(chunk + [''] * (count - len(chunk))))).encode())
+            if not values:
+                break
+
+    def cmd_cat(self, args, stdin, stdout, stderr):
+        if not args or args == ['-']:
+            self._copy(stdin, stdout)
+        for path in args:
+            if path != '-':
+                with self._miner.open(path, 'rb', self._cwd) as src:
+                    self._copy(src, stdout)
+
+    def cmd_head(self, args, stdin, stdout, stderr):
+        size = None
+        files = []
+        args = iter(args)
+        for arg in args:
+            if arg == '-c':
+                size = int(next(args))
+            elif arg.startswith('-c'):
+                size = int(arg[2:])
+            else:
+                files.append(arg)
+        if files:
+            with self._miner.open(files[0], 'rb', self._cwd) as src:
+                self._copy(src, stdout, size)
+        else:
+            self._copy(stdin, stdout, size)
+            # drain rest of input like a closed pipe
+            self._copy(stdin, io.BytesIO())
+
+    def cmd_sha256sum(self, args, stdin, stdout, stderr):
+        for path in args or ['-']:
+            digest = hashlib.sha256()
+            if path == '-':
+                self._copy(stdin, HashStream(digest))
+            else:
+                with self._miner.open(path, 'rb', self._cwd) as src:
+                    self._copy(src, HashStream(digest))
+            stdout.write('{}  {}\n'.format(digest.hexdigest(), path).encode())
+
+    def cmd_ls(self, args, stdin, stdout, stderr):
+        paths = [arg for arg in args if not arg.startswith('-')] or ['.']
+        for path in paths:
+            local = self._path(path)
+            names = sorted(os.listdir(local)) if os.path.isdir(local) else [path]
+            stdout.write(''.join('{}\n'.format(name) for name in names).encode())
+
+    def cmd_mkdir(self, args, stdin, stdout, stderr):
+        for path in (arg for arg in args if not arg.startswith('-')):
+            os.makedirs(self._path(path), exist_ok=True)
+
+    def cmd_rm(self, args, stdin, stdout, stderr):
+        for pattern in (arg for arg in args if not arg.startswith('-')):
+            for local in glob.glob(self._path(pattern)):
+                if os.path.isdir(local) and not os.path.islink(local):
+                    shutil.rmtree(local)
+                else:
+                    os.remove(local)
+
+    def cmd_chmod(self, args, stdin, stdout, stderr):
+        return 0
+
+    def cmd_ln(self, args, stdin, stdout, stderr):
+        # symbolic links are emulated by copies to keep all paths inside of root directory
+        target, link = [arg for arg in args if not arg.startswith('-')][-2:]
+        if os.path.exists(self._path(link)):
+            os.remove(self._path(link))
+        if os.path.isfile(self._path(target)):
+            shutil.copy(self._path(target), self._path(link))
+
+    def cmd_sleep(self, args, stdin, stdout, stderr):
+        time.sleep(float(args[0]))
+
+    def cmd_tar(self, args, stdin, stdout, stderr):
+        options = ''.join(arg.lstrip('-') for arg in args if arg.startswith('-') and arg != '-')
+        target = self._cwd
+        if '-C' in args:
+            target = args[args.index('-C') + 1]
+        if 'x' not in options:
+            raise CommandError('only extraction from standard input is supported')
+        with tarfile.open(fileobj=stdin, mode='r|gz' if 'z' in options else 'r|') as tar:
+            for member in tar:
+                local = self._miner.path(member.name, posixpath.join(target, ''))
+                if member.isdir():
+                    os.makedirs(local, exist_ok=True)
+                elif member.isfile():
+                    os.makedirs(os.path.dirname(local), exist_ok=True)
+                    with open(local, 'wb') as dst:
+                        shutil.copyfileobj(tar.extractfile(member), dst)
+                    os.chmod(local, member.mode & 0o777)
+
+    def cmd_mount(self, args, stdin, stdout, stderr):
+        args = [arg for arg in args if not arg.startswith('-')]
+        if not args:
+            stdout.write(''.join('{} on {}\n'.format(local, path) for path, local in self._miner.mounts.items())
+                         .encode())
+            return
+        device, mount_point = args[-2:]
+        if device not in SD_PARTITIONS:
+            raise CommandError("mounting {} on {} failed: No such device".format(device, mount_point))
+        local = os.path.join(self._miner.root, 'sd', 'p{}'.format(SD_PARTITIONS.index(device) + 1))
+        with self._miner.lock:
+            self._miner.mounts[posixpath.normpath(mount_point)] = local
+
+    def cmd_umount(self, args, stdin, stdout, stderr):
+        with self._miner.lock:
+            if self._miner.mounts.pop(posixpath.normpath(args[-1]), None) is None:
+                raise CommandError("can't unmount {}: Invalid argument".format(args[-1]))
+
+    def cmd_reboot(self, args, stdin, stdout, stderr):
+        with self._miner.lock:
+            self._miner.reboots += 1
+            self._miner.mounts.clear()
+            self._miner.ubi_attached = None
+        self.reboot = True
+
+    cmd_halt = cmd_reboot
+    cmd_poweroff = cmd_reboot
+
+    def cmd_miner(self, args, stdin, stdout, stderr):
+        return 0
+
+    # NAND and U-Boot utilities
+
+    def cmd_mtd(self, args, stdin, stdout, stderr):
+        erase = True
+        offset = 0
+        args = iter(args)
+        positional = []
+        for arg in args:
+            if arg == '-n':
+                erase = False
+            elif arg == '-p':
+                offset = int(next(args), 0)
+            elif arg in ('-e', '-j'):
+                next(args)
+            elif arg in ('-q', '-r'):
+                pass
+            else:
+                positional.append(arg)
+        if len(positional) < 2:
+            raise CommandError('usage: mtd [<options> ...] <command> [<arguments> ...] <device>')
+        action, device = positional[0], positional[-1]
+        index = self._miner.get_mtd_index(device)
+        size = NAND_PARTITIONS[index][1]
+        with open(self._miner.get_mtd_path(index), 'r+b') as mtd:
+            if action == 'erase':
+                # erased NAND is emulated with sparse zeros
+                mtd.truncate(0)
+                mtd.truncate(size)
+            elif action == 'write':
+                mtd.seek(offset)
+                written = self._copy(stdin, mtd, size - offset)
+                if erase:
+                    # erase the rest of last written block
+                    mtd.write(bytes(-written % 0x20000))
+            else:
+                raise CommandError("unknown command '{}'".format(action))
+
+    def cmd_nanddump(self, args, stdin, stdout, stderr):
+        offset = 0
+        length = None
+        output = stdout
+        device = None
+        args = iter(args)
+        for arg in args:
+            if arg in ('-s', '--startaddress'):
+                offset = int(next(args), 0)
+            elif arg in ('-l', '--length'):
+                length = int(next(args), 0)
+            elif arg in ('-f', '--file'):
+                output = self._miner.open(next(args), 'wb', self._cwd)
+            elif not arg.startswith('-'):
+                device = arg
+        if device is None:
+            raise CommandError('missing device')
+        index = self._miner.get_mtd_index(device)
+        size = NAND_PARTITIONS[index][1]
+        length = size - offset if length is None else min(length, size - offset)
+        with open(self._miner.get_mtd_path(index), 'rb') as mtd:
+            mtd.seek(offset)
+            self._copy(mtd, output, length)
+        if output is not stdout:
+            output.close()
+
+    def cmd_ubiformat(self, args, stdin, stdout, stderr):
+        device = args[0]
+        image = args[args.index('-f') + 1] if '-f' in args else None
+        image_size = int(args[args.index('-S') + 1]) if '-S' in args else None
+        index = self._miner.get_mtd_index(device)
+        size = NAND_PARTITIONS[index][1]
+        with open(self._miner.get_mtd_path(index), 'r+b') as mtd:
+            mtd.truncate(0)
+            mtd.truncate(size)
+            if image:
+                src = stdin if image == '-' else self._miner.open(image, 'rb', self._cwd)
+                self._copy(src, mtd, min(size, image_size or size))
+        # formatting deletes all volumes
+        shutil.rmtree(os.path.join(self._miner.root, 'ubi', 'mtd{}'.format(index)), ignore_errors=True)
+
+    def cmd_ubiattach(self, args, stdin, stdout, stderr):
+        index = self._miner.get_mtd_index(args[args.index('-p') + 1] if '-p' in args else args[-1])
+        with self._miner.lock:
+            if self._miner.ubi_attached not in (None, index):
+                raise CommandError('UBI device 0 is already attached to mtd{}'.format(self._miner.ubi_attached))
+            self._miner.ubi_attached = index
+        volumes = os.path.join(self._miner.root, 'ubi', 'mtd{}'.format(index))
+        os.makedirs(volumes, exist_ok=True)
+        for volume in range(len(UBI_VOLUMES)):
+            open(os.path.join(volumes, 'vol{}'.format(volume)), 'ab').close()
+
+    def cmd_ubidetach(self, args, stdin, stdout, stderr):
+        with self._miner.lock:
+            if self._miner.ubi_attached is None:
+                raise CommandError('UBI device 0 does not exist')
+            self._miner.ubi_attached = None
+
+    def cmd_ubiupdatevol(self, args, stdin, stdout, stderr):
+        volume_path = self._miner.get_volume_path(args[0])
+        if '-t' in args:
+            open(volume_path, 'wb').close()
+            return
+        size = int(args[args.index('-s') + 1]) if '-s' in args else None
+        src = stdin if args[1] == '-' else self._miner.open(args[1], 'rb', self._cwd)
+        with open(volume_path, 'wb') as volume:
+            self._copy(src, volume, size)
+
+    def cmd_fw_setenv(self, args, stdin, stdout, stderr):
+        with self._miner.lock:
+            env = self._miner.load_env()
+            if args and args[0] in ('-s', '--script'):
+                src = stdin if args[1] == '-' else self._miner.open(args[1], 'rb', self._cwd)
+                for line in src.read().decode().splitlines():
+                    if not line.strip() or line.startswith('#'):
+                        continue
+                    name, _, value = line.partition(' ')
+                    if value:
+                        env[name] = value.strip()
+                    else:
+                        env.pop(name, None)
+            elif len(args) == 1:
+                env.pop(args[0], None)
+            elif args:
+                env[args[0]] = ' '.join(args[1:])
+            else:
+                raise CommandError('missing variable name')
+            self._miner.save_env(env)
+
+    def cmd_fw_printenv(self, args, stdin, stdout, stderr):
+        env = self._miner.load_env()
+        names = [arg for arg in args if not arg.startswith('-')] or list(env)
+        for name in names:
+            if name not in env:
+                raise CommandError("## Error: \"{}\" not defined".format(name))
+            stdout.write('{}={}\n'.format(name, env[name]).encode())
+
+
+class HashStream:
+    """
+    Writable stream updating hash object
+    """
+    def __init__(self, digest):
+        self._digest = digest
+
+    def write(self, data):
+        self._digest.update(data)
+        return len(data)
+
+
+class SFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class SFTPServer(paramiko.SFTPServerInterface):
+    """
+    SFTP subsystem working over the miner root directory
+    """
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self._miner = server.miner
+
+    def _path(self, path: str) -> str:
+        return self._miner.path(self.canonicalize(path))
+
+    def canonicalize(self, path):
+        return '/' + posixpath.normpath(posixpath.join('/', path)).lstrip('/')
+
+    def list_folder(self, path):
+        try:
+            local = self._path(path)
+            result = []
+            for name in os.listdir(local):
+                attributes = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local, name)))
+                attributes.filename = name
+                result.append(attributes)
+            return result
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        local = self._path(path)
+        try:
+            fd = os.open(local, flags | getattr(os, 'O_BINARY', 0), 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = SFTPHandle(flags)
+        handle.filename = local
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self._path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(self._path(oldpath), self._path(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self._path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(self._path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        return paramiko.SFTP_OK
+
+
+class ServerInterface(paramiko.ServerInterface):
+    """
+    SSH server accepting any user and running commands in emulated shell
+    """
+    def __init__(self, simulator):
+        self.miner = simulator.miner
+        self._simulator = simulator
+        # commands of channels which are started when channel is accepted by transport
+        self._commands = {}
+        self._condition = threading.Condition()
+
+    def get_allowed_auths(self, username):
+        return 'none,password,publickey'
+
+    def check_auth_none(self, username):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        # the command cannot be started from this callback because its output could be sent before exec reply
+        with self._condition:
+            self._commands[channel.get_id()] = command.decode()
+            self._condition.notify_all()
+        return True
+
+    def check_channel_subsystem_request(self, channel, name):
+        with self._condition:
+            self._commands[channel.get_id()] = None
+            self._condition.notify_all()
+        return super().check_channel_subsystem_request(channel, name)
+
+    def get_command(self, channel):
+        """
+        Wait for exec request of accepted channel
+
+        :param channel:
+            Accepted SSH channel.
+        :return:
+            Command string or None when the channel is closed or used for subsystem.
+        """
+        with self._condition:
+            while channel.get_id() not in self._commands and not channel.closed:
+                self._condition.wait(1)
+            return self._commands.pop(channel.get_id(), None)
+
+
+class MinerSimulator:
+    """
+    SSH server for one emulated miner
+    """
+    def __init__(self, root: str, host: str='127.0.0.1', port: int=0, mac: str='00:0A:35:FF:FF:FF',
+                 latency: float=0.0, bandwidth: float=None, host_key=None):
+        """
+        Initialize simulator
+
+        :param root:
+            Path to directory where all miner data are stored.
+        :param host:
+            Address for listening socket.
+        :param port:
+            Port for listening socket or 0 for arbitrary free port.
+        :param mac:
+            MAC address of miner.
+        :param latency:
+            Round trip time in seconds added to each remote command.
+        :param bandwidth:
+            Link bandwidth in bytes per second or None for unlimited link.
+        :param host_key:
+            Paramiko private key used as SSH host key (new one is generated when omitted).
+        """
+        self.miner = SimulatedMiner(root, mac)
+        self.link = Link(latency, bandwidth)
+        self._host_key = host_key or paramiko.RSAKey.generate(2048)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self._transports = []
+        self._thread = None
+        self._running = False
+
+    @property
+    def address(self) -> str:
+        """
+        Return address of SSH server in a format `<host>:<port>`
+        """
+        host, port = self._socket.getsockname()
+        return '{}:{}'.format(host, port)
+
+    def start(self):
+        """
+        Start SSH server in background thread
+        """
+        self._socket.listen(16)
+        self._running = True
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop SSH server and close all connections
+        """
+        self._running = False
+        self._socket.close()
+        for transport in self._transports:
+            transport.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _accept(self):
+        while self._running:
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                break
+            # handshake is done in its own thread so slow or broken client does not block other connections
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self._host_key)
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer, SFTPServer)
+        server = ServerInterface(self)
+        try:
+            transport.start_server(server=server)
+        except Exception as e:
+            # client can drop connection during handshake
+            logging.debug("Simulator '{}' handshake failed: {}".format(self.address, e))
+            transport.close()
+            return
+        self._transports.append(transport)
+        while transport.is_active():
+            channel = transport.accept(1)
+            if channel is not None:
+                threading.Thread(target=self._run_channel, args=(server, channel), daemon=True).start()
+
+    def _run_channel(self, server, channel):
+        command = server.get_command(channel)
+        if command is not None:
+            self.execute(channel, command)
+
+    def execute(self, channel, command: str):
+        """
+        Run remote command on emulated miner
+
+        :param channel:
+            Opened SSH channel.
+        :param command:
+            Command string.
+        """
+        logging.debug("Simulator '{}' running '{}'".format(self.address, command))
+        self.link.round_trip()
+        shell = Shell(self.miner)
+        try:
+            status = shell.run(command, ChannelReader(channel, self.link), ChannelWriter(channel, self.link),
+                               ChannelWriter(channel, self.link, stderr=True))
+        except Exception as e:
+            channel.sendall_stderr('sh: internal error: {}\n'.format(e).encode())
+            status = 1
+        channel.send_exit_status(status)
+        # the channel is closed by client because closing it here could still overtake reply to exec request
+        channel.shutdown_write()
+        if shell.reboot:
+            # reboot drops all connections
+            time.sleep(0.1)
+            channel.get_transport().close()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Run local SSH servers emulating miners')
+    parser.add_argument('root',
+                        help='directory for data of emulated miners')
+    parser.add_argument('-n', '--count', type=int, default=1,
+                        help='number of emulated miners')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address for listening sockets')
+    parser.add_argument('--port', type=int, default=2200,
+                        help='port of first miner (following miners use next ports)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='round trip time in milliseconds added to each remote command')
+    parser.add_argument('--bandwidth', type=float,
+                        help='link bandwidth in MB/s (unlimited when omitted)')
+    parser.add_argument('--hosts-file', nargs='?',
+                        help='write hosts file compatible with deploy command')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    host_key = paramiko.RSAKey.generate(2048)
+    simulators = []
+    for index in range(args.count):
+        mac = '00:0A:35:00:{:02X}:{:02X}'.format(index >> 8 & 0xff, index & 0xff)
+        simulator = MinerSimulator(os.path.join(args.root, 'miner{}'.format(index)), args.host, args.port + index,
+                                   mac, args.latency / 1000, args.bandwidth and args.bandwidth * 1e6, host_key)
+        simulators.append(simulator.start())
+        logging.info("Miner {} ({}) is listening on '{}'".format(index, mac, simulator.address))
+
+    if args.hosts_file:
+        with open(args.hosts_file, 'w') as hosts_file:
+            for simulator in simulators:
+                hosts_file.write('{} {}\n'.format(simulator.address, simulator.miner.mac))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    for simulator in simulators:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -18,6 +18,13 @@
 import paramiko
 import logging
 import shutil
+import shlex
+import json
+import threading
+import tarfile
+import posixpath
+import time
+import os
 
 from contextlib import contextmanager
 from subprocess import CalledProcessError
@@ -26,6 +33,48 @@ from getpass import getpass
 
 logging.getLogger("paramiko").setLevel(logging.CRITICAL)
 
+
+def get_size(path: str) -> int:
+    """
+    Return size of file or total size of all files in directory
+
+    :param path:
+        Path to local file or directory.
+    :return:
+        Size in bytes.
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class CountingFile:
+    """
+    Wrapper of remote stdin which counts written bytes
+    """
+    def __init__(self, stream, counter=None):
+        """
+        Initialize wrapper
+
+        :param stream:
+            Original opened stream for writing.
+        :param counter:
+            Optional callable which is called with the number of each written bytes.
+        """
+        self._stream = stream
+        self._counter = counter
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self._counter:
+            self._counter(len(data))
+        return self._stream.write(data)
+
+    def __getattr__(self, item):
+        return getattr(self._stream, item)
+
+
 class SSHClient(paramiko.SSHClient):
     """
     Class for support authentication without password and key
@@ -42,26 +91,66 @@ class SSHClient(paramiko.SSHClient):
 class SSHManager:
     RemoteProcess = namedtuple('RemoteProcess', ['stdin', 'stdout', 'stderr'])
 
+    # mark written to stderr by batch script when some command fails
+    BATCH_FAILED_MARK = '__bb_batch_failed__'
+
+    # authentication methods in the order in which they are tried
+    AUTH_KEY = 'key'
+    AUTH_NONE = 'none'
+    AUTH_PASSWORD = 'password'
+    AUTH_PASSWORD_NO_AGENT = 'password_no_agent'
+    AUTH_METHODS = [AUTH_KEY, AUTH_NONE, AUTH_PASSWORD, AUTH_PASSWORD_NO_AGENT]
+
+    # successful authentication method and password for each pair of hostname and username
+    _auth_methods = {}
+    _auth_lock = threading.Lock()
+    # connected clients kept open for reuse
+    _connections = {}
+
     """
     SSH Manager simplifies file operations and command running
     """
-    def __init__(self, hostname: str, username: str, password: str, load_host_keys: bool=True):
+    def __init__(self, hostname: str, username: str, password: str, load_host_keys: bool=True,
+                 keep_alive: bool=False, auth_cache: str=None, tracer=None, interactive: bool=True):
         """
         Initialize SSH client with server name and information for authentication
 
         :param hostname:
-            The server to connect to.
+            The server to connect to. It can be in a format `<host>:<port>` when SSH server does not use standard
+            port.
         :param username:
             The username to authenticate as.
         :param password:
             A password to use for authentication.
         :param load_host_keys:
             Load known host keys from the system to check connection.
+        :param keep_alive:
+            Keep connection open after exit for reuse by other SSH manager with the same hostname and username.
+            All such connections are closed by `close_all` method.
+        :param auth_cache:
+            Path to the file where successful authentication methods are stored between runs.
+            Passwords are never stored in this file.
+        :param tracer:
+            Callable object called after each connection, remote command or transfer with category, description,
+            duration in seconds and number of transferred bytes.
+        :param interactive:
+            Prompt the user for password when all authentication methods fail. Otherwise the connection fails
+            immediately which is necessary when more servers are connected from concurrent threads.
         """
         self._client = SSHClient()
         self._hostname = str(hostname)
+        self._port = paramiko.config.SSH_PORT
+        if self._hostname.count(':') == 1:
+            # IPv6 addresses are used without port
+            self._hostname, port = self._hostname.split(':')
+            self._port = int(port)
         self._username = str(username)
         self._password = str(password)
+        self._keep_alive = keep_alive
+        self._auth_cache = auth_cache
+        self._tracer = tracer
+        self._interactive = interactive
+        self._sftp = None
 
         if load_host_keys:
             logging.debug("Loading system host keys...'")
@@ -69,55 +158,166 @@ class SSHManager:
 
         self._client.set_missing_host_key_policy(paramiko.WarningPolicy())
 
+    def _trace(self, category: str, name: str, start: float, size: int=0):
+        """
+        Pass finished operation to the tracer
+
+        :param category:
+            Category of operation.
+        :param name:
+            Description of operation.
+        :param start:
+            Monotonic time when operation started.
+        :param size:
+            Number of transferred bytes.
+        """
+        if self._tracer:
+            self._tracer(category, name, time.monotonic() - start, size)
+
+    @property
+    def _key(self):
+        return self._hostname, self._port, self._username
+
+    def _get_cache_key(self) -> str:
+        return '{}@{}:{}'.format(self._username, self._hostname, self._port)
+
+    def _load_auth_cache(self):
+        """
+        Load authentication methods stored by previous runs
+        """
+        if not self._auth_cache or self._key in self._auth_methods:
+            return
+        try:
+            with open(self._auth_cache, 'r') as cache_file:
+                methods = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+        method = methods.get(self._get_cache_key())
+        if method in self.AUTH_METHODS:
+            self._auth_methods.setdefault(self._key, (method, None))
+
+    def _save_auth_method(self, method: str, password: str):
+        """
+        Remember successful authentication method
+
+        :param method:
+            Name of authentication method.
+        :param password:
+            Password used for authentication.
+        """
+        with self._auth_lock:
+            self._auth_methods[self._key] = (method, password)
+            if not self._auth_cache:
+                return
+            methods = {}
+            try:
+                with open(self._auth_cache, 'r') as cache_file:
+                    methods = json.load(cache_file)
+            except (OSError, ValueError):
+                pass
+            methods[self._get_cache_key()] = method
+            try:
+                with open(self._auth_cache, 'w') as cache_file:
+                    json.dump(methods, cache_file, indent=4, sort_keys=True)
+            except OSError:
+                logging.debug("Cannot save authentication methods to '{}'".format(self._auth_cache))
+
+    def _connect(self, method: str, password: str) -> bool:
+        """
+        Try to connect to an SSH server and authenticate with selected method
+
+        :param method:
+            Name of authentication method.
+        :param password:
+            Password used for authentication.
+        :return:
+            True when authentication was successful.
+        """
+        kwargs = {
+            self.AUTH_KEY: dict(look_for_keys=True),
+            self.AUTH_NONE: dict(password=None, look_for_keys=False),
+            self.AUTH_PASSWORD: dict(password=password, look_for_keys=False),
+            self.AUTH_PASSWORD_NO_AGENT: dict(password=password, look_for_keys=False, allow_agent=False)
+        }[method]
+        logging.debug("Trying authentication method '{}'...".format(method))
+        self._client.close()
+        try:
+            self._client.connect(hostname=self._hostname, port=self._port, username=self._username, **kwargs)
+        except paramiko.SSHException:
+            return False
+        self._save_auth_method(method, password)
+        return True
+
     def __enter__(self):
         """
         Connect to an SSH server and authenticate to it
 
+        The authentication method which succeeded last time for the same server is tried first.
+
         :return:
             SSH manager connected to the server.
         """
+        client = self._connections.pop(self._key, None)
+        if client:
+            transport = client.get_transport()
+            if transport and transport.is_active():
+                logging.debug("Reusing connection to remote SSH server...'")
+                self._client.close()
+                self._client = client
+                return self
+            client.close()
+
         logging.debug("Connecting to remote SSH server...'")
-        # at first try to login with ssh key
-        try:
-            self._client.connect(hostname=self._hostname, username=self._username, look_for_keys=True)
-        except paramiko.SSHException:
-            pass
-        else:
-            return self
-        # then try to login without password
-        try:
-            self._client.connect(hostname=self._hostname, username=self._username, password=None, look_for_keys=False)
-        except paramiko.BadAuthenticationType:
-            pass
-        else:
-            return self
-        # finally use use configured password
+        start = time.monotonic()
+        self._load_auth_cache()
+        methods = list(self.AUTH_METHODS)
         password = self._password
+        cached_method, cached_password = self._auth_methods.get(self._key, (None, None))
+        if cached_method:
+            # try the last successful method first
+            methods.remove(cached_method)
+            methods.insert(0, cached_method)
+            password = cached_password or password
+
         while True:
-            try:
-                self._client.close()
-                self._client.connect(hostname=self._hostname, username=self._username, password=password,
-                                     look_for_keys=False)
-            except paramiko.SSHException:
-                # login with ssh agent may fail so try another attempt without it
-                pass
-            else:
-                return self
-            try:
-                self._client.close()
-                self._client.connect(hostname=self._hostname, username=self._username, password=password,
-                                     look_for_keys=False, allow_agent=False)
-            except paramiko.SSHException:
-                # prompt the user when everything fails
-                password = getpass()
-            else:
+            if any(self._connect(method, password) for method in methods):
+                self._trace('connect', self._hostname, start)
                 return self
+            if not self._interactive:
+                raise paramiko.AuthenticationException("Authentication to '{}' failed".format(self._hostname))
+            # prompt the user when everything fails
+            password = getpass()
+            methods = [self.AUTH_PASSWORD, self.AUTH_PASSWORD_NO_AGENT]
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """
-        Close connection with SSH server
+        Close connection with SSH server or keep it open for reuse
         """
-        self._client.close()
+        if self._sftp:
+            self._sftp.close()
+            self._sftp = None
+        if self._keep_alive and exc_type is None:
+            previous = self._connections.pop(self._key, None)
+            if previous and previous is not self._client:
+                previous.close()
+            self._connections[self._key] = self._client
+        else:
+            self._client.close()
+
+    @classmethod
+    def close_all(cls):
+        """
+        Close all connections kept open for reuse
+        """
+        while cls._connections:
+            _, client = cls._connections.popitem()
+            client.close()
+
+    def forget(self):
+        """
+        Do not reuse current connection (e.g. when remote system is going to reboot)
+        """
+        self._keep_alive = False
 
     @staticmethod
     def _check_exit_status(cmd, stdout, stderr):
@@ -177,21 +377,28 @@ class SSHManager:
         return ' '.join(args)
 
     @contextmanager
-    def pipe(self, *args):
+    def pipe(self, *args, counter=None):
         """
         Context manager for running system command on remote system
 
+        :param counter:
+            Callable which is called with the number of bytes written to remote stdin when caller measures the transfer
+            itself. When it is omitted then the bytes are counted by traced remote command.
         :return:
             RemoteProcess with stdin, stdout and stderr.
         """
         cmd = self._get_cmd(args)
 
         logging.debug("Remotely running command '{}'...".format(cmd))
-        process = self.RemoteProcess(*self._client.exec_command(cmd))
+        start = time.monotonic()
+        stdin, stdout, stderr = self._client.exec_command(cmd)
+        process = self.RemoteProcess(CountingFile(stdin, counter), stdout, stderr)
         yield process
         process.stdin.channel.shutdown_write()
 
         self._check_exit_status(cmd, process.stdout, process.stderr)
+        # each transfer is counted only once either by caller or by remote command step
+        self._trace('ssh', cmd, start, 0 if counter else process.stdin.size)
 
     def run(self, *args):
         """
@@ -200,11 +407,63 @@ class SSHManager:
         cmd = self._get_cmd(args)
 
         logging.debug("Remotely running command '{}'...".format(cmd))
+        start = time.monotonic()
         _, stdout, stderr = self._client.exec_command(cmd)
 
         self._check_exit_status(cmd, stdout, stderr)
+        self._trace('ssh', cmd, start)
+        return stdout, stderr
+
+    def run_batch(self, commands):
+        """
+        Run sequence of system commands on remote system in one remote shell
+
+        All commands are sent as one shell script over a single channel. The script stops on the first failing command
+        and reports it with its exit code.
+
+        :param commands:
+            List of commands where each command is a string or list of arguments.
+        :return:
+            Standard output and standard error from SSH client.
+        """
+        cmds = [self._get_cmd((command,)) for command in commands]
+        if not cmds:
+            return None, None
+        script = '\n'.join('{} || {{ rc=$?; echo "{} {} $rc" >&2; exit $rc; }}'
+                           .format(cmd, self.BATCH_FAILED_MARK, index) for index, cmd in enumerate(cmds))
+
+        logging.debug("Remotely running batch of commands '{}'...".format('; '.join(cmds)))
+        start = time.monotonic()
+        stdin, stdout, stderr = self._client.exec_command(script)
+        stdin.channel.shutdown_write()
+
+        returncode = stdout.channel.recv_exit_status()
+        if returncode != 0:
+            # find failed command from the mark
+            errors = stderr.read().decode(errors='replace').splitlines()
+            cmd = script
+            for line in errors:
+                mark = line.split()
+                if len(mark) == 3 and mark[0] == self.BATCH_FAILED_MARK:
+                    cmd, returncode = cmds[int(mark[1])], int(mark[2])
+            errors = '\n'.join(line for line in errors if not line.startswith(self.BATCH_FAILED_MARK))
+            raise CalledProcessError(returncode, cmd, stdout, errors)
+        self._trace('ssh', '; '.join(cmds), start)
         return stdout, stderr
 
+    @staticmethod
+    def get_setenv_cmd(variables) -> str:
+        """
+        Return command which sets all U-Boot environment variables at once
+
+        :param variables:
+            List of pairs with variable name and value.
+        :return:
+            Command string for `run` or `run_batch` method.
+        """
+        script = ('{} {}'.format(name, value) for name, value in variables)
+        return 'printf "%s\\n" {} | fw_setenv -s -'.format(' '.join(shlex.quote(line) for line in script))
+
     def put(self, local_path, remote_path):
         """
         Copy local file to remote server without SFTP server
@@ -217,6 +476,56 @@ class SSHManager:
         with open(local_path, 'rb') as local, self.open(remote_path, 'w') as remote:
             shutil.copyfileobj(local, remote)
 
+    def put_files(self, files, remote_path: str, compress: bool=False, mode: int=None, callback=None):
+        """
+        Copy local files to remote server as one tar stream over single channel
+
+        The file modes are preserved and missing remote directories are created.
+
+        :param files:
+            List of pairs with path to local file and path relative to remote directory.
+            Local directories are copied recursively.
+        :param remote_path:
+            Path to remote directory where files are extracted.
+        :param compress:
+            Compress tar stream with gzip.
+        :param mode:
+            Override access mode of all regular files.
+        :param callback:
+            Callable object called with number of transferred bytes and total number of bytes.
+        """
+        def set_owner(tarinfo):
+            tarinfo.uid = tarinfo.gid = 0
+            tarinfo.uname = tarinfo.gname = 'root'
+            if mode is not None and tarinfo.isfile():
+                tarinfo.mode = mode
+            return tarinfo
+
+        class ProgressWriter:
+            def __init__(self, stream, total):
+                self._stream = stream
+                self._total = total
+                self._transferred = 0
+
+            def write(self, data):
+                self._stream.write(data)
+                self._transferred += len(data)
+                callback(min(self._transferred, self._total), self._total)
+                return len(data)
+
+        remote_dirs = sorted({posixpath.normpath(posixpath.join(remote_path, posixpath.dirname(remote)))
+                              for _, remote in files} | {remote_path})
+        cmd = ['mkdir', '-p'] + [shlex.quote(path) for path in remote_dirs] + \
+              ['&&', 'tar', '-x{}f'.format('z' if compress else ''), '-', '-C', shlex.quote(remote_path)]
+
+        with self.pipe(cmd) as remote:
+            stream = remote.stdin
+            if callback:
+                stream = ProgressWriter(stream, sum(get_size(local) for local, _ in files))
+            with tarfile.open(fileobj=stream, mode='w|gz' if compress else 'w|') as tar:
+                for local, remote in files:
+                    tar.add(local, arcname=remote, filter=set_owner)
+
     def open_sftp(self):
         """
         Open an SFTP session on the SSH server
@@ -225,3 +534,15 @@ class SSHManager:
             A new `.SFTPClient` session object.
         """
         return self._client.open_sftp()
+
+    @property
+    def sftp(self):
+        """
+        Return SFTP session which is opened on first access and closed on exit
+
+        :return:
+            Shared `.SFTPClient` session object.
+        """
+        if not self._sftp:
+            self._sftp = self._client.open_sftp()
+        return self._sftp
@@ -0,0 +1,132 @@
+# Copyright (C) 2018  Braiins Systems s.r.o.
+#
+# This file is part of Braiins Build System (BB).
+#
+# BB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import subprocess
+
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+RepoStatus = namedtuple('RepoStatus', ['name', 'path', 'branch', 'commit', 'upstream', 'ahead', 'behind',
+                                       'staged', 'unstaged', 'untracked', 'error'])
+FileChange = namedtuple('FileChange', ['change_type', 'path', 'orig_path'])
+
+# value of `XY` field for unchanged side of file in porcelain format
+UNCHANGED = '.'
+
+
+def parse_status(name: str, path: str, output: str) -> RepoStatus:
+    """
+    Parse output of `git status --porcelain=v2 --branch -z`
+
+    :param name:
+        Name of repository.
+    :param path:
+        Path to repository working tree.
+    :param output:
+        Output of git command with NUL separated entries.
+    :return:
+        Named tuple with status of repository.
+    """
+    branch = commit = upstream = None
+    ahead = behind = 0
+    staged = []
+    unstaged = []
+    untracked = []
+
+    entries = iter(output.split('\0'))
+    for entry in entries:
+        if not entry:
+            continue
+        kind = entry[0]
+        if kind == '#':
+            header, _, value = entry[2:].partition(' ')
+            if header == 'branch.oid':
+                commit = None if value == '(initial)' else value
+            elif header == 'branch.head':
+                branch = None if value == '(detached)' else value
+            elif header == 'branch.upstream':
+                upstream = value
+            elif header == 'branch.ab':
+                ahead, behind = (abs(int(count)) for count in value.split())
+        elif kind == '?':
+            untracked.append(entry[2:])
+        elif kind in ('1', '2', 'u'):
+            # number of fields before path differs for ordinary, renamed and unmerged entries
+            fields = entry.split(' ', {'1': 8, '2': 9, 'u': 10}[kind])
+            xy, file_path = fields[1], fields[-1]
+            # original path of renamed or copied file is stored in following entry
+            orig_path = next(entries) if kind == '2' else None
+            if kind == 'u':
+                unstaged.append(FileChange('U', file_path, None))
+                continue
+            if xy[0] != UNCHANGED:
+                staged.append(FileChange(xy[0], file_path, orig_path))
+            if xy[1] != UNCHANGED:
+                unstaged.append(FileChange(xy[1], file_path, orig_path))
+
+    return RepoStatus(name, path, branch, commit, upstream, ahead, behind, staged, unstaged, untracked, None)
+
+
+def get_status(name: str, path: str) -> RepoStatus:
+    """
+    Return status of one repository obtained by single git command
+
+    :param name:
+        Name of repository.
+    :param path:
+        Path to repository working tree.
+    :return:
+        Named tuple with status of repository. The `error` attribute is set when status cannot be obtained.
+    """
+    # git would otherwise report status of enclosing repository (build directory is inside of meta repository)
+    if not os.path.exists(os.path.join(path, '.git')):
+        return RepoStatus(name, path, None, None, None, 0, 0, [], [], [], 'missing repository')
+    try:
+        output = subprocess.check_output(['git', 'status', '--porcelain=v2', '--branch', '-z',
+                                          '--untracked-files=all'],
+                                         cwd=path, stderr=subprocess.PIPE, universal_newlines=True)
+    except subprocess.CalledProcessError as e:
+        return RepoStatus(name, path, None, None, None, 0, 0, [], [], [], e.stderr.strip() or 'corrupted repository')
+    return parse_status(name, path, output)
+
+
+def get_statuses(repos):
+    """
+    Return status of all repositories
+
+    The git commands are run concurrently but the result has the same order as input.
+
+    :param repos:
+        List of pairs with name and path of repository.
+    :return:
+        List of named tuples with status of repositories.
+    """
+    repos = list(repos)
+    with ThreadPoolExecutor(max_workers=max(1, len(repos))) as executor:
+        return list(executor.map(lambda repo: get_status(*repo), repos))
+
+
+def get_status_dict(status: RepoStatus):
+    """
+    Return status as a dictionary serializable to JSON
+    """
+    result = OrderedDict(status._asdict())
+    for attribute in ('staged', 'unstaged'):
+        result[attribute] = [OrderedDict(change._asdict()) for change in result[attribute]]
+    result['clean'] = not (status.error or status.staged or status.unstaged or status.untracked)
+    return result
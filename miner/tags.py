@@ -0,0 +1,39 @@
+# Copyright (C) 2018  Braiins Systems s.r.o.
+#
+# This file is part of Braiins Build System (BB).
+#
+# BB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+TAGS_PREFIX = 'refs/tags/'
+
+
+def get_latest_tag(repo, prefix: str):
+    """
+    Return the greatest tag name starting with prefix
+
+    The tags are filtered and sorted by `git for-each-ref` which only looks up matching range of sorted packed-refs
+    and loose refs in the same directory. It is much faster than listing of all tags as GitPython objects when the
+    repository contains thousands of release tags.
+
+    :param repo:
+        GitPython repository object.
+    :param prefix:
+        Prefix of tag name without any glob characters.
+    :return:
+        Name of tag which is the last one in the lexicographic order or None when no tag matches.
+    """
+    ref = repo.git.for_each_ref('{}{}*'.format(TAGS_PREFIX, prefix),
+                                sort='-refname', count=1, format='%(refname)')
+    return ref[len(TAGS_PREFIX):] if ref else None
+
@@ -25,7 +25,7 @@ import hwid
 import sys
 import os
 
-from ssh import SSHManager
+from ssh import SSHManager, get_size
 from progress.bar import Bar
 
 USERNAME = 'root'
@@ -44,7 +44,7 @@ class Progress:
         self._last = 0
 
     def __enter__(self):
-        file_size = os.path.getsize(self.file_path)
+        file_size = get_size(self.file_path)
         self.progress = Bar('{}:'.format(self.file_path), max=file_size)
         return self
 
@@ -56,18 +56,12 @@ class Progress:
         self._last = transferred
 
 
-def upload_files(sftp, local_path, remote_path):
+def upload_files(ssh, local_path, remote_path):
     print("Uploading firmware...")
-    sftp.chdir(remote_path)
+    files = [(os.path.join(local_path, name), name) for name in sorted(os.listdir(local_path))]
 
-    for root, dirs, files in os.walk(local_path):
-        root_remote = os.path.relpath(root, local_path)
-        for name in files:
-            local_file = os.path.join(root, name)
-            with Progress(local_file) as progress:
-                sftp.put(local_file, os.path.join(root_remote, name), callback=progress)
-        for name in dirs:
-            sftp.mkdir(os.path.join(root_remote, name))
+    with Progress(local_path) as progress:
+        ssh.put_files(files, remote_path, callback=progress)
 
 
 def prepare_system(ssh):
@@ -79,12 +73,12 @@ def prepare_system(ssh):
 
     print("Preparing remote system...")
 
+    files = []
     for file_name, remote_path in binaries:
-        ssh.run('mkdir', '-p', remote_path)
         remote_file_name = '{}/{}'.format(remote_path, file_name)
         print('Copy {} to {}'.format(file_name, remote_file_name))
-        ssh.put(os.path.join(SYSTEM_DIR, file_name), remote_file_name)
-        ssh.run('chmod', '+x', remote_file_name)
+        files.append((os.path.join(SYSTEM_DIR, file_name), remote_file_name.lstrip('/')))
+    ssh.put_files(files, '/', mode=0o755)
 
     ssh.run('ln', '-fs', '/usr/sbin/fw_printenv', '/usr/sbin/fw_setenv')
     print()
@@ -140,10 +134,8 @@ def main(args):
         if not args.no_backup:
             backup_firmware(ssh)
 
-        # copy firmware files to the server over SFTP
-        sftp = ssh.open_sftp()
-        upload_files(sftp, SOURCE_DIR, TARGET_DIR)
-        sftp.close()
+        # copy firmware files to the server as one tar stream
+        upload_files(ssh, SOURCE_DIR, TARGET_DIR)
 
         # generate HW identifier for miner
         hw_id = hwid.generate()